@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+# End-to-end benchmark: runs lwserver with the load generator as its endpoint
+# and a number of headless viewers, all locally, and reports the throughput,
+# the CPU time of every component and the latency of the records as JSON.
+# Run as "python3 -m bench.harness [options]" from the root of the repository.
+
+from sys import argv, executable, stdout
+from queue import Queue
+from time import monotonic, sleep
+import json
+import os
+import shlex
+import socket
+import subprocess
+import tempfile
+from bench import loadgen
+from tracing import LatencyHistogram
+from utils import pop_args, fatal_error, info, error, set_log_level
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAIL_SIZE = 4096
+
+
+class Configuration:
+    def __init__(self):
+        self.viewers = 1
+        self.decode_workers = 0
+        self.output_file = None
+        self.timeout = 120.0
+        self.loadgen_args = []
+        self.multiline = 0
+
+
+def read_args(args):
+    arg_queue = Queue()
+    config = Configuration()
+    for arg in args:
+        arg_queue.put(arg)
+
+    while not arg_queue.empty():
+        arg = arg_queue.get()
+        if arg in ['-v', '--viewers']:
+            viewers_s, = pop_args(arg_queue, arg, "count")
+            config.viewers = int(viewers_s)
+        elif arg in ['-j', '--decode-workers']:
+            workers_s, = pop_args(arg_queue, arg, "count")
+            config.decode_workers = int(workers_s)
+        elif arg in ['-o', '--output']:
+            config.output_file, = pop_args(arg_queue, arg, "file-name")
+        elif arg in ['-t', '--timeout']:
+            timeout_s, = pop_args(arg_queue, arg, "seconds")
+            config.timeout = float(timeout_s)
+        elif arg in ['-n', '--lines', '-s', '--size', '-r', '--rate', '-b', '--burst', '-m', '--multiline']:
+            value, = pop_args(arg_queue, arg, "value")
+            config.loadgen_args += [arg, value]
+            if arg in ['-m', '--multiline']:
+                config.multiline = int(value)
+        elif arg == '--ansi':
+            config.loadgen_args.append(arg)
+        else:
+            fatal_error("Invalid option: \"%s\"" % arg)
+    return config
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1.0):
+                return True
+        except OSError:
+            sleep(0.05)
+    return False
+
+
+def write_config(path, port, loadgen_command, multiline):
+    separation = "by-brackets" if multiline > 1 else "by-newline"
+    # The braces of the multi-line records are balanced, so only the
+    # by-brackets separator can keep them together
+    config = {
+        "server": {
+            "socket-port": port,
+            "stay-active": True,
+            "trace-latency": True,
+            "endpoints": [{
+                "type": "subprocess",
+                "command": loadgen_command,
+                "register": "a",
+                "event-separation": {"method": separation}
+            }]
+        },
+        "views": {
+            "main": {
+                "show-endpoints": "all",
+                "line-format": "{seq} {data}"
+            }
+        }
+    }
+    # JSON is a subset of YAML
+    with open(path, 'w') as config_file:
+        json.dump(config, config_file)
+
+
+def run_lwcmd(port, *args):
+    result = subprocess.run([executable, os.path.join(ROOT, "lwcmd.py"), ":%d" % port] + list(args),
+                            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return result.stdout.decode('utf-8')
+
+
+def get_server_statistics(port):
+    try:
+        return json.loads(run_lwcmd(port, "--stats", "--format", "jsonl"))
+    except ValueError:
+        return None
+
+
+def count_clients(statistics):
+    if statistics is None:
+        return 0
+    return sum(len(server['clients']) for server in statistics['servers'])
+
+
+def has_end_marker(path):
+    try:
+        with open(path, 'rb') as output_file:
+            output_file.seek(0, os.SEEK_END)
+            output_file.seek(max(output_file.tell() - TAIL_SIZE, 0))
+            return loadgen.END_MARKER.encode('utf-8') in output_file.read()
+    except OSError:
+        return False
+
+
+def reap(process):
+    # The CPU time of a process is known only once it has ended
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def terminate(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+
+
+def latency_summary(histogram: LatencyHistogram):
+    return {
+        "count": histogram.count,
+        "p50-us": histogram.percentile(0.5) / 1000,
+        "p99-us": histogram.percentile(0.99) / 1000,
+        "max-us": histogram.max_ns / 1000
+    }
+
+
+def run(config: Configuration, work_dir):
+    port = find_free_port()
+    trigger_file = os.path.join(work_dir, "start")
+    loadgen_report = os.path.join(work_dir, "loadgen.json")
+    # lwserver stops once all its actions have ended, so the load generator
+    # stays alive until the server is stopped by the harness
+    loadgen_command = "exec %s -m bench.loadgen %s --wait-for %s --report %s --linger %d" % (
+        shlex.quote(executable), " ".join(shlex.quote(arg) for arg in config.loadgen_args),
+        shlex.quote(trigger_file), shlex.quote(loadgen_report), config.timeout + 10)
+    config_file = os.path.join(work_dir, "config.yaml")
+    write_config(config_file, port, loadgen_command, config.multiline)
+
+    server = subprocess.Popen([executable, os.path.join(ROOT, "lwserver.py"), config_file],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              start_new_session=True)
+    viewers = []
+    try:
+        if not wait_for_port(port, 10.0):
+            fatal_error("lwserver did not start listening on port %d" % port)
+
+        for ix in range(config.viewers):
+            viewer_args = [executable, os.path.join(ROOT, "lwview.py"), "-c", config_file, "main",
+                           "-p", str(port), "--headless", "--plain",
+                           "-o", os.path.join(work_dir, "view-%d.out" % ix),
+                           "--latency-report", os.path.join(work_dir, "view-%d.json" % ix)]
+            if config.decode_workers > 0:
+                viewer_args += ["-j", str(config.decode_workers)]
+            viewers.append(subprocess.Popen(viewer_args, cwd=ROOT, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL, start_new_session=True))
+
+        # One more client is the connection of lwcmd itself
+        deadline = monotonic() + 10.0
+        while count_clients(get_server_statistics(port)) < config.viewers + 1:
+            if monotonic() > deadline:
+                fatal_error("The viewers did not connect to lwserver")
+            sleep(0.1)
+
+        info("Starting the load generator")
+        start = monotonic()
+        open(trigger_file, 'w').close()
+
+        elapsed = {}
+        deadline = start + config.timeout
+        while len(elapsed) < config.viewers and monotonic() < deadline:
+            for ix in range(config.viewers):
+                if ix not in elapsed and has_end_marker(os.path.join(work_dir, "view-%d.out" % ix)):
+                    elapsed[ix] = monotonic() - start
+            sleep(0.01)
+        if len(elapsed) < config.viewers:
+            error("%d viewer(s) did not receive all the records in %.0f s" % (
+                config.viewers - len(elapsed), config.timeout))
+
+        server_statistics = get_server_statistics(port)
+        run_lwcmd(port, "-k")
+        server_cpu = reap(server)
+        viewers_cpu = [reap(viewer) for viewer in viewers]
+    finally:
+        terminate(viewers + [server])
+
+    with open(loadgen_report) as report_file:
+        generated = json.load(report_file)
+
+    latency = {}
+    viewer_results = []
+    for ix in range(config.viewers):
+        with open(os.path.join(work_dir, "view-%d.json" % ix)) as report_file:
+            for interval, data in json.load(report_file).items():
+                latency.setdefault(interval, LatencyHistogram()).merge(LatencyHistogram.from_dict(data))
+        viewer_elapsed = elapsed.get(ix)
+        viewer_results.append({
+            "elapsed-s": viewer_elapsed,
+            "lines-per-s": generated['lines'] / viewer_elapsed if viewer_elapsed else None,
+            "cpu-s": viewers_cpu[ix]
+        })
+
+    # The load generator runs as a child of lwserver, so its CPU time is
+    # included in the figures of the server
+    total_elapsed = max(elapsed.values()) if len(elapsed) > 0 else None
+    return {
+        "config": {
+            "viewers": config.viewers,
+            "decode-workers": config.decode_workers,
+            "loadgen": config.loadgen_args
+        },
+        "lines": generated['lines'],
+        "bytes": generated['bytes'],
+        "elapsed-s": total_elapsed,
+        "lines-per-s": generated['lines'] / total_elapsed if total_elapsed else None,
+        "mb-per-s": generated['bytes'] / total_elapsed / 1e6 if total_elapsed else None,
+        "cpu-s": {
+            "loadgen": generated['cpu'],
+            "lwserver": server_cpu - generated['cpu'],
+            "lwview": sum(viewers_cpu)
+        },
+        "viewers": viewer_results,
+        "latency": {interval: latency_summary(histogram) for interval, histogram in latency.items()},
+        "server": server_statistics
+    }
+
+
+if __name__ == "__main__":
+    # The report goes to stdout unless written to a file
+    config = read_args(argv[1:])
+    set_log_level(1 if config.output_file is None else 3)
+    with tempfile.TemporaryDirectory(prefix="lwbench-") as work_dir:
+        result = run(config, work_dir)
+
+    if config.output_file is not None:
+        with open(config.output_file, 'w') as output_file:
+            json.dump(result, output_file, indent=2)
+    else:
+        json.dump(result, stdout, indent=2)
+        print()
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+# Load generator for the benchmarks; run as an endpoint command with
+# "python3 -m bench.loadgen [options]" from the root of the repository
+
+from sys import argv, stdout
+from queue import Queue
+from time import monotonic, process_time, sleep
+import json
+import os
+from utils import pop_args, fatal_error
+
+END_MARKER = "LOADGEN-END"
+ANSI_COLORS = [31, 32, 33, 34, 35, 36]
+
+
+class Configuration:
+    def __init__(self):
+        self.lines = 100000
+        self.line_size = 100
+        self.rate = 0
+        self.burst = 1000
+        self.ansi = False
+        self.multiline = 0
+        self.wait_for = None
+        self.report_file = None
+        self.linger = 0.0
+
+
+def read_args(args):
+    arg_queue = Queue()
+    config = Configuration()
+    for arg in args:
+        arg_queue.put(arg)
+
+    while not arg_queue.empty():
+        arg = arg_queue.get()
+        if arg in ['-n', '--lines']:
+            lines_s, = pop_args(arg_queue, arg, "count")
+            config.lines = int(lines_s)
+        elif arg in ['-s', '--size']:
+            size_s, = pop_args(arg_queue, arg, "bytes")
+            config.line_size = int(size_s)
+        elif arg in ['-r', '--rate']:
+            rate_s, = pop_args(arg_queue, arg, "lines-per-second")
+            config.rate = float(rate_s)
+        elif arg in ['-b', '--burst']:
+            burst_s, = pop_args(arg_queue, arg, "lines")
+            config.burst = max(int(burst_s), 1)
+        elif arg == '--ansi':
+            config.ansi = True
+        elif arg in ['-m', '--multiline']:
+            multiline_s, = pop_args(arg_queue, arg, "lines-per-record")
+            config.multiline = int(multiline_s)
+        elif arg == '--wait-for':
+            config.wait_for, = pop_args(arg_queue, arg, "file-name")
+        elif arg == '--report':
+            config.report_file, = pop_args(arg_queue, arg, "file-name")
+        elif arg == '--linger':
+            linger_s, = pop_args(arg_queue, arg, "seconds")
+            config.linger = float(linger_s)
+        else:
+            fatal_error("Invalid option: \"%s\"" % arg)
+    return config
+
+
+def make_line(seq, size, ansi=False):
+    # Lines are of the requested length, not counting the escape sequences
+    text = "line %08d " % seq
+    filler = "abcdefghijklmnopqrstuvwxyz0123456789 "
+    while len(text) < size:
+        text += filler[:size - len(text)]
+    text = text[:size]
+    if ansi:
+        color = ANSI_COLORS[seq % len(ANSI_COLORS)]
+        middle = len(text) // 2
+        text = "\x1b[1;%dm%s\x1b[0m%s" % (color, text[:middle], text[middle:])
+    return text
+
+
+def make_record(seq, config: Configuration):
+    # A multi-line record is a block in braces, for the by-brackets
+    # separator; every line of it counts towards the number of lines
+    if config.multiline <= 1:
+        return [make_line(seq, config.line_size, config.ansi)]
+
+    lines = ["{ record %d" % seq]
+    for ix in range(1, config.multiline - 1):
+        lines.append("    " + make_line(seq + ix, config.line_size - 4, config.ansi))
+    lines.append("}")
+    return lines
+
+
+def end_marker(config: Configuration):
+    if config.multiline > 1:
+        return "{ %s }" % END_MARKER
+    return END_MARKER
+
+
+def run(config: Configuration):
+    if config.wait_for is not None:
+        while not os.path.exists(config.wait_for):
+            sleep(0.01)
+
+    output = stdout.buffer
+    start = monotonic()
+    seq = 0
+    lines = 0
+    size = 0
+    while seq < config.lines:
+        burst = []
+        while len(burst) < config.burst and seq < config.lines:
+            record = make_record(seq, config)
+            burst.extend(record)
+            seq += len(record)
+        data = ("\n".join(burst) + "\n").encode('utf-8')
+        output.write(data)
+        output.flush()
+        lines += len(burst)
+        size += len(data)
+
+        if config.rate > 0:
+            delay = start + lines / config.rate - monotonic()
+            if delay > 0:
+                sleep(delay)
+
+    elapsed = monotonic() - start
+    output.write((end_marker(config) + "\n").encode('utf-8'))
+    output.flush()
+
+    if config.report_file is not None:
+        with open(config.report_file, 'w') as report_file:
+            json.dump({"lines": lines, "bytes": size, "elapsed": elapsed, "cpu": process_time()}, report_file)
+    sleep(config.linger)
+
+
+if __name__ == "__main__":
+    run(read_args(argv[1:]))
@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+# Micro-benchmarks of the hot paths, compared against a stored baseline;
+# run as "python3 -m bench.micro [options]" from the root of the repository.
+# The baseline is specific to the machine it was measured on, so it is not
+# part of the repository: the first run writes it, and a baseline of another
+# host or version of Python is not compared with. Refresh it with --save
+# before measuring a change.
+
+from sys import argv, version_info
+from queue import Queue
+from time import perf_counter
+import gc
+import glob
+import json
+import os
+import random
+import socket
+from network.framing import FrameDecoder, encode_frame
+from network.servers import GenericTCPServer
+from server.separators import ByNewlineSeparator, ByBracketsSeparator
+from view.configuration import Configuration as ViewConfiguration, Watch
+from view.console_output import format_record
+from view.formatter import Formatter
+from bench.loadgen import make_line
+from utils import pop_args, fatal_error, set_log_level
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+MIN_REPETITION_TIME = 0.2
+
+
+class Configuration:
+    def __init__(self):
+        self.baseline_file = DEFAULT_BASELINE
+        self.save = False
+        self.tolerance = 0.25
+        self.repeat = 5
+        self.name_filter = None
+        self.output_file = None
+
+
+def read_args(args):
+    arg_queue = Queue()
+    config = Configuration()
+    for arg in args:
+        arg_queue.put(arg)
+
+    while not arg_queue.empty():
+        arg = arg_queue.get()
+        if arg in ['-b', '--baseline']:
+            config.baseline_file, = pop_args(arg_queue, arg, "file-name")
+        elif arg == '--save':
+            config.save = True
+        elif arg in ['-t', '--tolerance']:
+            tolerance_s, = pop_args(arg_queue, arg, "percent")
+            config.tolerance = float(tolerance_s) / 100
+        elif arg in ['-r', '--repeat']:
+            repeat_s, = pop_args(arg_queue, arg, "count")
+            config.repeat = max(int(repeat_s), 1)
+        elif arg in ['-k', '--filter']:
+            config.name_filter, = pop_args(arg_queue, arg, "substring")
+        elif arg in ['-o', '--output']:
+            config.output_file, = pop_args(arg_queue, arg, "file-name")
+        else:
+            fatal_error("Invalid option: \"%s\"" % arg)
+    return config
+
+
+def random_chunks(data, seed=1, max_size=4096):
+    # Splits the data like reads from a pipe would, at arbitrary positions
+    rng = random.Random(seed)
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = rng.randint(1, max_size)
+        chunks.append(data[position:position + size])
+        position += size
+    return chunks
+
+
+def make_records(count):
+    return [{
+        "type": "data",
+        "seq": seq,
+        "endpoint": "a",
+        "fd": "stdout",
+        "date": "2024-01-01",
+        "time": "12:00:00.%03d" % (seq % 1000),
+        "data": make_line(seq, 100)
+    } for seq in range(count)]
+
+
+# Every benchmark prepares its data and returns the function to be measured
+# and the number of operations one call of it performs
+
+def bench_newline_separator():
+    chunks = random_chunks("".join(make_line(seq, 100) + "\n" for seq in range(20000)))
+
+    def run():
+        separator = ByNewlineSeparator({}, lambda fd, data: None)
+        for chunk in chunks:
+            separator.feed("stdout", chunk)
+    return run, 20000
+
+
+def bench_brackets_separator():
+    records = []
+    for seq in range(5000):
+        records.append("{ \"seq\": %d,\n  \"data\": \"%s\",\n  \"nested\": { \"a\": [1, 2] }\n}\n" % (
+            seq, make_line(seq, 60)))
+    chunks = random_chunks("".join(records))
+
+    def run():
+        separator = ByBracketsSeparator({}, lambda fd, data: None)
+        for chunk in chunks:
+            separator.feed("stdout", chunk)
+    return run, 5000
+
+
+def make_format_benchmark(sample):
+    def setup():
+        config = ViewConfiguration()
+        config.read(sample, "main")
+        formatter = Formatter()
+        for endpoint_name, endpoint_style in config.endpoint_styles.items():
+            formatter.add_endpoint_style(endpoint_name, endpoint_style)
+        for watch_name, watch in config.watches.items():
+            formatter.add_watch_style(watch_name, watch.format)
+        records = make_records(2000)
+        for record in records[::2]:
+            record['data'] = "\x1b[1;32m%s\x1b[0m%s" % (record['data'][:50], record['data'][50:])
+
+        def run():
+            rows = []
+            for record in records:
+                format_record(config, formatter, dict(record), rows)
+        return run, len(records)
+    return setup
+
+
+def bench_watch_match():
+    watches = []
+    for ix in range(50):
+        watch = Watch()
+        watch.set_regex("line 0000%02d(\\d+) ([a-z]+)" % ix)
+        watch.compile_regex()
+        watches.append(watch)
+    lines = [make_line(seq, 100) for seq in range(2000)]
+
+    def run():
+        for line in lines:
+            for watch in watches:
+                watch.match(line)
+    return run, len(lines)
+
+
+def bench_frame_encode():
+    records = make_records(10000)
+
+    def run():
+        for record in records:
+            encode_frame(record)
+    return run, len(records)
+
+
+def bench_frame_decode():
+    records = make_records(10000)
+    chunks = random_chunks(b"".join(encode_frame(record) for record in records), max_size=65536)
+
+    def run():
+        decoder = FrameDecoder()
+        for chunk in chunks:
+            for frame in decoder.feed(chunk):
+                json.loads(frame)
+    return run, len(records)
+
+
+def bench_broadcast():
+    server = GenericTCPServer()
+    clients = []
+    sockets = []
+    for ix in range(100):
+        local, remote = socket.socketpair()
+        sockets += [local, remote]
+        clients.append(server._register_client(local, ("127.0.0.1", 10000 + ix)))
+    records = [json.dumps(record) for record in make_records(1000)]
+
+    def run():
+        for record in records:
+            server.broadcast(record)
+        for client in clients:
+            client.outb.clear()
+    # The sockets must outlive the benchmark
+    run.sockets = sockets
+    return run, len(records)
+
+
+def get_benchmarks():
+    benchmarks = [
+        ("separator.by-newline", bench_newline_separator),
+        ("separator.by-brackets", bench_brackets_separator)
+    ]
+    for sample in sorted(glob.glob(os.path.join(ROOT, "samples", "*.yaml"))):
+        name = os.path.splitext(os.path.basename(sample))[0]
+        benchmarks.append(("formatter.%s" % name, make_format_benchmark(sample)))
+    benchmarks += [
+        ("watch.match-50", bench_watch_match),
+        ("framing.encode", bench_frame_encode),
+        ("framing.decode", bench_frame_decode),
+        ("server.broadcast-100", bench_broadcast)
+    ]
+    return benchmarks
+
+
+def calibrate(run):
+    # Every repetition runs long enough not to be dominated by the timer
+    start = perf_counter()
+    run()
+    return max(int(MIN_REPETITION_TIME / (perf_counter() - start)), 1)
+
+
+def measure(benchmarks, repeat):
+    # The repetitions of the benchmarks are interleaved, so that a slow
+    # period of the machine does not affect just one of them; the best time
+    # is the least disturbed by the rest of the system
+    prepared = []
+    for name, setup in benchmarks:
+        run, operations = setup()
+        prepared.append((name, run, operations, calibrate(run)))
+
+    best = {}
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for name, run, operations, calls in prepared:
+                start = perf_counter()
+                for _ in range(calls):
+                    run()
+                duration = (perf_counter() - start) / calls / operations
+                best[name] = min(best.get(name, duration), duration)
+    finally:
+        gc.enable()
+    return {name: {"ns-per-op": duration * 1e9, "ops-per-s": 1 / duration} for name, duration in best.items()}
+
+
+def compare(results, baseline, tolerance):
+    # Returns the ratio of the current time to the baseline one for every
+    # benchmark, and the names of those slower than the tolerance allows
+    ratios = {}
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['ns-per-op'] / baseline[name]['ns-per-op']
+        ratios[name] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return ratios, regressions
+
+
+def get_machine():
+    return {"python": "%d.%d.%d" % version_info[:3], "host": socket.gethostname()}
+
+
+def is_same_machine(baseline_data, machine):
+    return all(baseline_data.get(key) == value for key, value in machine.items())
+
+
+def run(config: Configuration):
+    benchmarks = [(name, setup) for name, setup in get_benchmarks()
+                  if config.name_filter is None or config.name_filter in name]
+    results = measure(benchmarks, config.repeat)
+
+    machine = get_machine()
+    baseline = {}
+    if not os.path.exists(config.baseline_file):
+        print("No baseline in %s yet, saving this run as the baseline" % config.baseline_file)
+        config.save = True
+    else:
+        with open(config.baseline_file) as baseline_file:
+            baseline_data = json.load(baseline_file)
+        if is_same_machine(baseline_data, machine):
+            baseline = baseline_data['benchmarks']
+        else:
+            print("The baseline was measured with Python %s on %s, not comparing; refresh it with --save" % (
+                baseline_data.get('python'), baseline_data.get('host', "another host")))
+    ratios, regressions = compare(results, baseline, config.tolerance)
+
+    print("%-40s %12s %12s %8s" % ("Benchmark", "ns/op", "baseline", "change"))
+    for name, result in results.items():
+        if name in ratios:
+            print("%-40s %12.1f %12.1f %+7.1f%%%s" % (
+                name, result['ns-per-op'], baseline[name]['ns-per-op'], (ratios[name] - 1) * 100,
+                "  REGRESSION" if name in regressions else ""))
+        else:
+            print("%-40s %12.1f %12s" % (name, result['ns-per-op'], "-"))
+
+    if config.output_file is not None:
+        with open(config.output_file, 'w') as output_file:
+            json.dump({"benchmarks": results}, output_file, indent=2)
+
+    if config.save:
+        # Benchmarks not run this time keep their previous baselines
+        baseline.update(results)
+        with open(config.baseline_file, 'w') as baseline_file:
+            json.dump({
+                **machine,
+                "benchmarks": {name: {"ns-per-op": round(result['ns-per-op'], 1)}
+                               for name, result in sorted(baseline.items())}
+            }, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print("Baseline written to %s" % config.baseline_file)
+        return True
+
+    if len(regressions) > 0:
+        print("%d benchmark(s) slower than the baseline by more than %.0f%%" % (
+            len(regressions), config.tolerance * 100))
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    set_log_level(1)
+    config = read_args(argv[1:])
+    exit(0 if run(config) else 1)
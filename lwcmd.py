@@ -1,25 +1,228 @@
 #!/usr/bin/python3
 
-from sys import argv
+from sys import argv, stdin, stdout
+from datetime import datetime
 import json
+import os
+import re
+import selectors
+import shlex
+import signal
 from network.clients import GenericTCPClient
+from network.framing import FrameDecoder, encode_binary_frame
 from queue import Queue
-from utils import pop_args, fatal_error
+from utils import pop_args, fatal_error, error, warning, parse_duration
+
+PIPE_CHUNK_SIZE = 64 * 1024
+TAIL_BUFFER_SIZE = 1024 * 1024
+TIME_FORMATS = ["%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]
+# Number of records requested at once when reading a range
+RANGE_PAGE_SIZE = 10000
+
+# Records serialized by the server start with their type, which lets them
+# be passed through without decoding
+RECORD_PREFIXES = (b'{"type": "data"', b'{"type": "marker"')
+
 
 class Configuration:
     def __init__(self):
         self.host = "127.0.0.1"
         self.port = 2207
         self.commands = []
+        self.batch = False
+        self.pipe_endpoint = None
+        self.pipe_echo = False
+        self.tail = False
+        self.stats = False
+        self.tail_follow = True
+        self.output_format = None
+        self.since = None
+        self.until = None
+        self.range = False
+        self.endpoints = []
+        self.fds = []
+        self.pattern = None
+        self.search = False
+        self.limit = None
+        self.timeout = 5.0
 
 
 class TCPClient(GenericTCPClient):
+    RECV_SIZE = 1024 * 1024
+
     def __init__(self, config: Configuration):
         super().__init__(config.host, config.port)
         self._config = config
+        self._decoder = FrameDecoder()
+        self._next_request_id = 1
+        self._pending_requests = set()
+        self.failed_requests = 0
+        self.pipe_credit = 0
+        # Called with every data or marker frame received after the
+        # history-begin record
+        self.on_record = None
+        self._history_begun = False
+        self.statistics = None
+        self.range_cursor = None
+        self.search_result = None
+
+    def send_request(self, request):
+        request = dict(request, id=self._next_request_id)
+        self._pending_requests.add(self._next_request_id)
+        self._next_request_id += 1
+        self.send(json.dumps(request))
+
+    def send_binary(self, payload):
+        self.send(encode_binary_frame(payload))
+
+    def next_request_id(self):
+        return self._next_request_id
+
+    def pending_requests(self):
+        return len(self._pending_requests)
 
     def on_data_received(self, recv_data):
-        pass
+        for frame in self._decoder.feed(recv_data):
+            if frame.startswith(RECORD_PREFIXES):
+                if self.on_record is not None and self._history_begun:
+                    self.on_record(frame)
+                continue
+
+            try:
+                data = json.loads(frame)
+            except ValueError:
+                continue
+
+            if data.get('type') == 'ack' and data.get('id') in self._pending_requests:
+                self._pending_requests.remove(data['id'])
+                if 'error' in data:
+                    error("Request %d failed: %s" % (data['id'], data['error']))
+                    self.failed_requests += 1
+                self.pipe_credit += data.get('credit', 0)
+            elif data.get('type') == 'pipe-credit':
+                self.pipe_credit += data['bytes']
+            elif data.get('type') == 'history-begin':
+                self._history_begun = True
+            elif data.get('type') in ['range-batch', 'search-hits']:
+                if self.on_record is not None:
+                    for record in data['records']:
+                        self.on_record(bytes(json.dumps(record), 'utf-8'))
+            elif data.get('type') == 'range-end':
+                self.range_cursor = data['cursor']
+            elif data.get('type') == 'search-end':
+                self.search_result = data
+            elif data.get('type') == 'stats':
+                self.statistics = data['stats']
+            elif data.get('type') == 'message':
+                print(data['text'])
+
+
+def parse_since(since, bound="since", now=None):
+    # Returns the request fields for a sequence number, a point in time or
+    # a time relative to now, like -10m
+    if since.isdigit():
+        return {"%s-seq" % bound: int(since)}
+
+    if since.startswith("-"):
+        try:
+            timestamp = (now or datetime.now()).timestamp() - parse_duration(since[1:])
+        except ValueError:
+            fatal_error("Invalid relative time: \"%s\"" % since)
+        return {"%s-time" % bound: datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")}
+
+    for time_format in TIME_FORMATS:
+        try:
+            timestamp = datetime.strptime(since, time_format)
+        except ValueError:
+            continue
+        if time_format == TIME_FORMATS[0]:
+            return {"%s-time" % bound: timestamp.strftime("%H:%M:%S")}
+        return {"%s-time" % bound: timestamp.strftime("%Y-%m-%d %H:%M:%S")}
+
+    fatal_error("Invalid sequence number or time: \"%s\"" % since)
+
+
+def parse_option(arg, arg_queue: Queue, config: Configuration):
+    if arg in ['-m', '--marker']:
+        marker_name, = pop_args(arg_queue, arg, 'marker-name')
+        config.commands.append({
+            "type": "set-marker",
+            "name": marker_name
+        })
+    elif arg in ['-k', '--kill']:
+        config.commands.append({
+            "type": "stop-all"
+        })
+    elif arg in ['-i', '--send']:
+        endpoint_register, data = pop_args(arg_queue, arg, 'endpoint', 'data')
+        config.commands.append({
+            "type": "send-stdin",
+            "endpoint-register": endpoint_register,
+            "data": data
+        })
+    elif arg in ['-b', '--batch']:
+        config.batch = True
+    elif arg in ['--pipe']:
+        config.pipe_endpoint, = pop_args(arg_queue, arg, 'endpoint')
+    elif arg in ['--echo']:
+        config.pipe_echo = True
+    elif arg in ['--tail']:
+        config.tail = True
+    elif arg in ['--profile']:
+        action, = pop_args(arg_queue, arg, 'start/stop/snapshot')
+        if action not in ['start', 'stop', 'snapshot']:
+            fatal_error("Invalid profiling action: \"%s\"" % action)
+        config.commands.append({
+            "type": "profile",
+            "action": action
+        })
+    elif arg in ['-s', '--stats']:
+        config.stats = True
+    elif arg in ['--no-follow']:
+        config.tail = True
+        config.tail_follow = False
+    elif arg in ['--since']:
+        since, = pop_args(arg_queue, arg, 'seq/time')
+        config.since = parse_since(since)
+    elif arg in ['--until']:
+        until, = pop_args(arg_queue, arg, 'seq/time')
+        config.until = parse_since(until, "until")
+        config.range = True
+    elif arg in ['--range']:
+        config.range = True
+    elif arg in ['--grep']:
+        config.pattern, = pop_args(arg_queue, arg, 'regex')
+    elif arg in ['--word']:
+        word, = pop_args(arg_queue, arg, 'word')
+        config.pattern = r"\b%s\b" % re.escape(word)
+    elif arg in ['--search']:
+        config.pattern, = pop_args(arg_queue, arg, 'regex')
+        config.search = True
+    elif arg in ['--limit']:
+        limit_s, = pop_args(arg_queue, arg, 'count')
+        config.limit = int(limit_s)
+    elif arg in ['--fd']:
+        fd, = pop_args(arg_queue, arg, 'fd')
+        config.fds.append(fd)
+    elif arg in ['--endpoint']:
+        endpoint_register, = pop_args(arg_queue, arg, 'endpoint')
+        config.endpoints.append(endpoint_register)
+    elif arg in ['--format']:
+        config.output_format, = pop_args(arg_queue, arg, 'jsonl/text')
+        if config.output_format not in ['jsonl', 'text']:
+            fatal_error("Invalid output format: \"%s\"" % config.output_format)
+    elif arg in ['-t', '--timeout']:
+        timeout_s, = pop_args(arg_queue, arg, 'seconds')
+        config.timeout = float(timeout_s)
+
+    elif arg.find(':') != -1:
+        host, port = arg.split(':')
+        if host != "":
+            config.host = host
+        if port != "":
+            config.port = int(port)
+    else:
+        fatal_error("Invalid option: \"%s\"" % arg)
 
 
 def read_args(args):
@@ -29,44 +232,311 @@ def read_args(args):
         arg_queue.put(arg)
 
     while not arg_queue.empty():
-        arg = arg_queue.get()
-
-        if arg in ['-m', '--marker']:
-            marker_name, = pop_args(arg_queue, arg, 'marker-name')
-            config.commands.append({
-                "type": "set-marker",
-                "name": marker_name
-            })
-        elif arg in ['-k', '--kill']:
-            config.commands.append({
-                "type": "stop-all"
-            })
-        elif arg in ['-i', '--send']:
-            endpoint_register, data = pop_args(arg_queue, arg, 'endpoint', 'data')
-            config.commands.append({
-                "type": "send-stdin",
-                "endpoint-register": endpoint_register,
-                "data": data
-            })
-
-        elif arg.find(':') != -1:
-            host, port = arg.split(':')
-            if host != "":
-                config.host = host
-            if port != "":
-                config.port = int(port)
-        else:
-            fatal_error("Invalid option: \"%s\"" % arg)
+        parse_option(arg_queue.get(), arg_queue, config)
 
     return config
 
 
+def parse_batch_line(line):
+    # Every line of the batch is parsed like the command line of lwcmd
+    line_config = Configuration()
+    arg_queue = Queue()
+    for arg in shlex.split(line, comments=True):
+        arg_queue.put(arg)
+
+    while not arg_queue.empty():
+        parse_option(arg_queue.get(), arg_queue, line_config)
+    return line_config.commands
+
+
+def wait_for_acks(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    while client.pending_requests() > 0:
+        if len(selector.select(config.timeout)) == 0:
+            error("No acknowledgement from the server for %d request(s)" % client.pending_requests())
+            return False
+        if not client.receive():
+            error("Connection to the server lost")
+            return False
+    return True
+
+
+def send_batch_lines(client: TCPClient, lines):
+    for line in lines:
+        for cmd in parse_batch_line(str(line, 'utf-8')):
+            client.send_request(cmd)
+
+
+def run_batch(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    # Commands are sent as soon as they are read; acknowledgements are
+    # collected in the meantime
+    try:
+        selector.register(stdin.fileno(), selectors.EVENT_READ, "stdin")
+    except PermissionError:
+        # Regular files cannot be polled, but they can be read at once
+        send_batch_lines(client, stdin.buffer.read().split(b"\n"))
+        return wait_for_acks(client, config, selector)
+
+    input_buffer = b""
+    while True:
+        for key, mask in selector.select():
+            if key.data == "stdin":
+                data = os.read(stdin.fileno(), 65536)
+                lines = (input_buffer + data).split(b"\n")
+                input_buffer = lines.pop()
+                if len(data) == 0:
+                    lines.append(input_buffer)
+                send_batch_lines(client, lines)
+
+                if len(data) == 0:
+                    selector.unregister(stdin.fileno())
+                    return wait_for_acks(client, config, selector)
+
+            elif not client.receive():
+                error("Connection to the server lost")
+                return False
+
+
+def run_pipe(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    # Stdin is sent in binary frames; the server returns the credit for
+    # the bytes once they are written to the endpoint
+    client.send_request({
+        "type": "pipe-open",
+        "endpoint-register": config.pipe_endpoint,
+        "echo": config.pipe_echo
+    })
+    if not wait_for_acks(client, config, selector) or client.failed_requests > 0:
+        return False
+
+    while True:
+        while client.pipe_credit <= 0:
+            if len(selector.select(config.timeout)) == 0:
+                error("The endpoint &%s does not accept the data" % config.pipe_endpoint)
+                return False
+            if not client.receive():
+                error("Connection to the server lost")
+                return False
+
+        data = os.read(stdin.fileno(), min(PIPE_CHUNK_SIZE, client.pipe_credit))
+        if len(data) == 0:
+            break
+        client.pipe_credit -= len(data)
+        client.send_binary(data)
+
+    client.send_request({"type": "pipe-close"})
+    return wait_for_acks(client, config, selector)
+
+
+def format_text_record(frame):
+    record = json.loads(frame)
+    if record['type'] == 'marker':
+        text = "%s %s ---- %s ----\n" % (record['date'], record['time'], record['name'])
+    else:
+        text = "%s %s &%s %s: %s\n" % (record['date'], record['time'], record['endpoint'], record['fd'], record['data'])
+    return text.encode('utf-8')
+
+
+def run_tail(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    # Records are written in large blocks; the output is flushed whenever
+    # the server has nothing more to send at the moment
+    output = open(stdout.fileno(), 'wb', buffering=TAIL_BUFFER_SIZE, closefd=False)
+    if config.output_format == "text":
+        client.on_record = lambda frame: output.write(format_text_record(frame))
+    else:
+        client.on_record = lambda frame: output.write(frame + b"\n")
+
+    request = {"type": "subscribe"}
+    if config.since is not None:
+        request.update(config.since)
+    if len(config.endpoints) > 0:
+        request['endpoints'] = config.endpoints
+    if len(config.fds) > 0:
+        request['fds'] = config.fds
+    if config.pattern is not None:
+        request['pattern'] = config.pattern
+    client.send_request(request)
+
+    try:
+        while config.tail_follow or client.pending_requests() > 0:
+            if len(selector.select(0.1)) == 0:
+                output.flush()
+                continue
+            if not client.receive():
+                break
+    finally:
+        output.flush()
+    return True
+
+
+def run_range(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    # Reads the records of the range page by page, each continuing from the
+    # cursor where the previous one stopped
+    output = open(stdout.fileno(), 'wb', buffering=TAIL_BUFFER_SIZE, closefd=False)
+    if config.output_format == "text":
+        client.on_record = lambda frame: output.write(format_text_record(frame))
+    else:
+        client.on_record = lambda frame: output.write(frame + b"\n")
+
+    request = {"type": "get-range", "limit": RANGE_PAGE_SIZE}
+    for bounds in [config.since, config.until]:
+        if bounds is not None:
+            request.update(bounds)
+    if len(config.endpoints) > 0:
+        request['endpoints'] = config.endpoints
+    if len(config.fds) > 0:
+        request['fds'] = config.fds
+    if config.pattern is not None:
+        request['pattern'] = config.pattern
+
+    try:
+        while True:
+            client.range_cursor = None
+            client.send_request(request)
+            while client.pending_requests() > 0:
+                if len(selector.select(config.timeout)) == 0:
+                    error("Timeout while waiting for the records")
+                    return False
+                if not client.receive():
+                    return False
+            if client.failed_requests > 0 or client.range_cursor is None:
+                break
+            request['cursor'] = client.range_cursor
+    finally:
+        output.flush()
+    return True
+
+
+def run_search(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    # The hits come as they are found; the search is cancelled on Ctrl-C
+    output = open(stdout.fileno(), 'wb', buffering=TAIL_BUFFER_SIZE, closefd=False)
+    if config.output_format == "text":
+        client.on_record = lambda frame: output.write(format_text_record(frame))
+    else:
+        client.on_record = lambda frame: output.write(frame + b"\n")
+
+    request = {"type": "search", "pattern": config.pattern}
+    for bounds in [config.since, config.until]:
+        if bounds is not None:
+            request.update(bounds)
+    if len(config.endpoints) > 0:
+        request['endpoints'] = config.endpoints
+    if len(config.fds) > 0:
+        request['fds'] = config.fds
+    if config.limit is not None:
+        request['limit'] = config.limit
+    search_id = client.next_request_id()
+    client.send_request(request)
+
+    # Ctrl-C only marks the search to be cancelled, so that no frame is
+    # left half-processed
+    interrupted = []
+    previous_handler = signal.signal(signal.SIGINT, lambda sig, frame: interrupted.append(sig))
+    try:
+        while client.pending_requests() > 0:
+            if len(interrupted) == 1:
+                client.send_request({"type": "search-cancel", "search-id": search_id})
+                interrupted.append(None)
+            if len(selector.select(0.1)) == 0:
+                output.flush()
+                continue
+            if not client.receive():
+                return False
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        output.flush()
+
+    result = client.search_result
+    if result is not None and not result['complete']:
+        warning("Search stopped after %d hits%s" % (result['count'], " (cancelled)" if result['cancelled'] else ""))
+    return True
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f GB" % size
+
+
+def format_counter(counter, unit):
+    rates = " ".join("%.1f/s (%s)" % (rate['count'], window) for window, rate in counter['rates'].items())
+    byte_rates = " ".join("%s/s (%s)" % (format_size(rate['bytes']), window) for window, rate in counter['rates'].items())
+    return "%d %s, %s; %s total, %s" % (counter['count'], unit, rates, format_size(counter['bytes']), byte_rates)
+
+
+def print_statistics(stats):
+    print("Records:           %s" % format_counter(stats['records'], "records"))
+    latency = stats['broadcast-latency']
+    print("Broadcast latency: avg %.1f us, max %.1f us" % (latency['avg-us'], latency['max-us']))
+    late_join = stats['late-join-buffer']
+    print("Late-join buffer:  %d/%d records" % (late_join['records'], late_join['capacity']))
+    store = stats.get('record-store')
+    if store is not None:
+        print("Record store:      %d segments (%d compressed), %s (%s raw), next seq %d, in %s" % (
+            store['segments'], store['compressed-segments'], format_size(store['bytes']),
+            format_size(store['raw-bytes']), store['next-seq'], store['directory']))
+    for server in stats['servers']:
+        print("Received:          %s" % format_counter(server['received'], "chunks"))
+        print("Sent:              %s" % format_counter(server['sent'], "chunks"))
+        for addr, client in server['clients'].items():
+            print("Client %s: %s queued" % (addr, format_size(client['queued-bytes'])))
+
+    for action_name, action in stats['actions'].items():
+        print("Action %s (%s):" % (action_name, action['state']))
+        for fd in ['stdout', 'stderr', 'stdin', 'replayed']:
+            if fd in action:
+                print("  %-17s %s" % (fd + ":", format_counter(action[fd], "lines")))
+        if 'stdin-queue' in action:
+            print("  %-17s %d" % ("stdin queue:", action['stdin-queue']))
+        print("  %-17s %s" % ("separator buffer:", format_size(action['separator-buffered-bytes'])))
+
+
+def run_stats(client: TCPClient, config: Configuration, selector: selectors.BaseSelector):
+    client.send_request({"type": "get-stats"})
+    if not wait_for_acks(client, config, selector) or client.statistics is None:
+        return False
+
+    if config.output_format == "jsonl":
+        print(json.dumps(client.statistics))
+    else:
+        print_statistics(client.statistics)
+    return True
+
+
 if __name__ == "__main__":
     config = read_args(argv[1:])
     client = TCPClient(config)
-    client.run()
-    for cmd in config.commands:
-        data = json.dumps(cmd)
-        print("Sending: %s" % data)
-        client.send(data)
-    client.stop()
+    client.connect()
+
+    selector = selectors.DefaultSelector()
+    selector.register(client.fileno(), selectors.EVENT_READ, "server")
+    try:
+        if config.stats:
+            success = run_stats(client, config, selector)
+        elif config.search:
+            success = run_search(client, config, selector)
+        elif config.range:
+            success = run_range(client, config, selector)
+        elif config.tail:
+            success = run_tail(client, config, selector)
+        elif config.pipe_endpoint is not None:
+            success = run_pipe(client, config, selector)
+        elif config.batch:
+            success = run_batch(client, config, selector)
+        else:
+            for cmd in config.commands:
+                print("Sending: %s" % json.dumps(cmd))
+                client.send_request(cmd)
+            success = wait_for_acks(client, config, selector)
+    except KeyboardInterrupt:
+        success = True
+    except BrokenPipeError:
+        # The reader of the output has gone; nothing more can be written
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+        success = True
+    finally:
+        selector.close()
+        client.stop()
+
+    if not success or client.failed_requests > 0:
+        exit(1)
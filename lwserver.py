@@ -1,16 +1,27 @@
 #!/usr/bin/python3
 from sys import argv
 from queue import Queue
+from concurrent.futures.process import BrokenProcessPool
 import json
+import re
 import signal
+import tempfile
+import threading as thrd
 from time import sleep
 from network.servers import GenericTCPServer
+from network.framing import FrameDecoder, BinaryFrame
 from utils import pop_args, error, info, debug, set_log_level, inc_log_level, VERSION
 from utils import parse_yes_no_option, warning, lw_assert
-from server.configuration import Configuration, ActionConfiguration, SubprocessConfig, SSHSessionConfig
+from server.configuration import Configuration, ActionConfiguration, SubprocessConfig, SSHSessionConfig, ReplayConfig
+from server.configuration import RecordStoreConfig
 from server.subprocess import SubprocessCommunication
 from server.ssh_session import SSHSessionCommunication
+from server.session import SessionRecorder, ReplayCommunication
 from server.service_manager import ServiceManager
+from server.record_filter import RecordFilter, PendingFilter
+from server.record_store import RecordStore
+from server.history_search import HistorySearch
+from profiling import Profiler
 from server.separators import create_separator
 from server.separators.by_newline import ByNewlineSeparator
 
@@ -33,6 +44,13 @@ def read_args(args):
         elif arg in ['-a', '--stay-active']:
             stay_active_s, = pop_args(arg_queue, arg, "yes/no")
             config.stay_active = parse_yes_no_option(arg, stay_active_s)
+        elif arg in ['-T', '--trace-latency']:
+            config.trace_latency = True
+        elif arg in ['-R', '--record']:
+            config.record_file, = pop_args(arg_queue, arg, "session-file")
+        elif arg in ['-S', '--store']:
+            directory, = pop_args(arg_queue, arg, "directory")
+            config.record_store = RecordStoreConfig(directory)
         elif arg == "--verbose":
             inc_log_level(1)
         elif arg.startswith('-v'):
@@ -47,6 +65,12 @@ def read_args(args):
             print("   Override the port number at which the server will listen")
             print("\n * -a | --stay-active <yes|no>")
             print("   Override the stay-active option from the configuration")
+            print("\n * -T | --trace-latency")
+            print("   Attach timestamps of the processing stages to the records")
+            print("\n * -R | --record <session-file>")
+            print("   Record all the broadcast records to a session file, for the replay action")
+            print("\n * -S | --store <directory>")
+            print("   Keep all the broadcast records on the disk, for the subscriptions with --since")
             print("\n * -v[v...] | --verbose")
             print("   Increase the level of verbosity of console logs")
 
@@ -59,41 +83,433 @@ def read_args(args):
     return config
 
 
+class Pipe:
+    def __init__(self, endpoint, echo):
+        self.endpoint = endpoint
+        self.echo = echo
+
+
 class TCPServer(GenericTCPServer):
+    # Number of bytes a client may send into a pipe before the server
+    # confirms that they were written to the endpoint
+    PIPE_WINDOW = 1024 * 1024
+
+    # History read from the record store is sent while less than this is
+    # waiting to be sent to the client
+    HISTORY_WINDOW = 4 * 1024 * 1024
+    HISTORY_CHECK_INTERVAL = 256
+    # The history stored while a subscription catches up is read again
+    # without the lock of the records until less than this remains
+    HISTORY_CATCH_UP_SIZE = 64 * 1024
+    HISTORY_CATCH_UP_PASSES = 10
+    # Records of a range are sent in batches of this size; a range stops
+    # with a cursor to continue from after the given or the default limit
+    RANGE_BATCH_SIZE = 500
+    RANGE_LIMIT = 100000
+    SEARCH_LIMIT = 10000
+
     def __init__(self, addr, port, server_manager: ServiceManager, endpoints: dict):
         super().__init__(address=addr, port=port)
         self._server_manager = server_manager
-        self._recv_buffer = bytearray()
+        self._decoders = {}
+        self._pipes = {}
+        self._subscriptions = {}
         self._endpoints = endpoints
+        self._statistics_cb = None
+        self._profiler = None
+        self._history_search = None
+        # Cancellation events of the searches in progress, by the client
+        # and the request identifier
+        self._searches = {}
+        self._searches_lock = thrd.Lock()
 
     def set_stop_all_handler(self, callback: callable):
         self._stop_all_cb = callback
 
+    def set_statistics_provider(self, callback: callable):
+        self._statistics_cb = callback
+
+    def set_profiler(self, profiler: Profiler):
+        self._profiler = profiler
+
+    def set_history_search(self, history_search: HistorySearch):
+        self._history_search = history_search
+
+    def on_client_connected(self, addr, conn):
+        self._decoders[addr] = FrameDecoder()
+
+    def on_client_disconnected(self, addr):
+        self._decoders.pop(addr, None)
+        self._pipes.pop(addr, None)
+        # The history of a subscription sets its filter with the lock held
+        with self._server_manager.records_lock():
+            self._subscriptions.pop(addr, None)
+        with self._searches_lock:
+            for (client_addr, _), cancelled in self._searches.items():
+                if client_addr == addr:
+                    cancelled.set()
+
+    def broadcast_record(self, record, trace_ns=None):
+        # Subscribed clients receive only the records matching their filters
+        if len(self._subscriptions) == 0:
+            return super().broadcast_record(record, trace_ns)
+        self.broadcast(json.dumps(record), lambda addr:
+                       addr not in self._subscriptions or self._subscriptions[addr].matches(record), trace_ns)
+
+    def _send_ack(self, addr, request_id, result=None):
+        ack = {"type": "ack", "id": request_id}
+        if result is not None:
+            ack['error'] = result
+        self.send_if_connected(addr, json.dumps(ack))
+
+    def _handle_pipe_data(self, addr, chunk):
+        pipe = self._pipes.get(addr)
+        if pipe is None:
+            error("Binary data from %s:%s without an open pipe, dropping" % addr)
+            return
+
+        credit = json.dumps({"type": "pipe-credit", "bytes": len(chunk)})
+        pipe.endpoint.send_raw(bytes(chunk), pipe.echo,
+                               on_written=lambda: self.send_if_connected(addr, credit))
+
+    def _send_stored_records(self, addr, record_filter: RecordFilter, lines, throttle=True):
+        # Returns False if the client has disconnected
+        for count, line in enumerate(lines):
+            if throttle and count % self.HISTORY_CHECK_INTERVAL == 0:
+                queued = self.get_queued_size(addr)
+                while queued is not None and queued > self.HISTORY_WINDOW:
+                    sleep(0.01)
+                    queued = self.get_queued_size(addr)
+                if queued is None:
+                    return False
+            if record_filter.matches(json.loads(line)):
+                self.send_if_connected(addr, str(line, 'utf-8'))
+        return True
+
+    def _stream_history(self, addr, record_filter: RecordFilter, request_id):
+        store = self._server_manager.get_record_store()
+        with self._server_manager.records_lock():
+            self._subscriptions[addr] = PendingFilter()
+            self.send_if_connected(addr, json.dumps({"type": "history-begin"}))
+            end = store.end_position()
+
+        start = store.find(record_filter.since_seq, record_filter.since_timestamp())
+        if not self._send_stored_records(addr, record_filter, store.read(start, end, record_filter.tokens)):
+            return
+
+        # The records stored in the meantime are caught up with until they
+        # are few, then the rest is sent with the lock held, so that none
+        # is missed before the live ones are let through
+        for _ in range(self.HISTORY_CATCH_UP_PASSES):
+            next_end = store.end_position()
+            if next_end[0] == end[0] and next_end[1] - end[1] <= self.HISTORY_CATCH_UP_SIZE:
+                break
+            if not self._send_stored_records(addr, record_filter, store.read(end, next_end, record_filter.tokens)):
+                return
+            end = next_end
+
+        with self._server_manager.records_lock():
+            if addr not in self._subscriptions:
+                return
+            self._send_stored_records(addr, record_filter, store.read(end, tokens=record_filter.tokens), throttle=False)
+            self._subscriptions[addr] = record_filter
+        if request_id is not None:
+            self._send_ack(addr, request_id)
+
+    def _wait_for_queue(self, addr):
+        # Returns False if the client has disconnected
+        queued = self.get_queued_size(addr)
+        while queued is not None and queued > self.HISTORY_WINDOW:
+            sleep(0.01)
+            queued = self.get_queued_size(addr)
+        return queued is not None
+
+    def _parse_cursor(self, cursor):
+        # Returns the two numbers of a cursor of the record store, or of
+        # the late-join buffer without one; raises ValueError if invalid
+        kind, first, second = cursor.split(":")
+        expected = "store" if self._server_manager.get_record_store() is not None else "seq"
+        if kind != expected:
+            raise ValueError(kind)
+        return int(first), int(second)
+
+    def _range_source(self, record_filter: RecordFilter, cursor):
+        # Yields the encoded records from the first one that may be in the
+        # range, each with the cursor to continue from it, if possible; the
+        # cursor given is parsed already
+        store = self._server_manager.get_record_store()
+        if store is not None:
+            if cursor is not None:
+                position = cursor
+            else:
+                position = store.find(record_filter.since_seq, record_filter.since_timestamp())
+            for line, next_position in store.scan(position, tokens=record_filter.tokens):
+                yield str(line, 'utf-8'), "store:%d:%d" % position
+                position = next_position
+            return
+
+        # A cursor in the late-join buffer is the seq of the next data
+        # record, and the number of markers before it to skip
+        skip = 0
+        if cursor is not None:
+            seq, skip = cursor
+            records, start = self._server_manager.find_late_join_records(seq)
+        else:
+            records, start = self._server_manager.find_late_join_records(record_filter.since_seq,
+                                                                         record_filter.since_time)
+        next_data = None
+        first = None
+        cursors = [None] * len(records)
+        for ix in range(len(records) - 1, start - 1, -1):
+            if records[ix].get('type') == 'data':
+                next_data = ix
+            if next_data is not None:
+                # The markers before a data record all start from the one
+                # after the previous data record
+                if first is None or first > ix:
+                    first = ix
+                    while first > 0 and records[first - 1].get('type') != 'data':
+                        first -= 1
+                cursors[ix] = "seq:%d:%d" % (records[next_data]['seq'], ix - first)
+        for ix in range(start + skip, len(records)):
+            record = records[ix]
+            if 'trace' in record:
+                record = {key: value for key, value in record.items() if key != 'trace'}
+            yield json.dumps(record), cursors[ix]
+
+    def _send_range(self, addr, record_filter: RecordFilter, limit, cursor, request_id):
+        try:
+            position = self._parse_cursor(cursor) if cursor is not None else None
+        except ValueError:
+            self._send_ack(addr, request_id, "Invalid cursor: %s" % cursor)
+            return
+
+        count = 0
+        batch = []
+        next_cursor = None
+        failure = None
+        try:
+            for line, line_cursor in self._range_source(record_filter, position):
+                record = json.loads(line)
+                if record_filter.is_past(record):
+                    break
+                if not record_filter.matches(record):
+                    continue
+                if count >= limit and line_cursor is not None:
+                    next_cursor = line_cursor
+                    break
+                batch.append(line)
+                count += 1
+                if len(batch) >= self.RANGE_BATCH_SIZE:
+                    if not self._wait_for_queue(addr):
+                        return
+                    self.send_if_connected(addr, '{"type": "range-batch", "id": %s, "records": [%s]}' % (
+                        json.dumps(request_id), ", ".join(batch)))
+                    batch = []
+        except Exception as ex:
+            failure = "Reading the range failed: %s" % ex
+            error("Range %s of %s:%s: %s" % (request_id, addr[0], addr[1], failure))
+
+        if len(batch) > 0:
+            self.send_if_connected(addr, '{"type": "range-batch", "id": %s, "records": [%s]}' % (
+                json.dumps(request_id), ", ".join(batch)))
+        self.send_if_connected(addr, json.dumps({"type": "range-end", "id": request_id,
+                                                 "count": count, "cursor": next_cursor}))
+        if request_id is not None:
+            self._send_ack(addr, request_id, failure)
+
+    def _send_search(self, addr, record_filter: RecordFilter, limit, request_id, cancelled):
+        sent = 0
+
+        def send_hits(hits):
+            nonlocal sent
+            for first in range(0, len(hits), self.RANGE_BATCH_SIZE):
+                if not self._wait_for_queue(addr):
+                    cancelled.set()
+                    return
+                batch = hits[first:first + self.RANGE_BATCH_SIZE]
+                self.send_if_connected(addr, '{"type": "search-hits", "id": %s, "records": [%s]}' % (
+                    json.dumps(request_id), ", ".join(batch)))
+                sent += len(batch)
+
+        failure = None
+        try:
+            if self._history_search is not None:
+                count, complete = self._history_search.search(record_filter, limit, cancelled, send_hits)
+            else:
+                records, start = self._server_manager.find_late_join_records(record_filter.since_seq,
+                                                                             record_filter.since_time)
+                hits = []
+                complete = True
+                for record in records[start:]:
+                    if record_filter.is_past(record):
+                        break
+                    if record_filter.matches(record):
+                        if len(hits) >= limit:
+                            complete = False
+                            break
+                        hits.append(json.dumps({key: value for key, value in record.items() if key != 'trace'}))
+                send_hits(hits)
+                count = len(hits)
+        except BrokenProcessPool:
+            failure = "The search workers have failed"
+        except Exception as ex:
+            failure = "Search failed: %s" % ex
+        finally:
+            with self._searches_lock:
+                self._searches.pop((addr, request_id), None)
+
+        # The client is told of the failure, and how far the search got
+        if failure is not None:
+            error("Search %s of %s:%s: %s" % (request_id, addr[0], addr[1], failure))
+            if request_id is not None:
+                self._send_ack(addr, request_id, failure)
+            self.send_if_connected(addr, json.dumps({"type": "search-end", "id": request_id, "count": sent,
+                                                     "complete": False, "cancelled": cancelled.is_set()}))
+            return
+
+        if cancelled.is_set():
+            info("Search %s of %s:%s cancelled after %d hits" % (request_id, addr[0], addr[1], count))
+        self.send_if_connected(addr, json.dumps({"type": "search-end", "id": request_id, "count": count,
+                                                 "complete": complete, "cancelled": cancelled.is_set()}))
+        if request_id is not None:
+            self._send_ack(addr, request_id)
+
+    def _handle_request(self, addr, data):
+        # Returns an error message, or None if the request was handled
+        request_type = data.get('type')
+        if request_type == 'pipe-open':
+            endpoint = self._endpoints.get(data.get('endpoint-register'))
+            if endpoint is None:
+                return "No endpoint &%s" % data.get('endpoint-register')
+            if not hasattr(endpoint, 'send_raw'):
+                return "Endpoint &%s does not accept piped data" % data['endpoint-register']
+            if addr in self._pipes:
+                return "A pipe is already open on this connection"
+            self._pipes[addr] = Pipe(endpoint, data.get('echo', False))
+            return None
+        elif request_type == 'pipe-close':
+            pipe = self._pipes.pop(addr, None)
+            if pipe is None:
+                return "No pipe is open on this connection"
+            # Acknowledged once all the data sent before is written
+            if 'id' in data:
+                pipe.endpoint.send_raw(None, on_written=lambda: self._send_ack(addr, data['id']))
+            return None
+
+        if request_type == 'set-marker':
+            self._server_manager.broadcast_marker(data.get("name", ""))
+        elif request_type == 'get-late-join-records':
+            self._server_manager.send_late_join_records(self, addr)
+        elif request_type == 'subscribe':
+            try:
+                record_filter = RecordFilter.from_request(data)
+            except re.error as ex:
+                return "Invalid pattern: %s" % ex
+            # A time of day means its latest occurrence, not that time of
+            # every day
+            record_filter.resolve_dates()
+            store = self._server_manager.get_record_store()
+            if store is not None and (record_filter.since_seq is not None or record_filter.since_time is not None):
+                # The history on the disk may be long, so it is sent from a
+                # thread of its own, and acknowledged once sent
+                thrd.Thread(target=self._stream_history, args=(addr, record_filter, data.get('id')),
+                            daemon=True).start()
+                return None
+
+            # No record may be broadcast in the meantime, so that the client
+            # gets each of them exactly once: the ones received before the
+            # history-begin record are repeated in the history
+            with self._server_manager.records_lock():
+                self.send(addr, json.dumps({"type": "history-begin"}))
+                self._server_manager.send_late_join_records(self, addr, record_filter)
+                self._subscriptions[addr] = record_filter
+            if 'id' in data:
+                self._send_ack(addr, data['id'])
+        elif request_type == 'get-range':
+            try:
+                record_filter = RecordFilter.from_request(data)
+            except re.error as ex:
+                return "Invalid pattern: %s" % ex
+            record_filter.resolve_dates()
+            thrd.Thread(target=self._send_range, daemon=True,
+                        args=(addr, record_filter, data.get('limit', self.RANGE_LIMIT),
+                              data.get('cursor'), data.get('id'))).start()
+        elif request_type == 'search':
+            if data.get('pattern') is None:
+                return "No pattern to search for"
+            try:
+                record_filter = RecordFilter.from_request(data)
+            except re.error as ex:
+                return "Invalid pattern: %s" % ex
+            record_filter.resolve_dates()
+            cancelled = thrd.Event()
+            with self._searches_lock:
+                self._searches[(addr, data.get('id'))] = cancelled
+            thrd.Thread(target=self._send_search, daemon=True,
+                        args=(addr, record_filter, data.get('limit', self.SEARCH_LIMIT), data.get('id'),
+                              cancelled)).start()
+        elif request_type == 'search-cancel':
+            # The search may have just ended, with the hits still on their
+            # way to the client
+            with self._searches_lock:
+                cancelled = self._searches.get((addr, data.get('search-id')))
+            if cancelled is not None:
+                cancelled.set()
+        elif request_type == 'send-stdin':
+            endpoint = self._endpoints.get(data['endpoint-register'])
+            if endpoint is None:
+                return "No endpoint &%s" % data['endpoint-register']
+            endpoint.send(data['data'] + "\n")
+        elif request_type == 'get-stats':
+            if self._statistics_cb is None:
+                return "The server is still starting"
+            self.send(addr, json.dumps({"type": "stats", "stats": self._statistics_cb()}))
+        elif request_type == 'profile':
+            action = data.get('action')
+            if self._profiler is None:
+                return "The server is still starting"
+            if action == 'start':
+                report = self._profiler.start()
+            elif action == 'stop':
+                report = self._profiler.stop()
+            elif action == 'snapshot':
+                report = self._profiler.snapshot()
+            else:
+                return "Unknown profiling action: %s" % action
+            info(report)
+            self.send(addr, json.dumps({"type": "message", "fd": "info", "text": report}))
+        elif request_type == 'stop-all':
+            self._stop_all_cb()
+        else:
+            return "Unknown request type: %s" % request_type
+        return None
+
     def on_data_received(self, addr, recv_data):
-        for byte in recv_data:
-            if byte == 0:
-                data_recv_str = str(self._recv_buffer, 'utf-8')
-
-                if len(data_recv_str) > 0:
-                    try:
-                        data = json.loads(data_recv_str)
-                        if data['type'] == 'set-marker':
-                            self._server_manager.broadcast_marker(data.get("name", ""))
-                        elif data['type'] == 'get-late-join-records':
-                            self._server_manager.send_late_join_records(self, addr)
-                        elif data['type'] == 'send-stdin':
-                            endpoint = self._endpoints.get(data['endpoint-register'])
-                            if endpoint is not None:
-                                endpoint.send(data['data'] + "\n")
-                        elif data['type'] == 'stop-all':
-                            self._stop_all_cb()
-
-                    except json.decoder.JSONDecodeError as err:
-                        error("Failed to parse JSON: %s: %s" % (err, data_recv_str))
-
-                self._recv_buffer.clear()
+        for frame in self._decoders[addr].feed(recv_data):
+            if isinstance(frame, BinaryFrame):
+                self._handle_pipe_data(addr, frame)
+                continue
+
+            try:
+                data = json.loads(frame)
+            except ValueError as err:
+                error("Failed to parse JSON: %s: %s" % (err, frame))
+                continue
+
+            result = self._handle_request(addr, data)
+            if result is not None:
+                error(result)
+
+            # Requests with an identifier are acknowledged to the sender only
+            if 'id' not in data:
+                continue
+            if data.get('type') in ['pipe-close', 'subscribe', 'get-range', 'search'] and result is None:
+                continue
+            if data.get('type') == 'pipe-open' and result is None:
+                self.send(addr, json.dumps({"type": "ack", "id": data['id'], "credit": self.PIPE_WINDOW}))
             else:
-                self._recv_buffer.append(byte)
+                self._send_ack(addr, data['id'], result)
 
 
 class ActionManager:
@@ -103,7 +519,8 @@ class ActionManager:
     STATE_FINISHED_WITH_ERROR = 3
     STATE_TERMINATING = 4
 
-    def __init__(self, separators: dict, default_separator_cb: callable, resolve_register_cb: callable):
+    def __init__(self, separators: dict, default_separator_cb: callable, resolve_register_cb: callable,
+                 replay_record_cb: callable = None, replay_marker_cb: callable = None):
         self._actions = {}
         self._action_states = {}
         self._action_states_to_publish = {}
@@ -111,6 +528,8 @@ class ActionManager:
         self._separators = separators
         self._default_separator_cb = default_separator_cb
         self._resolve_register_cb = resolve_register_cb
+        self._replay_record_cb = replay_record_cb
+        self._replay_marker_cb = replay_marker_cb
 
         self.STATE_NAMES = {
             self.STATE_AWAITING: "awaiting",
@@ -128,6 +547,9 @@ class ActionManager:
             action = SubprocessCommunication(config.command, name, lambda a, f, d: self._on_data(a, f, d))
         elif isinstance(config, SSHSessionConfig):
             action = SSHSessionCommunication(config, name, lambda a, f, d: self._on_data(a, f, d))
+        elif isinstance(config, ReplayConfig):
+            # Replayed records are already separated and keep their endpoints
+            action = ReplayCommunication(config, name, self._replay_record_cb, self._replay_marker_cb)
         else:
             raise RuntimeError("Cannot register an action described as %s" % str(config))
 
@@ -188,6 +610,15 @@ class ActionManager:
     def get_action_states(self):
         return self._action_states_to_publish
 
+    def get_statistics(self):
+        result = {}
+        for action_name, action in self._actions.items():
+            stats = action.get_statistics() if hasattr(action, 'get_statistics') else {}
+            stats['state'] = self.STATE_NAMES.get(self._action_states[action_name])
+            stats['separator-buffered-bytes'] = self._separators[action_name].buffered_size()
+            result[action_name] = stats
+        return result
+
     def stop(self):
         for action_name, action_state in self._action_states.items():
             if action_state == self.STATE_AWAITING:
@@ -209,6 +640,16 @@ if __name__ == "__main__":
     config = read_args(argv[1:])
     server_manager = ServiceManager()
     server_manager.set_late_join_buf_size(config.late_join_buf_size)
+    if config.record_file is not None:
+        server_manager.set_session_recorder(SessionRecorder(config.record_file))
+    if config.record_store is not None:
+        server_manager.set_record_store(RecordStore(config.record_store.directory,
+                                                    segment_size=config.record_store.segment_size,
+                                                    max_size=config.record_store.max_size,
+                                                    max_age=config.record_store.max_age,
+                                                    fsync_interval=config.record_store.fsync_interval,
+                                                    compression=config.record_store.compression,
+                                                    block_size=config.record_store.block_size))
 
     endpoint_registers = {}
     actions_to_endpoints = {}
@@ -227,6 +668,13 @@ if __name__ == "__main__":
                                endpoints=endpoint_registers)
         server_manager.register(tcp_server)
 
+    history_search = None
+    if tcp_server is not None and server_manager.get_record_store() is not None:
+        history_search = HistorySearch(server_manager.get_record_store(), config.search_workers)
+        tcp_server.set_history_search(history_search)
+
+    server_manager.set_trace_latency(config.trace_latency)
+
     if not server_manager.run_all():
         error("Failed to start the server")
         exit(1)
@@ -235,7 +683,9 @@ if __name__ == "__main__":
         separators=separators,
         default_separator_cb=lambda action, fd, data:
             server_manager.broadcast_data(actions_to_endpoints.get(action, '-'), action, fd, data),
-            resolve_register_cb=lambda action: actions_to_endpoints.get(action, '-'))
+            resolve_register_cb=lambda action: actions_to_endpoints.get(action, '-'),
+            replay_record_cb=server_manager.broadcast_data,
+            replay_marker_cb=server_manager.broadcast_marker)
 
     for action_name, action_config in config.actions.items():
         action_manager.register(action_name, action_config.data, action_config.preconditions)
@@ -248,12 +698,20 @@ if __name__ == "__main__":
         signal.signal(sig, lambda s, f: _on_signal(s, f, action_manager))
 
     tcp_server.set_stop_all_handler(lambda: action_manager.stop())
+    tcp_server.set_profiler(Profiler("lwserver", config.profile_directory or tempfile.gettempdir()))
+    tcp_server.set_statistics_provider(lambda: {
+        **server_manager.get_statistics(),
+        "actions": action_manager.get_statistics()
+    })
 
     keepalive_counter = 0
     while action_manager.execute(keepalive_counter % 10 == 0):
         try:
             if keepalive_counter % 4 == 0:
-                server_manager.broadcast_keepalive(int(keepalive_counter / 10), actions=action_manager.get_action_states())
+                extra_info = {"actions": action_manager.get_action_states()}
+                if config.keepalive_stats:
+                    extra_info['stats'] = server_manager.get_rates_summary()
+                server_manager.broadcast_keepalive(int(keepalive_counter / 10), **extra_info)
             keepalive_counter += 1
             sleep(0.1)
 
@@ -266,4 +724,6 @@ if __name__ == "__main__":
 
     server_manager.broadcast_keepalive(int(keepalive_counter / 10))
     server_manager.stop_all()
+    if history_search is not None:
+        history_search.shutdown()
     info("Server stopped")
@@ -1,9 +1,13 @@
 #!/usr/bin/python3
 
-from sys import argv
+from sys import argv, stdin, stdout, stderr
 import json
+import os
+import selectors
+import tempfile
 from network.clients import GenericTCPClient
-from time import sleep
+from network.framing import FrameDecoder
+from time import monotonic, monotonic_ns, sleep
 from queue import Queue
 from utils import pop_args, info, error, warning, set_log_level, VERSION
 from utils import TerminalRawMode
@@ -11,6 +15,9 @@ from view.formatter import Formatter, resolve_color
 from view.configuration import Configuration, Watch
 from view.interactive_mode import InteractiveModeContext
 from view.console_output import ConsoleOutput
+from view.headless_output import HeadlessOutput
+from view.pipeline import DecodePipeline
+from profiling import Profiler
 import signal
 
 
@@ -19,7 +26,11 @@ class TCPClient(GenericTCPClient):
         super().__init__(config.host, config.port)
         self._config = config
         self._cout = cout
-        self._recv_buffer = bytearray()
+        self._decoder = FrameDecoder()
+        self._pipeline = None
+
+    def set_pipeline(self, pipeline: DecodePipeline):
+        self._pipeline = pipeline
 
     def _handle_keepalive_message(self, data):
         #self._cout.print_message(str(data), "debug")
@@ -32,28 +43,54 @@ class TCPClient(GenericTCPClient):
             else:
                 endpoints[action_data['register']] = (action_name, action_data['state'])
         self._cout.notify_active_actions(endpoints, other_actions)
+        if 'stats' in data:
+            self._cout.notify_server_rates(data['stats'])
+        if 'trace-write' in data:
+            self._cout.get_latency_tracker().add_write_latency(data['trace-write'])
+
+    def reset_decoder(self):
+        self._decoder = FrameDecoder()
+
+    def _handle_record(self, data, watch_matches=None):
+        if data['type'] == 'data':
+            self._cout.print_line(data, watch_matches)
+        elif data['type'] == 'marker':
+            self._cout.print_marker(data)
+        elif data['type'] == 'keepalive':
+            self._handle_keepalive_message(data)
+        elif data['type'] == 'message':
+            for line in data['text'].split("\n"):
+                self._cout.print_message(line, data.get('fd', "info"))
+
+    def _get_watch_patterns(self):
+        return [watch.regex for watch in self._config.watches.values() if watch.is_regex_valid()]
 
     def on_data_received(self, recv_data):
-        for byte in recv_data:
-            if byte == 0:
-                data_recv_str = str(self._recv_buffer, 'utf-8')
-
-                if len(data_recv_str) > 0:
-                    try:
-                        data = json.loads(data_recv_str)
-                        if data['type'] == 'data':
-                            self._cout.print_line(data);
-                        elif data['type'] == 'marker':
-                            self._cout.print_marker(data)
-                        elif data['type'] == 'keepalive':
-                            self._handle_keepalive_message(data)
-
-                    except json.decoder.JSONDecodeError as err:
-                        warning("Failed to parse JSON: %s: %s" % (err, data_recv_str))
-
-                self._recv_buffer.clear()
-            else:
-                self._recv_buffer.append(byte)
+        frames = self._decoder.feed(recv_data)
+        if len(frames) == 0:
+            return
+
+        if self._pipeline is not None:
+            self._pipeline.submit(frames, self._get_watch_patterns())
+            return
+
+        for frame in frames:
+            try:
+                data = json.loads(frame)
+            except ValueError as err:
+                warning("Failed to parse JSON: %s: %s" % (err, frame))
+                continue
+            if 'trace' in data:
+                data['trace'].append(monotonic_ns())
+            self._handle_record(data)
+
+    def process_decoded_records(self):
+        for results, patterns in self._pipeline.collect():
+            for data, matched in results:
+                if data is None:
+                    warning(matched)
+                else:
+                    self._handle_record(data, (patterns, matched))
 
     def send_enc(self, data):
         self.send(json.dumps(data))
@@ -79,6 +116,19 @@ def read_args(args):
         elif arg in ['-c', '--config']:
             config_file, view_name = pop_args(arg_queue, arg, "file-name", "view-name")
             config.read(config_file, view_name)
+        elif arg in ['-j', '--decode-workers']:
+            workers_s, = pop_args(arg_queue, arg, "count")
+            config.decode_workers = int(workers_s)
+        elif arg == '--headless':
+            config.headless = True
+        elif arg == '--plain':
+            config.plain_output = True
+        elif arg in ['-o', '--output']:
+            output_file, = pop_args(arg_queue, arg, "file-name")
+            config.output_file = output_file
+        elif arg == '--latency-report':
+            report_file, = pop_args(arg_queue, arg, "file-name")
+            config.latency_report_file = report_file
         elif arg in ['-v', '--verbose']:
             config.log_level += 1
         else:
@@ -87,6 +137,17 @@ def read_args(args):
     return config
 
 
+def profile_callback(console_output, profiler: Profiler, action):
+    if action == InteractiveModeContext.PROFILE_START:
+        report = profiler.start()
+    elif action == InteractiveModeContext.PROFILE_STOP:
+        report = profiler.stop()
+    else:
+        report = profiler.snapshot()
+    for line in report.split("\n"):
+        console_output.print_message(line)
+
+
 def pause_callback(console_output, analysis_mode):
     console_output.set_drop_newest_lines_policy(analysis_mode)
     console_output.pause()
@@ -131,23 +192,204 @@ def send_to_stdin(client: TCPClient, register, data):
 def quit_callback():
     raise KeyboardInterrupt
 
+def resize_callback(console_output, rows, cols):
+    console_output.notify_terminal_resized()
+    console_output.print_message("Terminal resized: %d, %d" % (rows, cols))
+
 def disconnect_callback(console_output):
     console_output.print_message("Disconnected from server")
 
+
+def run_event_loop(term: TerminalRawMode, interact: InteractiveModeContext,
+                   console_output: ConsoleOutput, client: TCPClient, pipeline: DecodePipeline = None):
+    RECONNECT_INTERVAL = 0.1
+
+    # SIGWINCH is delivered through a self-pipe, so that the terminal resize
+    # is handled in the same loop as the keyboard and the server socket
+    signal_pipe_r, signal_pipe_w = os.pipe()
+    os.set_blocking(signal_pipe_r, False)
+    os.set_blocking(signal_pipe_w, False)
+    signal.set_wakeup_fd(signal_pipe_w)
+    signal.signal(signal.SIGWINCH, lambda s, f: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(stdin.fileno(), selectors.EVENT_READ, "keyboard")
+    selector.register(signal_pipe_r, selectors.EVENT_READ, "signal")
+    if pipeline is not None:
+        selector.register(pipeline.fileno(), selectors.EVENT_READ, "pipeline")
+
+    next_connection_attempt = 0.0
+    server_fd = None
+    server_fd_registered = False
+    try:
+        while True:
+            if not client.is_active() and monotonic() >= next_connection_attempt:
+                try:
+                    client.connect()
+                    client.reset_decoder()
+                    server_fd = client.fileno()
+                    server_fd_registered = False
+                    client.send_enc({'type': 'get-late-join-records'})
+                except ConnectionRefusedError:
+                    next_connection_attempt = monotonic() + RECONNECT_INTERVAL
+
+            # The server is not read while the decoding pipeline is saturated
+            read_server = client.is_active() and (pipeline is None or not pipeline.is_full())
+            if read_server != server_fd_registered:
+                if read_server:
+                    selector.register(server_fd, selectors.EVENT_READ, "server")
+                else:
+                    selector.unregister(server_fd)
+                server_fd_registered = read_server
+
+            timeout = console_output.get_frame_timeout()
+            if not client.is_active():
+                reconnect_timeout = max(next_connection_attempt - monotonic(), 0)
+                if timeout is None or timeout > reconnect_timeout:
+                    timeout = reconnect_timeout
+
+            for key, mask in selector.select(timeout):
+                if key.data == "keyboard":
+                    interact.read_keys(term)
+                elif key.data == "server":
+                    if not client.receive():
+                        selector.unregister(server_fd)
+                        server_fd_registered = False
+                elif key.data == "pipeline":
+                    client.process_decoded_records()
+                elif key.data == "signal":
+                    signals = os.read(signal_pipe_r, 256)
+                    if signal.SIGWINCH in signals:
+                        term.request_terminal_size()
+
+            console_output.render_frame()
+    finally:
+        signal.set_wakeup_fd(-1)
+        selector.close()
+        os.close(signal_pipe_r)
+        os.close(signal_pipe_w)
+
+def run_headless(config: Configuration, output: HeadlessOutput, client: TCPClient,
+                 pipeline: DecodePipeline = None):
+    RECONNECT_INTERVAL = 0.1
+    FLUSH_INTERVAL = 0.1
+
+    while True:
+        try:
+            client.connect()
+            break
+        except ConnectionRefusedError:
+            sleep(RECONNECT_INTERVAL)
+    server_fd = client.fileno()
+    client.send_enc({'type': 'get-late-join-records'})
+
+    selector = selectors.DefaultSelector()
+    if pipeline is not None:
+        selector.register(pipeline.fileno(), selectors.EVENT_READ, "pipeline")
+
+    # The output is written when the buffer fills up, when the server has
+    # been idle for a moment or when the oldest row buffered has waited as
+    # long, so that a steady stream is not held back; the viewer exits once
+    # disconnected
+    server_fd_registered = False
+    try:
+        while client.is_active() or (pipeline is not None and pipeline.in_flight() > 0):
+            read_server = client.is_active() and (pipeline is None or not pipeline.is_full())
+            if read_server != server_fd_registered:
+                if read_server:
+                    selector.register(server_fd, selectors.EVENT_READ, "server")
+                else:
+                    selector.unregister(server_fd)
+                server_fd_registered = read_server
+
+            events = selector.select(FLUSH_INTERVAL)
+            if len(events) == 0:
+                output.flush()
+            for key, mask in events:
+                if key.data == "server":
+                    if not client.receive():
+                        selector.unregister(server_fd)
+                        server_fd_registered = False
+                elif key.data == "pipeline":
+                    client.process_decoded_records()
+            output.flush_if_older(FLUSH_INTERVAL)
+        output.flush()
+    finally:
+        selector.close()
+
+
+def run_headless_view(config: Configuration):
+    formatter = Formatter()
+    for endpoint_name, endpoint_style in config.endpoint_styles.items():
+        formatter.add_endpoint_style(endpoint_name, endpoint_style)
+
+    for watch_name, watch in config.watches.items():
+        formatter.add_watch_style(watch_name, watch.format)
+
+    if config.output_file is not None:
+        output_file = open(config.output_file, 'wb')
+    else:
+        output_file = stdout.buffer
+
+    output = HeadlessOutput(config, formatter, output_file, config.plain_output)
+    client = TCPClient(config, output)
+    pipeline = None
+    if config.decode_workers > 0:
+        pipeline = DecodePipeline(config.decode_workers)
+        client.set_pipeline(pipeline)
+
+    try:
+        run_headless(config, output, client, pipeline)
+    except KeyboardInterrupt:
+        output.flush()
+    except BrokenPipeError:
+        # The reader of the output has gone away, e.g. less was closed
+        os.dup2(os.open(os.devnull, os.O_WRONLY), output_file.fileno())
+    finally:
+        if pipeline is not None:
+            pipeline.shutdown()
+        client.stop()
+        if config.output_file is not None:
+            output_file.close()
+
+    # The latency of the traced records is reported once all are written
+    latency = output.get_latency_tracker()
+    if config.latency_report_file is not None:
+        with open(config.latency_report_file, 'w') as report_file:
+            json.dump(latency.to_dict(), report_file)
+    elif latency.get_count() > 0:
+        for line in latency.get_report():
+            print(line, file=stderr)
+
+
 if __name__ == "__main__":
-    set_log_level(3)
-    info("*** LOGWATCH v%s: lwview" % VERSION)
+    # In the headless mode the output goes to stdout, so only the errors
+    # are reported there
+    headless = '--headless' in argv and '-o' not in argv and '--output' not in argv
+    set_log_level(1 if headless else 3)
     config = read_args(argv[1:])
+
+    if config.headless:
+        if config.output_file is not None:
+            set_log_level(config.log_level)
+        run_headless_view(config)
+        exit(0)
+
+    info("*** LOGWATCH v%s: lwview" % VERSION)
     set_log_level(config.log_level)
 
     term = TerminalRawMode()
     try:
         interact = InteractiveModeContext(config)
-        term.enter_raw_mode()
+        term.enter_raw_mode(read_timeout=0)
 
         formatter = Formatter()
         console_output = ConsoleOutput(config, formatter, term, interact)
         console_output.set_max_held_lines(config.max_held_lines)
+        console_output.set_max_held_bytes(config.max_held_bytes)
+        console_output.set_max_history(config.history_lines, config.history_bytes)
+        console_output.set_spill_to_disk(config.spill_to_disk, config.max_spill_bytes)
+        console_output.set_frame_rate(config.frame_rate)
 
         interact.on_command_buffer_changed(lambda buf: console_output.notify_status_line_changed())
         interact.on_pause(lambda analysis_mode: pause_callback(console_output, analysis_mode))
@@ -156,6 +398,13 @@ if __name__ == "__main__":
         interact.on_enable_watch(lambda watch, enabled: set_watch_enable(config, watch, enabled))
         interact.on_quit(lambda: quit_callback())
         interact.on_print_info(lambda fd, content: console_output.print_message(content, fd))
+        interact.on_scroll(lambda direction: console_output.scroll(direction))
+        interact.on_search(lambda pattern: console_output.search(pattern))
+        interact.on_search_next(lambda older: console_output.search_next(older))
+        interact.on_show_latency(lambda: console_output.show_latency())
+
+        profiler = Profiler("lwview", config.profile_directory or tempfile.gettempdir())
+        interact.on_profile(lambda action: profile_callback(console_output, profiler, action))
 
         for endpoint_name, endpoint_style in config.endpoint_styles.items():
             formatter.add_endpoint_style(endpoint_name, endpoint_style)
@@ -163,32 +412,27 @@ if __name__ == "__main__":
         for watch_name, watch in config.watches.items():
             formatter.add_watch_style(watch_name, watch.format)
 
-        app_active = True
         client = TCPClient(config, console_output)
+        pipeline = None
+        if config.decode_workers > 0:
+            info("Decoding the records in %d worker processes" % config.decode_workers)
+            pipeline = DecodePipeline(config.decode_workers)
+            client.set_pipeline(pipeline)
         client.set_connection_loss_cb(lambda: disconnect_callback(console_output))
 
         interact.on_send_stdin(lambda register, data: send_to_stdin(client, register, data))
         interact.on_set_marker(lambda: client.send_enc({"type": "set-marker"}))
 
-        signal.signal(signal.SIGWINCH, lambda s, f: term.request_terminal_size())
-
-        term.set_resize_cb(lambda r, c: console_output.print_message("Terminal resized: %d, %d" % (r, c)))
+        term.set_resize_cb(lambda r, c: resize_callback(console_output, r, c))
         term.request_terminal_size()
 
-        while app_active:
-            try:
-                if not client.is_active():
-                    try:
-                        client.run()
-                        client.send_enc({'type': 'get-late-join-records'})
-                    except ConnectionRefusedError:
-                        sleep(0.1)
-
-                console_output.write_pending_lines()
-                console_output.render_status_line()
-                interact.read_key(term)
-            except KeyboardInterrupt:
-                app_active = False
+        try:
+            run_event_loop(term, interact, console_output, client, pipeline)
+        except KeyboardInterrupt:
+            pass
+
+        if pipeline is not None:
+            pipeline.shutdown()
 
         client.stop()
     except Exception as ex:
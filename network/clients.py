@@ -3,7 +3,7 @@ import threading as thrd
 
 
 class GenericTCPClient:
-    RECV_SIZE = 1024
+    RECV_SIZE = 65536
 
     def __init__(self, host, port):
         self._host = host
@@ -13,10 +13,13 @@ class GenericTCPClient:
         self._enabled = False
         self._connection_loss_cb = None
 
-    def run(self):
+    def connect(self):
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._socket.connect((self._host, self._port))
         self._enabled = True
+
+    def run(self):
+        self.connect()
         self._receiver_thread = thrd.Thread(target=self._receiver_worker)
         self._receiver_thread.start()
 
@@ -24,6 +27,12 @@ class GenericTCPClient:
         self._enabled = False
         if self._receiver_thread is not None:
             self._receiver_thread.join()
+        elif self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def fileno(self):
+        return self._socket.fileno()
 
     def is_active(self):
         return self._enabled
@@ -31,20 +40,39 @@ class GenericTCPClient:
     def set_connection_loss_cb(self, callback: callable):
         self._connection_loss_cb = callback
 
+    def _on_connection_lost(self):
+        self._enabled = False
+        self._socket.close()
+        self._socket = None
+
+        if self._connection_loss_cb is not None:
+            self._connection_loss_cb()
+
     def _receiver_worker(self):
         while self._enabled:
             data_recv = self._socket.recv(self.RECV_SIZE)
 
             if not data_recv:
-                self._enabled = False
                 break
 
             self.on_data_received(data_recv)
 
-        self._socket.close()
+        self._on_connection_lost()
 
-        if self._connection_loss_cb is not None:
-            self._connection_loss_cb()
+    def receive(self):
+        # To be used instead of run() by clients which poll the socket on
+        # their own; reads whatever is available without blocking
+        try:
+            data_recv = self._socket.recv(self.RECV_SIZE)
+        except ConnectionResetError:
+            data_recv = None
+
+        if not data_recv:
+            self._on_connection_lost()
+            return False
+
+        self.on_data_received(data_recv)
+        return True
 
     def send(self, data):
         if isinstance(data, str):
@@ -0,0 +1,72 @@
+import json
+
+FRAME_SEPARATOR = b"\0"
+
+# Binary frames start with this byte, followed by the length of the payload
+# (4 bytes, big endian) and the payload itself; they are not terminated
+BINARY_FRAME_MARKER = 0x01
+BINARY_HEADER_SIZE = 5
+
+
+class BinaryFrame(bytes):
+    pass
+
+
+class FrameDecoder:
+    # Splits a stream of bytes into frames terminated with the NUL byte;
+    # an incomplete frame is kept until the rest of it arrives
+    def __init__(self):
+        self._buffer = bytearray()
+        self._has_binary_frames = False
+
+    def feed(self, data):
+        self._buffer.extend(data)
+        if not self._has_binary_frames:
+            if BINARY_FRAME_MARKER not in data:
+                if FRAME_SEPARATOR not in data:
+                    return []
+
+                frames = self._buffer.split(FRAME_SEPARATOR)
+                self._buffer = frames.pop()
+                return [bytes(frame) for frame in frames if len(frame) > 0]
+            self._has_binary_frames = True
+
+        return self._feed_mixed()
+
+    def _feed_mixed(self):
+        # Once a peer has sent a binary frame, the frames are parsed one by
+        # one, as the payloads may contain any bytes
+        frames = []
+        position = 0
+        buffer = self._buffer
+        while position < len(buffer):
+            if buffer[position] == BINARY_FRAME_MARKER:
+                if len(buffer) - position < BINARY_HEADER_SIZE:
+                    break
+                size = int.from_bytes(buffer[position + 1:position + BINARY_HEADER_SIZE], 'big')
+                end = position + BINARY_HEADER_SIZE + size
+                if end > len(buffer):
+                    break
+                frames.append(BinaryFrame(buffer[position + BINARY_HEADER_SIZE:end]))
+                position = end
+            else:
+                end = buffer.find(FRAME_SEPARATOR, position)
+                if end == -1:
+                    break
+                if end > position:
+                    frames.append(bytes(buffer[position:end]))
+                position = end + 1
+
+        del self._buffer[:position]
+        return frames
+
+    def pending_size(self):
+        return len(self._buffer)
+
+
+def encode_frame(record):
+    return bytes(json.dumps(record), 'utf-8') + FRAME_SEPARATOR
+
+
+def encode_binary_frame(payload):
+    return bytes([BINARY_FRAME_MARKER]) + len(payload).to_bytes(4, 'big') + payload
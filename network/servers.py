@@ -1,13 +1,20 @@
+import json
 import socket
 import selectors
 from types import SimpleNamespace
+from collections import deque
 import threading as thrd
 from utils import debug, info, error, warning
+from server.statistics import RateCounter
+from tracing import LatencyHistogram
+from time import monotonic_ns
 from time import sleep
 import os
 
 
 class GenericTCPServer:
+    RECV_SIZE = 65536
+
     def __init__(self, address=None, port=None, filename=None):
         self._address = address
         self._port = port
@@ -17,6 +24,11 @@ class GenericTCPServer:
         self._selector = selectors.DefaultSelector()
         self._listen_thread = None
         self._clients = {}
+        # Output buffers are appended to from the threads of the endpoints
+        self._outb_lock = thrd.Lock()
+        self._received = RateCounter()
+        self._sent = RateCounter()
+        self._trace_latency = False
 
     def run(self):
         self._active = True
@@ -28,39 +40,63 @@ class GenericTCPServer:
         self._active = False
         self._listen_thread.join()
 
+    def set_trace_latency(self, enabled):
+        self._trace_latency = enabled
+
     def _accept(self, client_sock):
         conn, addr = client_sock.accept()
         info("Received a connection from %s:%s" % addr)
+        self._register_client(conn, addr)
+        self.on_client_connected(addr, conn)
+
+    def _register_client(self, conn, addr):
         conn.setblocking(False)
-        self._selector.register(conn, selectors.EVENT_READ | selectors.EVENT_WRITE, SimpleNamespace(addr=addr, inb=b'', outb=b''))
+        # queued and sent count all the bytes ever passed through outb;
+        # traces holds the end offsets of the traced messages, and
+        # write_latency the time they waited to be passed to the socket
+        client = SimpleNamespace(addr=addr, inb=b'', outb=bytearray(), queued=0, sent=0, traces=deque(),
+                                 write_latency=LatencyHistogram())
+        self._selector.register(conn, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
         self._clients[addr] = conn
-        self.on_client_connected(addr, conn)
+        return client
 
     def _serve(self, sock, data, mask):
+        # Returns True if any data was received
         if mask & selectors.EVENT_READ:
             try:
-                recv_data = sock.recv(4096)
+                recv_data = sock.recv(self.RECV_SIZE)
             except ConnectionResetError:
                 recv_data = None
 
             if recv_data:
-                debug("Received data: %s" % recv_data)
+                self._received.add(len(recv_data))
+                debug("Received %d bytes from %s:%s" % (len(recv_data), data.addr[0], data.addr[1]))
                 self.on_data_received(data.addr, recv_data)
             else:
                 info("Closing connection from %s:%s" % data.addr)
                 self._selector.unregister(sock)
                 del self._clients[data.addr]
                 sock.close()
+                self.on_client_disconnected(data.addr)
+                return False
 
         if mask & selectors.EVENT_WRITE:
             if data.outb:
                 try:
-                    sent_bytes = sock.send(data.outb)
-                    data.outb = data.outb[sent_bytes:]
+                    with self._outb_lock:
+                        sent_bytes = sock.send(data.outb)
+                        del data.outb[:sent_bytes]
+                        data.sent += sent_bytes
+                        if data.traces:
+                            now_ns = monotonic_ns()
+                            while data.traces and data.traces[0][0] <= data.sent:
+                                data.write_latency.add(now_ns - data.traces.popleft()[1])
+                    self._sent.add(sent_bytes)
                     debug("Sent %d bytes, %d bytes remaining" % (sent_bytes, len(data.outb)))
                 except Exception as ex:
                     print("Exception on sending: %s" % ex)
                     sock.close()
+        return bool(mask & selectors.EVENT_READ)
 
     def _listen_worker(self):
         if self._port is not None:
@@ -105,12 +141,16 @@ class GenericTCPServer:
 
         while self._active:
             events = self._selector.select(timeout=1)
+            received = False
             for key, mask in events:
                 if key.data is None:
                     self._accept(key.fileobj)
-                else:
-                    self._serve(key.fileobj, key.data, mask)
-            sleep(0.01)
+                elif self._serve(key.fileobj, key.data, mask):
+                    received = True
+            # The sockets are almost always writable; do not spin while the
+            # clients are idle, but keep reading while they are sending
+            if not received:
+                sleep(0.01)
 
         info("Closing")
 
@@ -120,28 +160,85 @@ class GenericTCPServer:
             self._selector.close()
             sock.close()
 
-    def broadcast(self, data):
+    def broadcast(self, data, accept=None, trace_ns=None):
+        # accept, if given, tells for the address of a client whether the
+        # message should be sent to it; trace_ns is the time the message
+        # was queued at, for measuring how long it waits to be sent
         debug("Broadcasting message %s" % data)
-        for key, conn in self._clients.items():
-            debug("... to %s:%s" % key)
-            data_raw = bytes(data + "\0", 'utf-8')
-            self._selector.get_key(conn).data.outb += data_raw
+        data_raw = bytes(data + "\0", 'utf-8')
+        with self._outb_lock:
+            for key, conn in self._clients.items():
+                if accept is not None and not accept(key):
+                    continue
+                debug("... to %s:%s" % key)
+                client = self._selector.get_key(conn).data
+                client.outb += data_raw
+                client.queued += len(data_raw)
+                if trace_ns is not None:
+                    client.traces.append((client.queued, trace_ns))
+
+    def broadcast_with_write_latency(self, message):
+        # Sends every client the message with the latency of the writes of
+        # the traced records to its own socket since the previous call
+        with self._outb_lock:
+            for conn in self._clients.values():
+                client = self._selector.get_key(conn).data
+                message['trace-write'] = client.write_latency.to_dict()
+                client.write_latency = LatencyHistogram()
+                data_raw = bytes(json.dumps(message) + "\0", 'utf-8')
+                client.outb += data_raw
+                client.queued += len(data_raw)
+
+    def broadcast_record(self, record, trace_ns=None):
+        self.broadcast(json.dumps(record), trace_ns=trace_ns)
 
     def send(self, addr, data):
         debug("Sending to %s:%s: %s" % (addr[0], addr[1], data))
         try:
-            conn = self._clients[addr]
             data_raw = bytes(data + "\0", 'utf-8')
-            self._selector.get_key(conn).data.outb += data_raw
+            with self._outb_lock:
+                conn = self._clients[addr]
+                client = self._selector.get_key(conn).data
+                client.outb += data_raw
+                client.queued += len(data_raw)
         except Exception:
             raise
 
+    def send_if_connected(self, addr, data):
+        # For the threads other than the listening one, as the client may
+        # disconnect at any time
+        try:
+            self.send(addr, data)
+        except (KeyError, ValueError):
+            debug("Client %s:%s is gone, dropping %s" % (addr[0], addr[1], data))
+
+    def get_queued_size(self, addr):
+        # Bytes waiting to be sent to a client, None if it is not connected
+        with self._outb_lock:
+            conn = self._clients.get(addr)
+            if conn is None:
+                return None
+            return len(self._selector.get_key(conn).data.outb)
+
+    def get_statistics(self):
+        with self._outb_lock:
+            clients = {"%s:%s" % addr: {"queued-bytes": len(self._selector.get_key(conn).data.outb)}
+                       for addr, conn in self._clients.items()}
+        return {
+            "received": self._received.to_dict(),
+            "sent": self._sent.to_dict(),
+            "clients": clients
+        }
+
     def on_data_received(self, addr, data):
         pass
 
     def on_client_connected(self, addr, conn):
         pass
 
+    def on_client_disconnected(self, addr):
+        pass
+
     def is_active(self):
         return self._active and self._connected
 
@@ -0,0 +1,232 @@
+from datetime import datetime
+import marshal
+import os
+import sys
+import threading as thrd
+import time
+import tracemalloc
+from time import sleep
+
+
+def _code_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _thread_cpu_time(thread_id):
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def _format_function(key):
+    filename, line, name = key
+    return "%s:%d(%s)" % (os.path.basename(filename), line, name)
+
+
+class SamplingProfiler:
+    # Samples the stacks of all the threads of the process. cProfile only
+    # instruments the thread that enables it, while the servers and the
+    # endpoints run in threads of their own. The collected statistics are
+    # stored in the format of cProfile, so that pstats can read them.
+    # Threads which have not used the CPU since the previous sample are
+    # waiting for I/O and are skipped, where the platform tells it.
+    INTERVAL = 0.005
+    IDLE_CPU_SHARE = 0.1
+
+    def __init__(self):
+        self._thread = None
+        self._running = False
+        self._paused = False
+        self._lock = thrd.Lock()
+        self._samples = 0
+        self._self_counts = {}
+        self._total_counts = {}
+        self._callers = {}
+        self._cpu_times = {}
+
+    def is_running(self):
+        return self._running
+
+    def start(self):
+        self._running = True
+        self._thread = thrd.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_paused(self, paused):
+        # Keeps the work of the profiler itself out of the samples
+        self._paused = paused
+
+    def reset(self):
+        with self._lock:
+            self._samples = 0
+            self._self_counts = {}
+            self._total_counts = {}
+            self._callers = {}
+            self._cpu_times = {}
+
+    def _sample(self, frame):
+        key = _code_key(frame.f_code)
+        self._self_counts[key] = self._self_counts.get(key, 0) + 1
+
+        seen = set()
+        while frame is not None:
+            key = _code_key(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self._total_counts[key] = self._total_counts.get(key, 0) + 1
+            caller = frame.f_back
+            if caller is not None:
+                edge = (_code_key(caller.f_code), key)
+                self._callers[edge] = self._callers.get(edge, 0) + 1
+            frame = caller
+
+    def _worker(self):
+        own_id = thrd.get_ident()
+        while self._running:
+            if self._paused:
+                sleep(self.INTERVAL)
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    cpu_time = _thread_cpu_time(thread_id)
+                    previous = self._cpu_times.get(thread_id)
+                    self._cpu_times[thread_id] = cpu_time
+                    if cpu_time is not None and (previous is None or
+                                                 cpu_time - previous < self.INTERVAL * self.IDLE_CPU_SHARE):
+                        continue
+                    self._sample(frame)
+                self._samples += 1
+            del frames
+            sleep(self.INTERVAL)
+
+    def get_samples_count(self):
+        return self._samples
+
+    def get_stats(self):
+        # Returns the statistics in the format of pstats; the times are
+        # estimated from the number of samples
+        with self._lock:
+            callers = {}
+            for (caller, callee), count in self._callers.items():
+                callers.setdefault(callee, {})[caller] = (count, count, 0.0, count * self.INTERVAL)
+
+            stats = {}
+            for key, total in self._total_counts.items():
+                self_count = self._self_counts.get(key, 0)
+                stats[key] = (total, total, self_count * self.INTERVAL, total * self.INTERVAL,
+                              callers.get(key, {}))
+            return stats
+
+    def get_top_functions(self, count):
+        with self._lock:
+            top = sorted(self._self_counts.items(), key=lambda item: item[1], reverse=True)[:count]
+            return [(key, samples, self._total_counts.get(key, 0)) for key, samples in top]
+
+
+class Profiler:
+    # Controls the CPU and memory profiling of the process; both are off,
+    # without any overhead, until started
+    TOP_COUNT = 10
+    TRACEMALLOC_FRAMES = 8
+
+    def __init__(self, name, directory=None):
+        self._name = name
+        self._directory = directory
+        self._sampler = SamplingProfiler()
+        self._started_tracemalloc = False
+        self._start_time = None
+
+    def set_directory(self, directory):
+        self._directory = directory
+
+    def is_running(self):
+        return self._sampler.is_running()
+
+    def start(self):
+        if self.is_running():
+            return "Profiling is already running"
+        self._sampler.reset()
+        self._sampler.start()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._start_time = datetime.now()
+        return "Profiling started"
+
+    def stop(self):
+        if not self.is_running():
+            return "Profiling is not running"
+        report = self.snapshot()
+        self._sampler.stop()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return report + "\nProfiling stopped"
+
+    def snapshot(self):
+        # Writes the statistics collected so far and returns a summary
+        if not self.is_running():
+            return "Profiling is not running"
+
+        self._sampler.set_paused(True)
+        try:
+            return self._report()
+        finally:
+            self._sampler.set_paused(False)
+
+    def _report(self):
+        memory = None
+        if tracemalloc.is_tracing():
+            memory = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)])
+
+        lines = []
+        try:
+            files = self._write_files(memory)
+            if len(files) > 0:
+                lines.append("Profile of %s written to %s" % (self._name, ", ".join(files)))
+        except OSError as ex:
+            lines.append("Cannot write the profile: %s" % ex)
+
+        samples = self._sampler.get_samples_count()
+        lines.append("Hot functions (%d samples since %s):" % (samples, self._start_time.strftime("%H:%M:%S")))
+        for key, self_samples, total_samples in self._sampler.get_top_functions(self.TOP_COUNT):
+            lines.append("  %5.1f%% self %5.1f%% total  %s" % (
+                100.0 * self_samples / max(samples, 1),
+                100.0 * total_samples / max(samples, 1),
+                _format_function(key)))
+
+        if memory is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append("Allocation sites (%d KB traced, peak %d KB):" % (current / 1024, peak / 1024))
+            for stat in memory.statistics('lineno')[:self.TOP_COUNT]:
+                frame = stat.traceback[0]
+                lines.append("  %8.1f KB %7d blocks  %s:%d" % (
+                    stat.size / 1024, stat.count, os.path.basename(frame.filename), frame.lineno))
+        return "\n".join(lines)
+
+    def _write_files(self, memory):
+        if self._directory is None:
+            return []
+
+        prefix = os.path.join(self._directory, "%s-%d-%s" % (
+            self._name, os.getpid(), datetime.now().strftime("%Y%m%d-%H%M%S")))
+        files = []
+        with open(prefix + ".pstats", "wb") as file:
+            marshal.dump(self._sampler.get_stats(), file)
+        files.append(prefix + ".pstats")
+        if memory is not None:
+            memory.dump(prefix + ".tracemalloc")
+            files.append(prefix + ".tracemalloc")
+        return files
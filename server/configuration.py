@@ -1,5 +1,5 @@
 import yaml
-from utils import lw_assert
+from utils import lw_assert, fatal_error, parse_size, parse_duration
 
 
 class SubprocessConfig:
@@ -16,6 +16,23 @@ class SSHSessionConfig:
         self.options = options
 
 
+class ReplayConfig:
+    def __init__(self, filename, speed):
+        self.filename = filename
+        self.speed = speed
+
+
+class RecordStoreConfig:
+    def __init__(self, directory):
+        self.directory = directory
+        self.segment_size = 64 << 20
+        self.max_size = None
+        self.max_age = None
+        self.fsync_interval = 1.0
+        self.compression = "zlib"
+        self.block_size = 64 << 10
+
+
 class ActionConfiguration:
     AWAIT_COMPLETION = 1
 
@@ -33,6 +50,12 @@ class Configuration:
         self.websocket = None
         self.late_join_buf_size = None
         self.stay_active = False
+        self.keepalive_stats = False
+        self.profile_directory = None
+        self.trace_latency = False
+        self.record_file = None
+        self.record_store = None
+        self.search_workers = None
 
     def _process_await_node(self, await_items):
         result = {}
@@ -62,6 +85,33 @@ class Configuration:
                 user=action_desc['user'],
                 command=command,
                 options=action_desc.get('options', {})), awaits)
+        elif action_desc['type'] == 'replay':
+            lw_assert("file" in action_desc, "Replay endpoint must have the session file specified")
+            speed = action_desc.get('speed', 1)
+            if speed == 'max':
+                speed = 0
+            lw_assert(isinstance(speed, (int, float)) and speed >= 0,
+                      "Replay speed must be a non-negative number or \"max\"")
+
+            self.actions[action_name] = ActionConfiguration(ReplayConfig(action_desc['file'], speed), awaits)
+
+    def _process_record_store_node(self, node):
+        lw_assert("directory" in node, "Record store must have the directory specified")
+        store = RecordStoreConfig(node['directory'])
+        try:
+            store.segment_size = parse_size(node.get('segment-size', store.segment_size))
+            store.max_size = parse_size(node.get('max-size', store.max_size))
+            store.max_age = parse_duration(node.get('max-age', store.max_age))
+            store.fsync_interval = parse_duration(node.get('fsync-interval', store.fsync_interval))
+            store.block_size = parse_size(node.get('block-size', store.block_size))
+        except ValueError as ex:
+            fatal_error("Invalid option of the record store: %s" % ex)
+        store.compression = node.get('compression', store.compression)
+        lw_assert(store.compression in ["zlib", "lzma", "none"],
+                  "Compression of the record store must be one of: zlib, lzma, none")
+        if store.compression == "none":
+            store.compression = None
+        self.record_store = store
 
     def read(self, filename):
         with open(filename, 'r') as file:
@@ -75,6 +125,13 @@ class Configuration:
             self.websocket = server_conf.get('websocket-port', None)
             self.late_join_buf_size = server_conf.get('late-joiners-buffer-size', None)
             self.stay_active = server_conf.get('stay-active', self.stay_active)
+            self.keepalive_stats = server_conf.get('keepalive-stats', self.keepalive_stats)
+            self.profile_directory = server_conf.get('profile-directory', self.profile_directory)
+            self.trace_latency = server_conf.get('trace-latency', self.trace_latency)
+            self.record_file = server_conf.get('record-session', self.record_file)
+            self.search_workers = server_conf.get('search-workers', self.search_workers)
+            if 'record-store' in server_conf:
+                self._process_record_store_node(server_conf['record-store'])
 
             for endpoint in data['server'].get('endpoints', []):
                 lw_assert("type" in endpoint, "Endpoint type must be provided")
@@ -0,0 +1,148 @@
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from itertools import accumulate
+import json
+import multiprocessing
+import os
+import re
+from server.record_filter import RecordFilter
+from server.record_store import RecordStore, DECOMPRESSORS
+from server.token_filter import BloomFilter
+
+# Patterns which may match a record alone, but not within the joined text
+# of many, or the other way round in a way the check of the record would
+# not catch
+JOINED_TEXT_UNSAFE = ["(?<", "\\A", "\\Z"]
+
+
+def _read_lines(shard, tokens):
+    path, method, blocks, start, end = shard
+    with open(path, 'rb') as file:
+        if blocks is None:
+            file.seek(start[1])
+            return file.read(end[1] - start[1]).splitlines()
+
+        lines = []
+        for raw_offset, raw_size, file_offset, compressed_size, filter_offset, filter_size in blocks:
+            if tokens and filter_size > 0:
+                file.seek(filter_offset)
+                if not BloomFilter(file.read(filter_size)).might_contain_all(tokens):
+                    continue
+            file.seek(file_offset)
+            data = DECOMPRESSORS[method](file.read(compressed_size))
+            lines += data[max(start[1] - raw_offset, 0):min(end[1] - raw_offset, raw_size)].splitlines()
+        return lines
+
+
+def search_lines(lines, record_filter: RecordFilter, limit):
+    # Returns the encoded records matching the filter, at most limit of
+    # them. The pattern is searched for in the data of all the records
+    # joined by newlines, so that the regular expression engine runs over
+    # long texts instead of every record; only the records it stops at are
+    # checked one by one.
+    records = [json.loads(line) for line in lines]
+    hits = []
+    if any(construct in record_filter.pattern.pattern for construct in JOINED_TEXT_UNSAFE):
+        for line, record in zip(lines, records):
+            if len(hits) >= limit:
+                break
+            if record_filter.matches(record):
+                hits.append(str(line, 'utf-8'))
+        return hits
+
+    texts = [record.get('data', "") for record in records]
+    starts = [0] + list(accumulate(len(text) + 1 for text in texts))
+    text = "\n".join(texts)
+    # The ends of the records are ends of lines in the joined text
+    search = re.compile(record_filter.pattern.pattern, record_filter.pattern.flags | re.MULTILINE).search
+    ix = 0
+    while ix < len(records) and len(hits) < limit:
+        match = search(text, starts[ix])
+        if match is None:
+            break
+        ix = bisect_right(starts, match.start()) - 1
+        if record_filter.matches(records[ix]):
+            hits.append(str(lines[ix], 'utf-8'))
+        ix += 1
+    return hits
+
+
+def search_shard(shard, record_filter: RecordFilter, limit):
+    # Runs in the worker processes; returns None if the file of the shard
+    # is gone, having been compressed or removed in the meantime
+    try:
+        lines = _read_lines(shard, record_filter.tokens)
+    except FileNotFoundError:
+        return None
+    return search_lines(lines, record_filter, limit)
+
+
+class HistorySearch:
+    # Searches the record store with a pool of processes. The history is
+    # split into shards, which are searched in parallel; their hits are
+    # passed on in the order of the shards, so in the order of the records.
+    SHARD_SIZE = 8 << 20
+
+    def __init__(self, store: RecordStore, workers=None):
+        self._store = store
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = None
+
+    def _get_executor(self):
+        # The workers are not forked from the server, which has threads
+        # running; they are started once, at the first search
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=context)
+        return self._executor
+
+    def _wait_for(self, future, cancelled):
+        while not cancelled.is_set():
+            done, _ = wait([future], timeout=0.1)
+            if len(done) > 0:
+                return True
+        return False
+
+    def search(self, record_filter: RecordFilter, limit, cancelled, on_hits: callable):
+        # Calls on_hits with the lists of the encoded records found, and
+        # returns their count and whether all the history was searched
+        start = self._store.find(record_filter.since_seq, record_filter.since_timestamp())
+        shards = self._store.get_shards(start, shard_size=self.SHARD_SIZE, until_seq=record_filter.until_seq,
+                                        until_time=record_filter.until_timestamp())
+        executor = self._get_executor()
+        pending = deque()
+        next_shard = 0
+        count = 0
+        try:
+            while count < limit:
+                while next_shard < len(shards) and len(pending) < self._workers * 2:
+                    future = executor.submit(search_shard, shards[next_shard], record_filter, limit - count)
+                    pending.append((shards[next_shard], future))
+                    next_shard += 1
+                if len(pending) == 0:
+                    break
+
+                shard, future = pending.popleft()
+                if not self._wait_for(future, cancelled):
+                    break
+                hits = future.result()
+                if hits is None:
+                    _, _, _, shard_start, shard_end = shard
+                    hits = search_lines(list(self._store.read(shard_start, shard_end, record_filter.tokens)),
+                                        record_filter, limit - count)
+                hits = hits[:limit - count]
+                if len(hits) > 0:
+                    on_hits(hits)
+                count += len(hits)
+        finally:
+            for _, future in pending:
+                future.cancel()
+        # Reaching the limit means that there may be more
+        complete = next_shard == len(shards) and len(pending) == 0 and not cancelled.is_set() and count < limit
+        return count, complete
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
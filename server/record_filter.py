@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+import re
+from server.token_filter import required_tokens
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def record_timestamp(record):
+    # The records carry the local date and time with the resolution of a
+    # second; markers have them too
+    try:
+        return datetime.strptime("%s %s" % (record['date'], record['time']), TIME_FORMAT).timestamp()
+    except (KeyError, ValueError):
+        return None
+
+
+def _parse_time(value):
+    # Dates and times in the records are compared as strings
+    if value is None:
+        return None
+    if len(value) <= len("HH:MM:SS"):
+        return None, value
+    date, time = value.split(" ", 1)
+    return date, time
+
+
+def _latest_occurrence(time, now):
+    since = datetime.combine(now.date(), datetime.strptime(time, "%H:%M:%S").time())
+    if since > now:
+        since -= timedelta(days=1)
+    return since
+
+
+class RecordFilter:
+    # Selects the records streamed to a subscribed client. Markers have
+    # neither an endpoint, a descriptor nor a sequence number, so only the
+    # time limits apply to them. The lower limits are inclusive, the upper
+    # ones exclusive. With a pattern, only the data records matching it are
+    # selected.
+    def __init__(self, since_seq=None, since_time=None, endpoints=None, until_seq=None, until_time=None, fds=None,
+                 pattern=None):
+        self.since_seq = since_seq
+        self.since_time = since_time
+        self.endpoints = set(endpoints) if endpoints else None
+        self.until_seq = until_seq
+        self.until_time = until_time
+        self.fds = set(fds) if fds else None
+        self.pattern = re.compile(pattern) if pattern is not None else None
+        # Words which the records matching the pattern contain, for skipping
+        # the blocks of the history without them
+        self.tokens = required_tokens(pattern)
+
+    @staticmethod
+    def from_request(data):
+        return RecordFilter(data.get('since-seq'), _parse_time(data.get('since-time')), data.get('endpoints'),
+                            data.get('until-seq'), _parse_time(data.get('until-time')), data.get('fds'),
+                            data.get('pattern'))
+
+    def resolve_dates(self, now=None):
+        # Times without a date match that time of any day; for a range they
+        # mean their latest occurrence instead
+        now = now or datetime.now()
+        if self.since_time is not None and self.since_time[0] is None:
+            self.since_time = tuple(_latest_occurrence(self.since_time[1], now).strftime(TIME_FORMAT).split(" "))
+        if self.until_time is not None and self.until_time[0] is None:
+            self.until_time = tuple(_latest_occurrence(self.until_time[1], now).strftime(TIME_FORMAT).split(" "))
+
+    def matches(self, record):
+        record_type = record.get('type')
+        if record_type == 'data':
+            if self.endpoints is not None and record.get('endpoint') not in self.endpoints:
+                return False
+            if self.fds is not None and record.get('fd') not in self.fds:
+                return False
+            if self.since_seq is not None and record.get('seq', 0) < self.since_seq:
+                return False
+            if self.until_seq is not None and record.get('seq', 0) >= self.until_seq:
+                return False
+            if self.pattern is not None and self.pattern.search(record.get('data', "")) is None:
+                return False
+        elif record_type != 'marker' or self.pattern is not None:
+            return False
+
+        if self.until_time is not None:
+            date, time = self.until_time
+            if date is not None and record.get('date', "") != date:
+                if record.get('date', "") > date:
+                    return False
+            elif record.get('time', "") >= time:
+                return False
+
+        if self.since_time is not None:
+            date, time = self.since_time
+            if date is not None and record.get('date', "") != date:
+                return record.get('date', "") > date
+            return record.get('time', "") >= time
+        return True
+
+    def is_past(self, record):
+        # Tells if the record, and so all the following ones, are after the
+        # upper limits
+        if self.until_seq is not None and record.get('type') == 'data' and record.get('seq', 0) >= self.until_seq:
+            return True
+        if self.until_time is not None and self.until_time[0] is not None:
+            return (record.get('date', ""), record.get('time', "")) >= self.until_time
+        return False
+
+    @staticmethod
+    def _timestamp(limit, now):
+        if limit is None:
+            return None
+        date, time = limit
+        if date is not None:
+            return datetime.strptime("%s %s" % (date, time), TIME_FORMAT).timestamp()
+        return _latest_occurrence(time, now or datetime.now()).timestamp()
+
+    def since_timestamp(self, now=None):
+        # The time limit as a timestamp, for finding the records on the disk;
+        # a time without a date is its latest occurrence
+        return self._timestamp(self.since_time, now)
+
+    def until_timestamp(self, now=None):
+        return self._timestamp(self.until_time, now)
+
+
+class PendingFilter:
+    # Holds the live records back from a client while its history is sent
+    def matches(self, record):
+        return False
@@ -0,0 +1,647 @@
+from bisect import bisect_left, bisect_right
+from collections import deque, OrderedDict
+from queue import Queue
+from time import monotonic, time
+import json
+import lzma
+import mmap
+import os
+import struct
+import threading as thrd
+import zlib
+from utils import info, warning
+from server.record_filter import record_timestamp
+from server.token_filter import BloomFilter, tokenize
+
+SEGMENT_SUFFIX = ".seg"
+COMPRESSED_SEGMENT_SUFFIX = ".zseg"
+TEMPORARY_SUFFIX = ".tmp"
+DATA_RECORD_PREFIX = b'{"type": "data"'
+
+# A compressed segment starts with the magic and the id of the method. Then
+# come the blocks of whole records, compressed independently of each other.
+# Each block has a header with its compressed and raw sizes, the lowest
+# possible seq of its records, the seq after them, the times of its first
+# and last records, and the size of the bloom filter of the tokens of its
+# records, which follows the header. Segments of the first version have no
+# filters.
+COMPRESSED_SEGMENT_MAGIC = b"LWZ2"
+COMPRESSED_SEGMENT_MAGIC_V1 = b"LWZ1"
+BLOCK_HEADER = struct.Struct("<IIqqddI")
+BLOCK_HEADER_V1 = struct.Struct("<IIqqdd")
+COMPRESSION_METHODS = {"zlib": 1, "lzma": 2}
+COMPRESSORS = {1: zlib.compress, 2: lzma.compress}
+DECOMPRESSORS = {1: zlib.decompress, 2: lzma.decompress}
+
+
+def _make_filter(lines):
+    # The filter of the tokens of the data of the records
+    tokens = set()
+    for line in lines:
+        if line.startswith(DATA_RECORD_PREFIX):
+            tokens.update(tokenize(json.loads(line)['data']))
+    return BloomFilter.build(tokens)
+
+
+class Segment:
+    def __init__(self, number, path):
+        self.number = number
+        self.path = path
+        # Positions within a segment are offsets in its records, which stay
+        # the same when it is compressed
+        self.size = 0
+        # Sparse index: (lowest possible seq, timestamp, offset) of the
+        # records starting at the offset; the first entry is at offset 0
+        self.index = []
+        self.last_time = None
+        # Compressed segments have an index entry for every block, and the
+        # (offset, size, file offset, compressed size, filter offset,
+        # filter size) of the blocks
+        self.blocks = None
+        # Bloom filters of the plain segments, by the offset of the index
+        # entry they are for; made when the segment is first searched
+        self.filters = {}
+        self.method = None
+        self.compressed_size = None
+
+    def get_disk_size(self):
+        return self.compressed_size if self.blocks is not None else self.size
+
+
+class RecordStore:
+    # Append-only store of the broadcast records: segment files with one
+    # JSON record per line, found through a sparse index held in memory.
+    # Appends are buffered and synced to the disk every fsync_interval
+    # seconds by the periodic calls of sync(), never by the appending thread;
+    # readers see everything appended before they started, as the buffer is
+    # flushed for them. Full segments may be
+    # compressed in the background, in blocks of block_size bytes of records;
+    # recently read blocks are kept decompressed.
+    INDEX_INTERVAL = 64 * 1024
+    WRITE_BUFFER_SIZE = 1 << 20
+    BLOCK_CACHE_SIZE = 64
+    SEGMENT_NAME_FORMAT = "%010d" + SEGMENT_SUFFIX
+    COMPRESSED_SEGMENT_NAME_FORMAT = "%010d" + COMPRESSED_SEGMENT_SUFFIX
+
+    def __init__(self, directory, segment_size=64 << 20, max_size=None, max_age=None, fsync_interval=1.0,
+                 compression=None, block_size=64 * 1024):
+        self._directory = directory
+        self._segment_size = segment_size
+        self._max_size = max_size
+        self._max_age = max_age
+        self._fsync_interval = fsync_interval
+        self._lock = thrd.Lock()
+        self._segments = []
+        self._file = None
+        self._next_seq = 0
+        self._since_index = self.INDEX_INTERVAL
+        self._last_record_time = None
+        self._dirty = False
+        self._last_sync = monotonic()
+        # Duplicated descriptors of the files flushed but not synced yet
+        self._unsynced_fds = []
+        self._compression = COMPRESSION_METHODS[compression] if compression is not None else None
+        self._block_size = block_size
+        self._compress_queue = Queue()
+        self._block_cache = OrderedDict()
+        self._cache_lock = thrd.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._apply_retention()
+        info("Record store in %s: %d segment(s), %d bytes, next seq %d" % (
+            directory, len(self._segments), self.get_size(), self._next_seq))
+        if self._compression is not None:
+            thrd.Thread(target=self._compression_worker, daemon=True).start()
+
+    def _load(self):
+        paths = {}
+        for name in sorted(os.listdir(self._directory)):
+            path = os.path.join(self._directory, name)
+            if name.endswith(TEMPORARY_SUFFIX):
+                # Left by an interrupted compression
+                os.unlink(path)
+                continue
+            for suffix in [SEGMENT_SUFFIX, COMPRESSED_SEGMENT_SUFFIX]:
+                if name.endswith(suffix) and name[:-len(suffix)].isdigit():
+                    paths.setdefault(int(name[:-len(suffix)]), {})[suffix] = path
+
+        for number in sorted(paths):
+            if COMPRESSED_SEGMENT_SUFFIX in paths[number]:
+                # The compressed segment is complete once renamed, but the
+                # plain one might not have been removed yet
+                if SEGMENT_SUFFIX in paths[number]:
+                    os.unlink(paths[number][SEGMENT_SUFFIX])
+                segment = Segment(number, paths[number][COMPRESSED_SEGMENT_SUFFIX])
+                self._scan_compressed(segment)
+            else:
+                segment = Segment(number, paths[number][SEGMENT_SUFFIX])
+                self._scan(segment)
+            self._segments.append(segment)
+
+        closed = self._segments
+        if len(self._segments) > 0 and self._segments[-1].blocks is None:
+            active = self._segments[-1]
+            closed = self._segments[:-1]
+            self._file = open(active.path, 'ab', buffering=self.WRITE_BUFFER_SIZE)
+            self._since_index = active.size - active.index[-1][2] if len(active.index) > 0 else self.INDEX_INTERVAL
+        if self._compression is not None:
+            for segment in closed:
+                if segment.blocks is None:
+                    self._compress_queue.put(segment)
+
+    def _scan(self, segment):
+        # Rebuilds the index of a segment; a record left incomplete by a
+        # crash is cut off
+        last_data_line = None
+        last_line = None
+        offset = 0
+        since_index = self.INDEX_INTERVAL
+        pending_index = False
+        with open(segment.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    warning("Dropping an incomplete record at the end of %s" % segment.path)
+                    break
+                is_data = line.startswith(DATA_RECORD_PREFIX)
+                if since_index >= self.INDEX_INTERVAL or pending_index:
+                    record = json.loads(line)
+                    if is_data:
+                        seq = record['seq']
+                    elif last_data_line is not None:
+                        seq = json.loads(last_data_line)['seq'] + 1
+                    else:
+                        seq = self._next_seq
+                    timestamp = record_timestamp(record)
+                    # Index entries need the time; records without it are
+                    # indexed at the next one
+                    pending_index = timestamp is None
+                    if not pending_index:
+                        segment.index.append((seq, timestamp, offset))
+                    since_index = 0
+                if is_data:
+                    last_data_line = line
+                last_line = line
+                since_index += len(line)
+                offset += len(line)
+
+        if offset < os.path.getsize(segment.path):
+            os.truncate(segment.path, offset)
+        segment.size = offset
+        if last_data_line is not None:
+            self._next_seq = json.loads(last_data_line)['seq'] + 1
+        if last_line is not None:
+            segment.last_time = record_timestamp(json.loads(last_line))
+
+    def _scan_compressed(self, segment):
+        file_size = os.path.getsize(segment.path)
+        segment.blocks = []
+        segment.compressed_size = file_size
+        with open(segment.path, 'rb') as file:
+            header = file.read(len(COMPRESSED_SEGMENT_MAGIC) + 1)
+            if header[:-1] == COMPRESSED_SEGMENT_MAGIC:
+                block_header = BLOCK_HEADER
+            elif header[:-1] == COMPRESSED_SEGMENT_MAGIC_V1:
+                block_header = BLOCK_HEADER_V1
+            else:
+                block_header = None
+            if block_header is None or header[-1] not in DECOMPRESSORS:
+                warning("%s is not a compressed segment, ignoring its records" % segment.path)
+                return
+            segment.method = header[-1]
+            file_offset = len(header)
+            while file_offset + block_header.size <= file_size:
+                compressed_size, raw_size, first_seq, next_seq, first_time, last_time, *filter_size = \
+                    block_header.unpack(file.read(block_header.size))
+                filter_size = filter_size[0] if len(filter_size) > 0 else 0
+                file_offset += block_header.size
+                if file_offset + filter_size + compressed_size > file_size:
+                    warning("Dropping an incomplete block at the end of %s" % segment.path)
+                    break
+                segment.blocks.append((segment.size, raw_size, file_offset + filter_size, compressed_size,
+                                       file_offset, filter_size))
+                file_offset += filter_size
+                segment.index.append((first_seq, first_time, segment.size))
+                segment.size += raw_size
+                segment.last_time = last_time
+                self._next_seq = max(self._next_seq, next_seq)
+                file_offset += compressed_size
+                file.seek(file_offset)
+
+    def _split_blocks(self, source):
+        # Yields the lines of every block, with their size
+        lines = []
+        size = 0
+        for line in source:
+            lines.append(line)
+            size += len(line)
+            if size >= self._block_size:
+                yield lines, size
+                lines = []
+                size = 0
+        if len(lines) > 0:
+            yield lines, size
+
+    def _encode_block(self, lines, next_seq, last_time):
+        # Returns the block with its header, its index entry, and the seq
+        # and the time of the last record
+        first = json.loads(lines[0])
+        first_seq = first['seq'] if first.get('type') == 'data' else next_seq
+        first_time = record_timestamp(first)
+        if first_time is None:
+            first_time = last_time
+        for line in reversed(lines):
+            if line.startswith(DATA_RECORD_PREFIX):
+                next_seq = json.loads(line)['seq'] + 1
+                break
+        last_time = record_timestamp(json.loads(lines[-1]))
+        if last_time is None:
+            last_time = first_time
+
+        data = b"".join(lines)
+        compressed = COMPRESSORS[self._compression](data)
+        bloom = _make_filter(lines).to_bytes()
+        header = BLOCK_HEADER.pack(len(compressed), len(data), first_seq, next_seq, first_time, last_time,
+                                   len(bloom))
+        return header + bloom + compressed, (first_seq, first_time), next_seq, last_time
+
+    def _compress_segment(self, segment):
+        path = os.path.join(self._directory, self.COMPRESSED_SEGMENT_NAME_FORMAT % segment.number)
+        temporary_path = path + TEMPORARY_SUFFIX
+        blocks = []
+        index = []
+        with open(segment.path, 'rb') as source, open(temporary_path, 'wb') as target:
+            target.write(COMPRESSED_SEGMENT_MAGIC + bytes([self._compression]))
+            file_offset = len(COMPRESSED_SEGMENT_MAGIC) + 1
+            raw_offset = 0
+            next_seq = segment.index[0][0] if len(segment.index) > 0 else 0
+            last_time = segment.index[0][1] if len(segment.index) > 0 else 0.0
+            for lines, size in self._split_blocks(source):
+                block, (first_seq, first_time), next_seq, last_time = self._encode_block(lines, next_seq, last_time)
+                target.write(block)
+                filter_size = BLOCK_HEADER.unpack_from(block)[-1]
+                filter_offset = file_offset + BLOCK_HEADER.size
+                blocks.append((raw_offset, size, filter_offset + filter_size,
+                               len(block) - BLOCK_HEADER.size - filter_size, filter_offset, filter_size))
+                index.append((first_seq, first_time, raw_offset))
+                file_offset += len(block)
+                raw_offset += size
+            target.flush()
+            os.fsync(target.fileno())
+        os.rename(temporary_path, path)
+
+        with self._lock:
+            if segment not in self._segments:
+                # Removed by the retention in the meantime
+                os.unlink(path)
+                return
+            plain_path = segment.path
+            segment.path = path
+            segment.blocks = blocks
+            segment.index = index
+            segment.method = self._compression
+            segment.compressed_size = file_offset
+            segment.filters = {}
+            os.unlink(plain_path)
+        info("Compressed segment %s of the record store: %d -> %d bytes" % (path, segment.size, file_offset))
+
+    def _compression_worker(self):
+        while True:
+            segment = self._compress_queue.get()
+            try:
+                self._compress_segment(segment)
+            except FileNotFoundError:
+                # Removed by the retention before it was compressed
+                pass
+            except OSError as ex:
+                warning("Cannot compress segment %s of the record store: %s" % (segment.path, ex))
+            finally:
+                self._compress_queue.task_done()
+
+    def wait_for_compression(self):
+        self._compress_queue.join()
+
+    def _open_segment(self):
+        number = self._segments[-1].number + 1 if len(self._segments) > 0 else 0
+        segment = Segment(number, os.path.join(self._directory, self.SEGMENT_NAME_FORMAT % number))
+        self._file = open(segment.path, 'ab', buffering=self.WRITE_BUFFER_SIZE)
+        self._segments.append(segment)
+        self._since_index = self.INDEX_INTERVAL
+        return segment
+
+    def _close_segment(self):
+        self._file.flush()
+        self._unsynced_fds.append(os.dup(self._file.fileno()))
+        self._file.close()
+        self._file = None
+        if self._last_record_time is not None:
+            date, time_of_day = self._last_record_time
+            self._segments[-1].last_time = record_timestamp({"date": date, "time": time_of_day})
+
+    def append(self, record):
+        if 'trace' in record:
+            record = {key: value for key, value in record.items() if key != 'trace'}
+        line = bytes(json.dumps(record), 'utf-8') + b"\n"
+        is_data = record.get('type') == 'data'
+
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            elif self._segments[-1].size + len(line) > self._segment_size and self._segments[-1].size > 0:
+                self._close_segment()
+                if self._compression is not None:
+                    self._compress_queue.put(self._segments[-1])
+                self._open_segment()
+                self._apply_retention()
+
+            segment = self._segments[-1]
+            if self._since_index >= self.INDEX_INTERVAL:
+                timestamp = record_timestamp(record)
+                if timestamp is not None:
+                    seq = record['seq'] if is_data else self._next_seq
+                    segment.index.append((seq, timestamp, segment.size))
+                    self._since_index = 0
+
+            self._file.write(line)
+            segment.size += len(line)
+            self._since_index += len(line)
+            if is_data:
+                self._next_seq = record['seq'] + 1
+            self._last_record_time = (record.get('date'), record.get('time'))
+            self._dirty = True
+
+    def _take_unsynced_fds(self):
+        # Flushes the active segment; the files are synced by the caller
+        # without the lock, through their duplicated descriptors, so that
+        # neither the appends nor the readers wait for the disk
+        if self._dirty and self._file is not None:
+            self._file.flush()
+            self._unsynced_fds.append(os.dup(self._file.fileno()))
+        self._dirty = False
+        self._last_sync = monotonic()
+        fds, self._unsynced_fds = self._unsynced_fds, []
+        return fds
+
+    @staticmethod
+    def _sync_fds(fds):
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def sync(self):
+        # Called periodically, so that the records are synced within the
+        # interval even if nothing more is appended
+        fds = []
+        with self._lock:
+            if monotonic() - self._last_sync >= self._fsync_interval:
+                fds = self._take_unsynced_fds()
+            self._apply_retention()
+        self._sync_fds(fds)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+            fds = self._take_unsynced_fds()
+        self._sync_fds(fds)
+
+    def _apply_retention(self):
+        # The active segment is never removed
+        total_size = sum(segment.get_disk_size() for segment in self._segments)
+        oldest_allowed = time() - self._max_age if self._max_age is not None else None
+        while len(self._segments) > 1:
+            oldest = self._segments[0]
+            expired = oldest_allowed is not None and oldest.last_time is not None and oldest.last_time < oldest_allowed
+            if not expired and (self._max_size is None or total_size <= self._max_size):
+                break
+            info("Removing segment %s of the record store" % oldest.path)
+            try:
+                os.unlink(oldest.path)
+            except FileNotFoundError:
+                pass
+            total_size -= oldest.get_disk_size()
+            self._segments.pop(0)
+
+    def get_next_seq(self):
+        return self._next_seq
+
+    def get_size(self):
+        # The size on the disk
+        return sum(segment.get_disk_size() for segment in self._segments)
+
+    def get_statistics(self):
+        with self._lock:
+            statistics = {
+                "directory": self._directory,
+                "segments": len(self._segments),
+                "compressed-segments": sum(1 for segment in self._segments if segment.blocks is not None),
+                "bytes": self.get_size(),
+                "raw-bytes": sum(segment.size for segment in self._segments),
+                "first-seq": self._segments[0].index[0][0] if len(self._segments) > 0 and
+                len(self._segments[0].index) > 0 else None,
+                "next-seq": self._next_seq
+            }
+        with self._cache_lock:
+            statistics["block-cache"] = {
+                "blocks": len(self._block_cache),
+                "hits": self._cache_hits,
+                "misses": self._cache_misses
+            }
+        return statistics
+
+    def end_position(self):
+        # Position after the last record appended so far
+        with self._lock:
+            if self._file is None:
+                return 0, 0
+            self._file.flush()
+            return self._segments[-1].number, self._segments[-1].size
+
+    @staticmethod
+    def _find_entry(entries, since_seq, since_time):
+        # Index of the last entry before which no record can match: the
+        # seq of the entries is the lowest one at or after them, and their
+        # time that of the first record
+        position = 0
+        if since_seq is not None:
+            position = max(position, bisect_right(entries, since_seq, key=lambda entry: entry[0]) - 1)
+        if since_time is not None:
+            position = max(position, bisect_left(entries, since_time, key=lambda entry: entry[1]) - 1)
+        return position
+
+    def find(self, since_seq=None, since_time=None):
+        # Returns the position to read from for the records with the seq
+        # at least since_seq and the timestamp at least since_time
+        with self._lock:
+            segments = [segment for segment in self._segments if len(segment.index) > 0]
+            if len(segments) == 0:
+                return (self._segments[0].number, 0) if len(self._segments) > 0 else (0, 0)
+            if since_seq is None and since_time is None:
+                return segments[0].number, 0
+            segment = segments[self._find_entry([segment.index[0] for segment in segments], since_seq, since_time)]
+            return segment.number, segment.index[self._find_entry(segment.index, since_seq, since_time)][2]
+
+    def get_shards(self, start=(0, 0), end=None, shard_size=8 << 20, until_seq=None, until_time=None):
+        # Splits the records between the positions into shards of about
+        # shard_size bytes, which can be read without the store: (path,
+        # method, blocks, start, end). Compressed segments are split between
+        # their blocks, plain ones between their index entries. The parts
+        # from an index entry past the upper limits on are left out.
+        if end is None:
+            end = self.end_position()
+        shards = []
+        with self._lock:
+            for segment in self._segments:
+                if not start[0] <= segment.number <= end[0]:
+                    continue
+                offset = start[1] if segment.number == start[0] else 0
+                limit = end[1] if segment.number == end[0] else segment.size
+                past = False
+                for seq, timestamp, entry_offset in segment.index:
+                    if (until_seq is not None and seq >= until_seq) or \
+                            (until_time is not None and timestamp >= until_time):
+                        limit = min(limit, entry_offset)
+                        past = True
+                        break
+
+                if segment.blocks is None:
+                    boundaries = sorted(set(entry[2] for entry in segment.index if offset < entry[2] < limit))
+                else:
+                    boundaries = [block[0] for block in segment.blocks if offset < block[0] < limit]
+                shard_start = offset
+                for boundary in boundaries + [limit]:
+                    if boundary - shard_start < shard_size and boundary != limit or boundary <= shard_start:
+                        continue
+                    blocks = None
+                    if segment.blocks is not None:
+                        blocks = [block for block in segment.blocks
+                                  if block[0] < boundary and block[0] + block[1] > shard_start]
+                    shards.append((segment.path, segment.method, blocks,
+                                   (segment.number, shard_start), (segment.number, boundary)))
+                    shard_start = boundary
+                if past:
+                    break
+        return shards
+
+    def scan(self, start=(0, 0), end=None, tokens=None):
+        # Yields the encoded records between the positions, each with the
+        # position after it; the default end is the one at the time of the
+        # call. Segments removed in the meantime are skipped. With tokens,
+        # blocks whose filters tell that they lack any of them are skipped.
+        if end is None:
+            end = self.end_position()
+        with self._lock:
+            segments = [segment for segment in self._segments if start[0] <= segment.number <= end[0]]
+
+        for segment in segments:
+            offset = start[1] if segment.number == start[0] else 0
+            # The file is opened with the lock held, so that it is not
+            # replaced by the compressed one in the meantime
+            with self._lock:
+                if segment not in self._segments:
+                    continue
+                limit = end[1] if segment.number == end[0] else segment.size
+                if limit <= offset:
+                    continue
+                blocks = segment.blocks
+                method = segment.method
+                # The filter of the last part of the active segment would
+                # miss the records appended later
+                complete_size = segment.size if segment is not self._segments[-1] or self._file is None else None
+                chunks = sorted(set([0] + [entry[2] for entry in segment.index])) if tokens else [0]
+                file = open(segment.path, 'rb')
+
+            with file:
+                if blocks is None:
+                    yield from self._scan_plain(file, segment, chunks, complete_size, offset, limit, tokens)
+                else:
+                    yield from self._scan_blocks(file, segment.number, blocks, method, offset, limit, tokens)
+
+    @staticmethod
+    def _scan_plain(file, segment, chunks, complete_size, offset, limit, tokens):
+        # The segment is read in the parts between its index entries
+        with mmap.mmap(file.fileno(), limit, access=mmap.ACCESS_READ) as data:
+            for ix, chunk_start in enumerate(chunks):
+                chunk_end = chunks[ix + 1] if ix + 1 < len(chunks) else complete_size
+                if chunk_start >= limit:
+                    break
+                if chunk_end is not None and chunk_end <= offset:
+                    continue
+                position = max(offset, chunk_start)
+                chunk_limit = min(chunk_end, limit) if chunk_end is not None else limit
+
+                if tokens:
+                    bloom = segment.filters.get(chunk_start)
+                    if bloom is None:
+                        bloom = _make_filter(data[chunk_start:chunk_limit].splitlines(keepends=True))
+                        if chunk_end is not None and chunk_end <= limit:
+                            segment.filters[chunk_start] = bloom
+                    if not bloom.might_contain_all(tokens):
+                        continue
+
+                while position < chunk_limit:
+                    line_end = data.find(b"\n", position, chunk_limit)
+                    if line_end == -1:
+                        break
+                    yield data[position:line_end], (segment.number, line_end + 1)
+                    position = line_end + 1
+
+    def _scan_blocks(self, file, number, blocks, method, offset, limit, tokens):
+        # Only the blocks with the records between the offsets are read
+        first = max(bisect_right(blocks, offset, key=lambda block: block[0]) - 1, 0)
+        for block_number in range(first, len(blocks)):
+            raw_offset, raw_size, file_offset, compressed_size, filter_offset, filter_size = blocks[block_number]
+            if raw_offset >= limit:
+                break
+            if tokens and filter_size > 0:
+                file.seek(filter_offset)
+                if not BloomFilter(file.read(filter_size)).might_contain_all(tokens):
+                    continue
+            data = self._read_block(file, (number, block_number), file_offset, compressed_size, method)
+            position = max(offset - raw_offset, 0)
+            block_limit = min(limit - raw_offset, raw_size)
+            while position < block_limit:
+                line_end = data.find(b"\n", position, block_limit)
+                if line_end == -1:
+                    break
+                yield data[position:line_end], (number, raw_offset + line_end + 1)
+                position = line_end + 1
+
+    def _read_block(self, file, key, file_offset, compressed_size, method):
+        with self._cache_lock:
+            data = self._block_cache.get(key)
+            if data is not None:
+                self._block_cache.move_to_end(key)
+                self._cache_hits += 1
+                return data
+            self._cache_misses += 1
+
+        file.seek(file_offset)
+        data = DECOMPRESSORS[method](file.read(compressed_size))
+        with self._cache_lock:
+            self._block_cache[key] = data
+            while len(self._block_cache) > self.BLOCK_CACHE_SIZE:
+                self._block_cache.popitem(last=False)
+        return data
+
+    def read(self, start=(0, 0), end=None, tokens=None):
+        for line, _ in self.scan(start, end, tokens):
+            yield line
+
+    def tail(self, count):
+        # The last records, for filling the late-join buffer after a restart
+        with self._lock:
+            numbers = [segment.number for segment in self._segments]
+        end = self.end_position()
+        records = deque(maxlen=count)
+        for first in range(len(numbers) - 1, -1, -1):
+            records.clear()
+            for line in self.read((numbers[first], 0), end):
+                records.append(line)
+            if len(records) >= count:
+                break
+        return list(records)
@@ -24,6 +24,9 @@ class ByBracketsSeparator:
                     quoting = not quoting
             self._data += data[remainder_index:]
 
+        def buffered_size(self):
+            return len(self._data)
+
         def get_pending_events(self):
             return self._pending_events
 
@@ -46,3 +49,5 @@ class ByBracketsSeparator:
             self._on_event_cb(fd, d)
         self._analysis_contexts[fd].clear_pending_events()
 
+    def buffered_size(self):
+        return sum(context.buffered_size() for context in list(self._analysis_contexts.values()))
@@ -20,3 +20,5 @@ class ByNewlineSeparator:
             else:
                 break
 
+    def buffered_size(self):
+        return sum(len(data) for data in list(self._recv_buf.values()))
@@ -2,7 +2,10 @@ from utils import info, error
 from collections import deque
 import json
 from datetime import datetime
-from time import sleep
+from time import sleep, perf_counter_ns, monotonic_ns
+import threading as thrd
+from server.statistics import RateCounter, LatencyStatistics
+from tracing import get_read_stamp
 
 class ServiceManager:
     def __init__(self):
@@ -11,6 +14,14 @@ class ServiceManager:
         self._default_marker_no = 1
         self._late_join_buf = deque()
         self._late_join_buf_size = 256
+        # Held while the records are broadcast and added to the late-join
+        # buffer; may be held by a server which sends the buffer
+        self._records_lock = thrd.RLock()
+        self._records = RateCounter()
+        self._broadcast_latency = LatencyStatistics()
+        self._trace_latency = False
+        self._recorder = None
+        self._store = None
 
     def set_late_join_buf_size(self, size):
         if size is not None:
@@ -19,6 +30,25 @@ class ServiceManager:
         else:
             info("No late joiners buffer size configured, using default of %d records" % self._late_join_buf_size)
 
+    def set_trace_latency(self, enabled):
+        self._trace_latency = enabled
+        for server in self._servers:
+            server.set_trace_latency(enabled)
+
+    def set_session_recorder(self, recorder):
+        self._recorder = recorder
+
+    def set_record_store(self, store):
+        # Numbering continues after the records kept from the previous runs,
+        # which also fill the late-join buffer
+        self._store = store
+        self._line_seq_no = max(self._line_seq_no, store.get_next_seq())
+        for line in store.tail(self._late_join_buf_size):
+            self.add_to_late_join_buf(json.loads(line))
+
+    def get_record_store(self):
+        return self._store
+
     def add_to_late_join_buf(self, record):
         while len(self._late_join_buf) >= self._late_join_buf_size:
             self._late_join_buf.popleft()
@@ -52,10 +82,20 @@ class ServiceManager:
     def stop_all(self):
         for server in self._servers:
             server.stop()
+        with self._records_lock:
+            if self._recorder is not None:
+                self._recorder.close()
+                self._recorder = None
+            if self._store is not None:
+                self._store.close()
 
     def broadcast_data(self, endpoint_name, action_name, fd, data):
         today = datetime.now()
-        for server in self._servers:
+        start_ns = perf_counter_ns()
+        if self._trace_latency:
+            emit_ns = monotonic_ns()
+            read_ns = get_read_stamp() or emit_ns
+        with self._records_lock:
             record = {
                 "type": "data",
                 "endpoint": endpoint_name,
@@ -66,16 +106,36 @@ class ServiceManager:
                 "date": today.strftime("%Y-%m-%d"),
                 "time": today.strftime("%H:%M:%S")
             }
-            server.broadcast(json.dumps(record))
-            self.add_to_late_join_buf(record)
-        self._line_seq_no += 1
+            for server in self._servers:
+                if self._trace_latency:
+                    enqueue_ns = monotonic_ns()
+                    record['trace'] = [read_ns, emit_ns, enqueue_ns]
+                    server.broadcast_record(record, enqueue_ns)
+                else:
+                    server.broadcast_record(record)
+                self.add_to_late_join_buf(record)
+            if self._store is not None:
+                self._store.append(record)
+            if self._recorder is not None:
+                self._recorder.record_data(endpoint_name, action_name, fd, data)
+            self._line_seq_no += 1
+            self._records.add(len(data))
+            self._broadcast_latency.add(perf_counter_ns() - start_ns)
 
     def broadcast_keepalive(self, seq_no, **extra_info):
+        if self._recorder is not None:
+            with self._records_lock:
+                self._recorder.flush()
+        if self._store is not None:
+            self._store.sync()
         for server in self._servers:
             data = {
                 **{"type": "keepalive", "seq": seq_no},
                 **extra_info}
-            server.broadcast(json.dumps(data))
+            if self._trace_latency:
+                server.broadcast_with_write_latency(data)
+            else:
+                server.broadcast(json.dumps(data))
 
     def broadcast_marker(self, name):
         today = datetime.now()
@@ -84,18 +144,76 @@ class ServiceManager:
             name = "MARKER %d" % self._default_marker_no
             self._default_marker_no += 1
 
-        for server in self._servers:
+        with self._records_lock:
             record = {
                 "type": "marker",
                 "name": name,
                 "date": today.strftime("%Y-%m-%d"),
                 "time": today.strftime("%H:%M:%S")
             }
-            server.broadcast(json.dumps(record))
-            self.add_to_late_join_buf(record)
+            for server in self._servers:
+                server.broadcast_record(record)
+                self.add_to_late_join_buf(record)
+            if self._store is not None:
+                self._store.append(record)
+            if self._recorder is not None:
+                self._recorder.record_marker(name)
+
+    def get_statistics(self):
+        with self._records_lock:
+            return {
+                "records": self._records.to_dict(),
+                "broadcast-latency": self._broadcast_latency.to_dict(),
+                "late-join-buffer": {
+                    "records": len(self._late_join_buf),
+                    "capacity": self._late_join_buf_size
+                },
+                "servers": [server.get_statistics() for server in self._servers],
+                "record-store": self._store.get_statistics() if self._store is not None else None
+            }
+
+    def get_rates_summary(self):
+        # Compact form carried by the keepalive records
+        rates = self._records.rates()['1s']
+        return {"records-per-s": rates['count'], "bytes-per-s": rates['bytes']}
 
-    def send_late_join_records(self, server, client_addr):
-        info("Sending previous %d lines to %s:%s" % (len(self._late_join_buf), client_addr[0], client_addr[1]))
-        for rec in self._late_join_buf:
-            server.send(client_addr, json.dumps(rec))
+    def records_lock(self):
+        return self._records_lock
+
+    def find_late_join_records(self, since_seq=None, since_time=None):
+        # Returns a copy of the late-join buffer and the index of the first
+        # record that may be at or after the limits, found by binary search.
+        # Markers are placed by the data record following them.
+        with self._records_lock:
+            records = list(self._late_join_buf)
+
+        def is_before(ix):
+            if since_time is not None and (records[ix].get('date', ""), records[ix].get('time', "")) < since_time:
+                return True
+            if since_seq is not None:
+                while ix < len(records) and records[ix].get('type') != 'data':
+                    ix += 1
+                return ix < len(records) and records[ix].get('seq', 0) < since_seq
+            return False
+
+        low, high = 0, len(records)
+        while low < high:
+            middle = (low + high) // 2
+            if is_before(middle):
+                low = middle + 1
+            else:
+                high = middle
+        return records, low
+
+    def send_late_join_records(self, server, client_addr, record_filter=None):
+        with self._records_lock:
+            records = self._late_join_buf
+            if record_filter is not None:
+                records = [rec for rec in records if record_filter.matches(rec)]
+            info("Sending previous %d lines to %s:%s" % (len(records), client_addr[0], client_addr[1]))
+            for rec in records:
+                if 'trace' in rec:
+                    # The stamps would tell how long the record waited here
+                    rec = {key: value for key, value in rec.items() if key != 'trace'}
+                server.send(client_addr, json.dumps(rec))
 
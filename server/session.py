@@ -0,0 +1,149 @@
+from datetime import datetime
+from time import monotonic
+import gzip
+import json
+import threading as thrd
+from utils import info, error, warning
+from server.statistics import RateCounter
+
+# Session files start with a header line, followed by one JSON array per
+# record: the time since the start of the recording in microseconds, the
+# kind of the record and its fields. Files with the .gz suffix are
+# compressed.
+SESSION_FORMAT = "lwsession"
+SESSION_VERSION = 1
+KIND_DATA = "d"
+KIND_MARKER = "m"
+
+
+def _open_session_file(filename, mode):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t", encoding="utf-8")
+    return open(filename, mode, encoding="utf-8", buffering=1 << 20)
+
+
+def _encode(entry):
+    return json.dumps(entry, separators=(',', ':')) + "\n"
+
+
+class SessionRecorder:
+    # Not synchronized; the records are written with the records lock of
+    # the service manager held
+    def __init__(self, filename, now=None):
+        self._filename = filename
+        self._file = _open_session_file(filename, "w")
+        self._start = monotonic() if now is None else now
+        self._file.write(_encode({
+            "format": SESSION_FORMAT,
+            "version": SESSION_VERSION,
+            "start": datetime.now().isoformat(timespec='milliseconds')
+        }))
+        info("Recording the session to %s" % filename)
+
+    def _offset(self, now):
+        return int(((monotonic() if now is None else now) - self._start) * 1000000)
+
+    def record_data(self, endpoint, source, fd, data, now=None):
+        self._file.write(_encode([self._offset(now), KIND_DATA, endpoint, source, fd, data]))
+
+    def record_marker(self, name, now=None):
+        self._file.write(_encode([self._offset(now), KIND_MARKER, name]))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        info("Session recorded to %s" % self._filename)
+
+
+def read_session(filename):
+    # Yields the entries of a session file as lists
+    with _open_session_file(filename, "r") as file:
+        header = json.loads(file.readline() or "{}")
+        if header.get('format') != SESSION_FORMAT:
+            raise ValueError("%s is not a session file" % filename)
+        if header.get('version') != SESSION_VERSION:
+            raise ValueError("Unsupported version of the session file: %s" % header.get('version'))
+        for line in file:
+            yield json.loads(line)
+
+
+class ReplayCommunication:
+    # Plays a recorded session back; the records keep the endpoints, the
+    # descriptors and the markers of the original session. speed is the
+    # multiplier of the original pace; 0 plays the records without delays.
+    def __init__(self, config, action_name, on_record_cb: callable, on_marker_cb: callable):
+        self._filename = config.filename
+        self._speed = config.speed
+        self._action_name = action_name
+        self._on_record_cb = on_record_cb
+        self._on_marker_cb = on_marker_cb
+        self._on_command_finished = None
+        self._worker_thread = None
+        self._active = False
+        self._stop_event = thrd.Event()
+        self._counter = RateCounter()
+
+    def __str__(self):
+        return "replay of %s at %s" % (self._filename, "%gx" % self._speed if self._speed > 0 else "full speed")
+
+    def run(self):
+        self._worker_thread = thrd.Thread(target=self._worker)
+        self._worker_thread.start()
+
+    def set_command_finished_callback(self, cb: callable):
+        self._on_command_finished = cb
+
+    def wait(self):
+        self._worker_thread.join()
+
+    def _worker(self):
+        self._active = True
+        info("%s: replaying %s" % (self._action_name, self._filename))
+        exitcode = 0
+        try:
+            self._replay()
+        except (OSError, ValueError) as ex:
+            error("%s: cannot replay %s: %s" % (self._action_name, self._filename, ex))
+            exitcode = 1
+
+        info("%s: replay finished, %d records" % (self._action_name, self._counter.total_count))
+        self._active = False
+        if self._on_command_finished is not None:
+            self._on_command_finished(exitcode)
+
+    def _replay(self):
+        start = monotonic()
+        for entry in read_session(self._filename):
+            if self._stop_event.is_set():
+                break
+            if self._speed > 0:
+                delay = start + entry[0] / 1000000 / self._speed - monotonic()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+
+            if entry[1] == KIND_DATA:
+                _, _, endpoint, source, fd, data = entry
+                self._counter.add(len(data))
+                self._on_record_cb(endpoint, source, fd, data)
+            elif entry[1] == KIND_MARKER:
+                self._on_marker_cb(entry[2])
+
+    def stop(self):
+        self._stop_event.set()
+
+    def send(self, data):
+        warning("%s: a replayed session does not accept any input" % self._action_name)
+
+    def send_raw(self, data, echo=False, on_written=None):
+        if data is not None:
+            warning("%s: a replayed session does not accept any input" % self._action_name)
+        if on_written is not None:
+            on_written()
+
+    def is_active(self):
+        return self._active
+
+    def get_statistics(self):
+        return {"replayed": self._counter.to_dict()}
@@ -0,0 +1,79 @@
+from time import monotonic
+
+
+class RateCounter:
+    # Counts events and their sizes in one-second buckets. Counters are
+    # updated without locking; each one is meant to be updated by a single
+    # thread, and the readers accept slightly stale values.
+    WINDOWS = [1, 10, 60]
+    HISTORY = 61
+
+    def __init__(self, now=None):
+        self.total_count = 0
+        self.total_size = 0
+        self._counts = [0] * self.HISTORY
+        self._sizes = [0] * self.HISTORY
+        self._second = int(monotonic() if now is None else now)
+
+    def _advance(self, now):
+        second = int(now)
+        if second <= self._second:
+            return
+        for step in range(1, min(second - self._second, self.HISTORY) + 1):
+            ix = (self._second + step) % self.HISTORY
+            self._counts[ix] = 0
+            self._sizes[ix] = 0
+        self._second = second
+
+    def add(self, size=0, count=1, now=None):
+        self._advance(monotonic() if now is None else now)
+        ix = self._second % self.HISTORY
+        self._counts[ix] += count
+        self._sizes[ix] += size
+        self.total_count += count
+        self.total_size += size
+
+    def rates(self, now=None):
+        # Events and bytes per second over the last complete seconds. Does
+        # not modify the buckets, so it may be called from any thread.
+        current = int(monotonic() if now is None else now)
+        last_written = self._second
+        result = {}
+        for window in self.WINDOWS:
+            count = 0
+            size = 0
+            for second in range(current - window, current):
+                # Buckets after the last update have not been cleared yet
+                if last_written - self.HISTORY < second <= last_written:
+                    ix = second % self.HISTORY
+                    count += self._counts[ix]
+                    size += self._sizes[ix]
+            result["%ds" % window] = {"count": count / window, "bytes": size / window}
+        return result
+
+    def to_dict(self, now=None):
+        return {
+            "count": self.total_count,
+            "bytes": self.total_size,
+            "rates": self.rates(now)
+        }
+
+
+class LatencyStatistics:
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "avg-us": self.total_ns / self.count / 1000 if self.count > 0 else 0,
+            "max-us": self.max_ns / 1000
+        }
@@ -1,10 +1,13 @@
-from queue import Queue
+from queue import Queue, Empty
+import codecs
 import threading as thrd
 from utils import info, debug, error
 import subprocess as sp
-from time import sleep
 import os
 import signal
+from server.statistics import RateCounter
+from time import monotonic_ns
+from tracing import set_read_stamp
 
 class SubprocessCommunication:
     def __init__(self, command_line, action_name, on_data_emit_cb: callable):
@@ -16,6 +19,15 @@ class SubprocessCommunication:
         self._on_command_finished = None
         self._pid = None
         self._on_data_emit_cb = on_data_emit_cb
+        self._counters = {fd: RateCounter() for fd in ['stdout', 'stderr', 'stdin']}
+        # Set once the process has ended; the data sent afterwards is only
+        # acknowledged
+        self._stdin_closed = False
+        self._stdin_lock = thrd.Lock()
+        # Echoed data is emitted by lines; chunks of piped bytes may end in
+        # the middle of a line or of a character
+        self._echo_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._echo_pending = ""
 
     def run(self):
         self._worker_thread = thrd.Thread(target=self._worker)
@@ -71,24 +83,82 @@ class SubprocessCommunication:
                 error("%s: %s" % (self._action_name, str(ex)))
 
     def send(self, data):
-        self._stdin_buffer.put(data)
+        self.send_raw(data, True)
+
+    def send_raw(self, data, echo=False, on_written=None):
+        # Data may be bytes; on_written is called once the data is passed to
+        # the process, or dropped when it has ended. None as data only calls
+        # on_written after all the data queued before.
+        with self._stdin_lock:
+            if not self._stdin_closed:
+                self._stdin_buffer.put((data, echo, on_written))
+                return
+        if data is not None:
+            error("%s: the process has ended, dropping %d bytes of input" % (self._action_name, len(data)))
+        if on_written is not None:
+            on_written()
 
     def is_active(self):
         return self._active
 
+    def get_statistics(self):
+        result = {fd: counter.to_dict() for fd, counter in self._counters.items()}
+        result['stdin-queue'] = self._stdin_buffer.qsize()
+        return result
+
     def _receiver(self, stream, fd):
+        counter = self._counters[fd]
         for line in stream:
+            set_read_stamp(monotonic_ns())
+            counter.add(len(line))
             self._on_data_emit_cb(self._action_name, fd, line)
         info("Receiver thread finished for fd=%s" % fd)
 
+    def _echo(self, data):
+        if isinstance(data, bytes):
+            data = self._echo_decoder.decode(data)
+        lines = (self._echo_pending + data).split("\n")
+        self._echo_pending = lines.pop()
+        for line in lines:
+            self._on_data_emit_cb(self._action_name, 'stdin', line + "\n")
+
     def _sender(self, proc, stream):
         while proc.poll() is None:
-            if not self._stdin_buffer.empty():
-                line = self._stdin_buffer.get()
-                stream.write(line)
-                self._on_data_emit_cb(self._action_name, 'stdin', line)
+            try:
+                data, echo, on_written = self._stdin_buffer.get(timeout=0.1)
+            except Empty:
+                continue
+
+            try:
+                if isinstance(data, bytes):
+                    stream.flush()
+                    stream.buffer.write(data)
+                elif data is not None:
+                    stream.write(data)
                 stream.flush()
-            else:
-                sleep(0.01)
+            except (BrokenPipeError, ValueError):
+                error("%s: the process does not accept any more input" % self._action_name)
+            if data is not None:
+                self._counters['stdin'].add(len(data))
+
+            if echo and data is not None:
+                self._echo(data)
+            elif data is None and self._echo_pending != "":
+                # The end of a pipe ends its last line
+                self._echo("\n")
+            if on_written is not None:
+                on_written()
+
+        # Whoever waits for the data still queued is told that it is done
+        with self._stdin_lock:
+            self._stdin_closed = True
+        dropped = 0
+        while not self._stdin_buffer.empty():
+            data, _, on_written = self._stdin_buffer.get()
+            dropped += len(data) if data is not None else 0
+            if on_written is not None:
+                on_written()
+        if dropped > 0:
+            error("%s: the process has ended, dropped %d bytes of input" % (self._action_name, dropped))
         info("Sender thread finished")
 
@@ -0,0 +1,108 @@
+from hashlib import blake2b
+import re
+try:
+    from re import _parser as sre_parse
+    from re._constants import LITERAL, AT, SUBPATTERN, MAX_REPEAT, MIN_REPEAT, AT_BOUNDARY, AT_BEGINNING, \
+        AT_BEGINNING_STRING, AT_END, AT_END_STRING
+except ImportError:
+    # Before Python 3.11
+    import sre_parse
+    from sre_constants import LITERAL, AT, SUBPATTERN, MAX_REPEAT, MIN_REPEAT, AT_BOUNDARY, AT_BEGINNING, \
+        AT_BEGINNING_STRING, AT_END, AT_END_STRING
+
+# Tokens are the words of the data of the records, compared in lower case
+TOKEN_RE = re.compile(r"\w+")
+# Positions at which a word starts or ends, if a word character is next to
+# them
+WORD_BOUNDARIES = [AT_BOUNDARY, AT_BEGINNING, AT_BEGINNING_STRING, AT_END, AT_END_STRING]
+REPEATS = [MAX_REPEAT, MIN_REPEAT]
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BloomFilter:
+    # Tells which tokens certainly do not occur in a block of records; sized
+    # for about 1% of false positives
+    BITS_PER_TOKEN = 10
+    HASH_COUNT = 7
+
+    def __init__(self, data):
+        self._bits = data
+        self._size = len(data) * 8
+
+    @staticmethod
+    def _hashes(token):
+        digest = blake2b(token.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest[:4], 'little'), int.from_bytes(digest[4:], 'little') | 1
+
+    @staticmethod
+    def build(tokens):
+        bits = bytearray(max(len(tokens) * BloomFilter.BITS_PER_TOKEN // 8, 8))
+        size = len(bits) * 8
+        for token in tokens:
+            first, step = BloomFilter._hashes(token)
+            for ix in range(BloomFilter.HASH_COUNT):
+                position = (first + ix * step) % size
+                bits[position >> 3] |= 1 << (position & 7)
+        return BloomFilter(bytes(bits))
+
+    def might_contain(self, token):
+        first, step = self._hashes(token)
+        for ix in range(self.HASH_COUNT):
+            position = (first + ix * step) % self._size
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def might_contain_all(self, tokens):
+        return all(self.might_contain(token) for token in tokens)
+
+    def to_bytes(self):
+        return self._bits
+
+
+def _literal_runs(items, runs):
+    # Appends to runs the runs of literal characters which every match of
+    # the parsed items contains, each with the flags telling if it starts
+    # and ends at a word boundary. Groups, and repetitions of at least one,
+    # are required as a whole, but not what surrounds them.
+    run = ""
+    bounded = False
+    for op, argument in items:
+        if op is LITERAL:
+            run += chr(argument)
+            continue
+        is_boundary = op is AT and argument in WORD_BOUNDARIES
+        if run != "":
+            runs.append((run, bounded, is_boundary))
+        run, bounded = "", is_boundary
+        if op is SUBPATTERN:
+            _literal_runs(argument[-1], runs)
+        elif op in REPEATS and argument[0] >= 1:
+            _literal_runs(argument[2], runs)
+    if run != "":
+        runs.append((run, bounded, False))
+
+
+def required_tokens(pattern):
+    # Returns the tokens which every record matching the regular expression
+    # contains as whole words. Words at the ends of a literal run may be
+    # parts of longer ones, unless the pattern puts a boundary there. The
+    # pattern is parsed by the parser of the re module, so that the flags
+    # and the escapes mean exactly what they do in the search.
+    if pattern is None:
+        return set()
+    try:
+        items = sre_parse.parse(pattern)
+    except re.error:
+        return set()
+    runs = []
+    _literal_runs(items, runs)
+    tokens = set()
+    for run, left_bounded, right_bounded in runs:
+        for match in TOKEN_RE.finditer(run):
+            if (match.start() > 0 or left_bounded) and (match.end() < len(run) or right_bounded):
+                tokens.add(match.group().lower())
+    return tokens
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+import utils
+from utils import TerminalRawMode
+from view.configuration import Configuration
+from view.console_output import ConsoleOutput, RenderedRowsCache
+from view.formatter import Formatter, Format
+from view.interactive_mode import InteractiveModeContext
+
+
+def make_output(monkeypatch, rows=6, cols=80):
+    monkeypatch.setattr(utils, "stdin", SimpleNamespace(fileno=lambda: 0))
+    config = Configuration()
+    config.line_format = Format("{seq} {data}")
+    config.continued_line_format = Format("  {data}")
+    config.filtered_mode = False
+    terminal = TerminalRawMode()
+    terminal._terminal_rows = rows
+    terminal._terminal_cols = cols
+    # What is written stays in the buffer
+    terminal.flush = lambda: None
+    output = ConsoleOutput(config, Formatter(), terminal, InteractiveModeContext(config))
+    output.render_frame(True)
+    return terminal, output
+
+
+def print_lines(terminal, output, first, end):
+    for seq in range(first, end):
+        output.print_line({"type": "data", "endpoint": "0", "fd": "stdout", "data": "line %d" % seq, "seq": seq})
+    output.render_frame(True)
+    terminal._output_buffer.clear()
+
+
+def test_rendered_rows_cache():
+    cache = RenderedRowsCache(capacity=2)
+    cache.set_width(80)
+    cache.put(1, ["one"])
+    cache.put(2, ["two"])
+    assert cache.get(1) == ["one"]
+    cache.put(3, ["three"])
+    assert cache.get(2) is None
+    assert cache.get(1) == ["one"]
+
+    cache.set_width(80)
+    assert cache.get(3) == ["three"]
+    cache.set_width(100)
+    assert cache.get(1) is None and cache.get(3) is None
+
+
+def test_rendered_rows_after_resize(monkeypatch):
+    terminal, output = make_output(monkeypatch)
+    print_lines(terminal, output, 0, 20)
+    output.scroll(ConsoleOutput.SCROLL_PAGE_UP)
+    output.render_frame(True)
+    assert output._rendered_rows.get(output._scroll_top) is not None
+
+    cached = output._rendered_rows.get(output._scroll_top)
+    terminal._terminal_cols = 60
+    output.notify_terminal_resized()
+    output.render_frame(True)
+    rows = output._rendered_rows.get(output._scroll_top)
+    assert rows == cached and rows is not cached
+
+
+def test_scroll_is_clamped(monkeypatch):
+    terminal, output = make_output(monkeypatch)
+    print_lines(terminal, output, 0, 20)
+
+    # Five rows of lines above the status line
+    output.scroll(ConsoleOutput.SCROLL_PAGE_UP)
+    assert output._scroll_top == 10
+    output.scroll(ConsoleOutput.SCROLL_PAGE_UP)
+    output.scroll(ConsoleOutput.SCROLL_PAGE_UP)
+    output.scroll(ConsoleOutput.SCROLL_PAGE_UP)
+    assert output._scroll_top == 0
+
+    output.scroll(ConsoleOutput.SCROLL_PAGE_DOWN)
+    assert output._scroll_top == 5
+    output.scroll(ConsoleOutput.SCROLL_PAGE_DOWN)
+    output.scroll(ConsoleOutput.SCROLL_PAGE_DOWN)
+    # Nothing is below the last page but the live view
+    assert output._scroll_top is None
+    output.scroll(ConsoleOutput.SCROLL_PAGE_DOWN)
+    assert output._scroll_top is None
+
+    output.scroll(ConsoleOutput.SCROLL_TOP)
+    assert output._scroll_top == 0
+    output.scroll(ConsoleOutput.SCROLL_BOTTOM)
+    assert output._scroll_top is None
+
+
+def test_scroll_after_trimming(monkeypatch):
+    terminal, output = make_output(monkeypatch)
+    output.set_max_history(30, None)
+    print_lines(terminal, output, 0, 50)
+    assert output._lines.first_index() == 20
+
+    output.scroll(ConsoleOutput.SCROLL_TOP)
+    assert output._scroll_top == 20
+    # Lines arriving while browsing are held, and the window is kept
+    print_lines(terminal, output, 50, 100)
+    assert output._lines.first_index() == 20
+    assert output._scroll_top == 20
+
+    output.scroll(ConsoleOutput.SCROLL_BOTTOM)
+    output.render_frame(True)
+    print_lines(terminal, output, 100, 110)
+    assert output._lines.first_index() == 80
+    output.scroll(ConsoleOutput.SCROLL_PAGE_UP)
+    output.scroll(ConsoleOutput.SCROLL_TOP)
+    assert output._scroll_top == output._lines.first_index()
+    terminal._output_buffer.clear()
+    output.render_frame(True)
+    assert "80 line 80" in "".join(terminal._output_buffer)
@@ -0,0 +1,33 @@
+import json
+from network.framing import FrameDecoder, BinaryFrame, encode_frame, encode_binary_frame
+
+
+def test_frame_decoder_split_frames():
+    decoder = FrameDecoder()
+    stream = encode_frame({"type": "ack", "id": 1}) + encode_frame({"type": "ack", "id": 2})
+
+    assert decoder.feed(stream[:5]) == []
+    frames = decoder.feed(stream[5:-3])
+    assert [json.loads(f)['id'] for f in frames] == [1]
+    assert decoder.pending_size() > 0
+
+    frames = decoder.feed(stream[-3:] + b"\0\0")
+    assert [json.loads(f)['id'] for f in frames] == [2]
+    assert decoder.pending_size() == 0
+
+
+def test_frame_decoder_binary_frames():
+    decoder = FrameDecoder()
+    payload = b"line 1\n\0\x01line 2\n"
+    stream = encode_frame({"type": "pipe-open"}) + encode_binary_frame(payload) + encode_frame({"type": "pipe-close"})
+
+    frames = []
+    for ix in range(0, len(stream), 3):
+        frames.extend(decoder.feed(stream[ix:ix + 3]))
+
+    assert len(frames) == 3
+    assert json.loads(frames[0])['type'] == "pipe-open"
+    assert isinstance(frames[1], BinaryFrame)
+    assert frames[1] == payload
+    assert json.loads(frames[2])['type'] == "pipe-close"
+    assert decoder.pending_size() == 0
@@ -0,0 +1,44 @@
+import io
+from view.configuration import Configuration, Watch
+from view.formatter import Formatter, Format
+from view.headless_output import HeadlessOutput
+
+
+def make_output(plain=True):
+    config = Configuration()
+    config.line_format = Format("{endpoint}:{data}")
+    config.continued_line_format = Format("  {data}")
+    watch = Watch()
+    watch.set_regex("err")
+    watch.compile_regex()
+    config.add_watch('a', watch)
+    config.set_endpoint_show_mode('1', Configuration.SHOW_FILTERED)
+    stream = io.BytesIO()
+    return config, stream, HeadlessOutput(config, Formatter(), stream, plain)
+
+
+def test_headless_output_filters_and_formats():
+    config, stream, output = make_output()
+    output.print_line({"endpoint": "0", "fd": "stdout", "data": "first\nsecond"})
+    output.print_line({"endpoint": "1", "fd": "stdout", "data": "hidden"})
+    output.print_line({"endpoint": "1", "fd": "stdout", "data": "an err"})
+    output.print_line({"endpoint": "1", "fd": "stdout", "data": "matched by a worker"},
+                      (frozenset(["err"]), ["err"]))
+    assert stream.getvalue() == b""
+
+    output.flush()
+    assert stream.getvalue().decode() == "0:first\n  second\n1:an err\n1:matched by a worker\n"
+
+
+def test_headless_output_flushes_old_rows():
+    config, stream, output = make_output()
+    output.flush_if_older(0)
+    output.print_line({"endpoint": "0", "fd": "stdout", "data": "first"})
+    output.flush_if_older(60)
+    assert stream.getvalue() == b""
+
+    output.flush_if_older(0)
+    assert stream.getvalue() == b"0:first\n"
+    output.print_line({"endpoint": "0", "fd": "stdout", "data": "second"})
+    output.flush_if_older(60)
+    assert stream.getvalue() == b"0:first\n"
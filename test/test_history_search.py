@@ -0,0 +1,66 @@
+import json
+import threading as thrd
+from server.history_search import HistorySearch, search_lines
+from server.record_filter import RecordFilter
+from server.record_store import RecordStore
+
+
+def _line(seq, data):
+    return bytes(json.dumps({"type": "data", "endpoint": "a", "fd": "stdout", "data": data, "seq": seq,
+                             "date": "2024-05-01", "time": "12:00:00"}), 'utf-8')
+
+
+def _seqs(hits):
+    return [json.loads(hit)['seq'] for hit in hits]
+
+
+def test_search_lines():
+    lines = [_line(0, "start id=1"), _line(1, "id=2 end"), _line(2, "x"),
+             b'{"type": "marker", "name": "id=3", "date": "2024-05-01", "time": "12:00:00"}', _line(3, "id=4")]
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"id=\d"), 10)) == [0, 1, 3]
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"id=\d"), 2)) == [0, 1]
+    # Anchors apply to the data of every record, not to the joined text
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"^id=\d$"), 10)) == [3]
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"end$"), 10)) == [1]
+    # Matches across the records are not hits
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"end\sx"), 10)) == []
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"(?<!start )id=\d"), 10)) == [1, 3]
+    assert _seqs(search_lines(lines, RecordFilter(pattern=r"id", fds=["stderr"]), 10)) == []
+
+
+def test_history_search(tmp_path):
+    store = RecordStore(str(tmp_path), segment_size=20000, compression="zlib", block_size=2000)
+    for seq in range(2000):
+        store.append({"type": "data", "endpoint": "a" if seq % 2 == 0 else "b", "fd": "stdout",
+                      "data": "request id%d status %d" % (seq // 10, 500 if seq % 7 == 0 else 200),
+                      "seq": seq, "date": "2024-05-01", "time": "12:%02d:%02d" % (seq // 60 % 60, seq % 60)})
+    store.wait_for_compression()
+
+    history_search = HistorySearch(store, workers=2)
+    history_search.SHARD_SIZE = 30000
+    assert len(store.get_shards(shard_size=history_search.SHARD_SIZE)) > 2
+    batches = []
+    try:
+        count, complete = history_search.search(RecordFilter(pattern=r"status 500"), 10000, thrd.Event(),
+                                                batches.append)
+        hits = [hit for batch in batches for hit in batch]
+        assert complete and count == len(hits)
+        assert _seqs(hits) == list(range(0, 2000, 7))
+
+        batches.clear()
+        record_filter = RecordFilter(since_seq=100, until_seq=1500, endpoints=["b"], pattern=r"\bid1[0-9]{2}\b")
+        count, complete = history_search.search(record_filter, 10000, thrd.Event(), batches.append)
+        assert _seqs([hit for batch in batches for hit in batch]) == list(range(1001, 1500, 2))
+
+        batches.clear()
+        count, complete = history_search.search(RecordFilter(pattern=r"status"), 25, thrd.Event(), batches.append)
+        assert count == 25 and not complete
+        assert _seqs([hit for batch in batches for hit in batch]) == list(range(25))
+
+        cancelled = thrd.Event()
+        cancelled.set()
+        count, complete = history_search.search(RecordFilter(pattern=r"status"), 100, cancelled, batches.append)
+        assert count == 0 and not complete
+    finally:
+        history_search.shutdown()
+        store.close()
@@ -0,0 +1,35 @@
+from tracing import LatencyHistogram
+from view.latency import LatencyTracker
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.add(value * 1000)
+
+    assert histogram.count == 1000
+    assert histogram.max_ns == 1000000
+    assert 500000 <= histogram.percentile(0.5) <= 500000 * 1.25
+    assert 990000 <= histogram.percentile(0.99) <= 1000000
+    assert histogram.percentile(1.0) == 1000000
+
+    restored = LatencyHistogram.from_dict({"counts": {str(k): v for k, v in histogram.counts.items()},
+                                           "max": histogram.max_ns})
+    assert restored.percentile(0.5) == histogram.percentile(0.5)
+    assert restored.count == 1000
+
+
+def test_latency_tracker_intervals():
+    tracker = LatencyTracker()
+    tracker.add_trace([1000, 3000, 4000, 14000, 1014000])
+    tracker.add_trace([0, 10])
+    tracker.add_write_latency({"counts": {}, "max": 0})
+
+    assert tracker.get_count() == 1
+    report = tracker.get_report()
+    assert report[0].split() == ["Latency", "count", "p50", "p99", "max"]
+    rows = {line[:12].strip(): line[12:].split() for line in report[1:]}
+    assert rows['separator'][0] == "2"
+    assert rows['socket write'][0] == "0"
+    assert rows['view'][-2:] == ["1.0", "ms"]
+    assert rows['total'][0] == "1"
@@ -0,0 +1,83 @@
+from view.configuration import Configuration, Watch
+from view.line_filter import Bitset, LineFilter
+from view.line_store import LineStore
+
+
+def test_bitset_navigation():
+    bits = Bitset(8)
+    for index in [9, 20, 21, 100000]:
+        bits.add(index)
+
+    assert 20 in bits and 22 not in bits and 3 not in bits
+    assert bits.count() == 4
+    assert bits.next_set(0) == 9
+    assert bits.next_set(22) == 100000
+    assert bits.next_set(100001) is None
+    assert bits.prev_set(100000) == 21
+    assert bits.prev_set(21) == 20
+    assert bits.prev_set(9) is None
+
+    bits.discard_before(16)
+    assert 9 not in bits
+    assert bits.next_set(0) == 20
+    assert Bitset.from_int(bits.to_int(0), 0).prev_set(200000) == 100000
+
+
+def make_config():
+    config = Configuration()
+    watch = Watch()
+    watch.set_regex("error")
+    watch.compile_regex()
+    config.add_watch('a', watch)
+    return config
+
+
+def fill(store, line_filter, count):
+    for ix in range(0, count):
+        index = store.append({"data": "error %d" % ix if ix % 3 == 0 else "line %d" % ix,
+                              "endpoint": str(ix % 2), "fd": "stdout", "seq": ix})
+        line_filter.add_line(index)
+
+
+def test_filter_refilters_history():
+    config = make_config()
+    store = LineStore()
+    line_filter = LineFilter(store, config)
+    fill(store, line_filter, 30)
+    assert all(line_filter.is_visible(ix) for ix in range(0, 30))
+
+    config.set_endpoint_show_mode('1', Configuration.SHOW_NONE)
+    assert line_filter.update()
+    assert line_filter.next_visible(1, 30) == 2
+    assert line_filter.prev_visible(29, 0) == 28
+
+    config.set_endpoint_show_mode('0', Configuration.SHOW_FILTERED)
+    line_filter.update()
+    assert [ix for ix in range(0, 30) if line_filter.is_visible(ix)] == [0, 6, 12, 18, 24]
+    assert line_filter.matched_watch(6) == 'a'
+
+    config.disable_watch('a')
+    line_filter.update()
+    assert line_filter.next_visible(0, 30) is None
+    assert not line_filter.update()
+
+
+def test_filter_scans_history_for_new_watch():
+    config = make_config()
+    store = LineStore()
+    line_filter = LineFilter(store, config)
+    fill(store, line_filter, 100)
+
+    watch = Watch()
+    watch.set_regex("line 5")
+    watch.compile_regex()
+    config.add_watch('b', watch)
+    config.default_endpoint_show = Configuration.SHOW_FILTERED
+    line_filter.update()
+    assert not line_filter.is_complete()
+
+    while not line_filter.step(budget=30):
+        pass
+    assert line_filter.matched_watch(55) == 'b'
+    assert line_filter.is_visible(5) and line_filter.is_visible(59)
+    assert not line_filter.is_visible(1)
@@ -0,0 +1,86 @@
+import pytest
+from view.line_store import LineStore
+
+
+def make_record(seq, data="line", endpoint="0", fd="stdout"):
+    return {
+        "type": "data",
+        "endpoint": endpoint,
+        "source": "&%s" % endpoint,
+        "fd": fd,
+        "data": data,
+        "seq": seq,
+        "date": "2024-02-29",
+        "time": "23:59:58"
+    }
+
+
+def test_store_roundtrip():
+    store = LineStore()
+    store.append(make_record(7, "some text", endpoint="3", fd="stderr"))
+
+    record = store.get(0)
+    assert record['data'] == "some text"
+    assert record['endpoint'] == "3"
+    assert record['source'] == "&3"
+    assert record['fd'] == "stderr"
+    assert record['seq'] == 7
+    assert record['date'] == "2024-02-29"
+    assert record['time'] == "23:59:58"
+    assert 'watch' not in record
+
+
+def test_store_marker_and_message():
+    store = LineStore()
+    store.append({"data": "M1", "name": "M1", "seq": '-', "endpoint": "*", "fd": "marker",
+                  "date": "2024-01-01", "time": "00:00:00"})
+    store.append({"data": "hello", "endpoint": ".", "fd": "info"})
+
+    marker = store.get(0)
+    assert marker['seq'] == '-'
+    assert marker['name'] == "M1"
+
+    message = store.get(1)
+    assert 'seq' not in message
+    assert 'time' not in message
+    assert message['data'] == "hello"
+
+
+def test_store_fifo_across_chunks():
+    store = LineStore()
+    store.CHUNK_SIZE = 32
+    for ix in range(0, 5000):
+        store.append(make_record(ix, "line number %d" % ix))
+
+    for ix in range(0, 4000):
+        assert store.popleft()['data'] == "line number %d" % ix
+
+    assert len(store) == 1000
+    assert store.first_index() == 4000
+    assert store.get(4500)['seq'] == 4500
+    assert store.get(4999)['data'] == "line number 4999"
+
+    with pytest.raises(IndexError):
+        store.get(3999)
+
+
+def test_store_size_accounting():
+    store = LineStore()
+    store.append(make_record(0, "x" * 100))
+    store.append(make_record(1, "y" * 50))
+    assert store.size_bytes() == 2 * LineStore.LINE_OVERHEAD + 150
+
+    store.popleft()
+    assert store.size_bytes() == LineStore.LINE_OVERHEAD + 50
+
+    store.clear()
+    assert len(store) == 0
+    assert store.size_bytes() == 0
+
+
+def test_store_watch_column():
+    store = LineStore()
+    store.append(make_record(0))
+    store.set_watch(0, 'a')
+    assert store.get_watch(0) == 'a'
+    assert store.get(0)['watch'] == 'a'
@@ -0,0 +1,23 @@
+from bench.loadgen import make_line, make_record, read_args
+
+
+def test_make_line_size():
+    assert len(make_line(7, 100)) == 100
+    assert make_line(7, 100).startswith("line 00000007 ")
+    assert make_line(7, 8) == "line 000"
+
+    colored = make_line(7, 100, ansi=True)
+    assert colored.startswith("\x1b[1;")
+    assert len(colored.replace("\x1b[0m", "")) == 100 + len("\x1b[1;32m")
+
+
+def test_multiline_records():
+    config = read_args(["--multiline", "4", "--size", "40"])
+    record = make_record(10, config)
+    assert len(record) == 4
+    assert record[0] == "{ record 10"
+    assert record[-1] == "}"
+    assert "".join(record).count("{") == "".join(record).count("}")
+
+    config = read_args(["--size", "40"])
+    assert make_record(10, config) == [make_line(10, 40)]
@@ -0,0 +1,24 @@
+from bench.micro import compare, is_same_machine, random_chunks
+
+
+def test_random_chunks_cover_the_data():
+    data = "".join("line %d\n" % ix for ix in range(1000))
+    chunks = random_chunks(data, max_size=100)
+    assert "".join(chunks) == data
+    assert all(1 <= len(chunk) <= 100 for chunk in chunks)
+    assert random_chunks(data, max_size=100) == chunks
+
+
+def test_compare_with_baseline():
+    baseline = {"a": {"ns-per-op": 100.0}, "b": {"ns-per-op": 100.0}}
+    results = {"a": {"ns-per-op": 120.0}, "b": {"ns-per-op": 130.0}, "c": {"ns-per-op": 1.0}}
+    ratios, regressions = compare(results, baseline, 0.25)
+    assert ratios == {"a": 1.2, "b": 1.3}
+    assert regressions == ["b"]
+
+
+def test_baseline_of_another_machine():
+    machine = {"python": "3.11.7", "host": "bench"}
+    assert is_same_machine({**machine, "benchmarks": {}}, machine)
+    assert not is_same_machine({"python": "3.11.7", "benchmarks": {}}, machine)
+    assert not is_same_machine({"python": "3.12.1", "host": "bench", "benchmarks": {}}, machine)
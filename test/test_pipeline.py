@@ -0,0 +1,38 @@
+import json
+import selectors
+from view.pipeline import DecodePipeline, decode_frames
+
+
+def make_frame(seq, data):
+    return json.dumps({"type": "data", "endpoint": "0", "fd": "stdout", "seq": seq, "data": data}).encode()
+
+
+def test_decode_frames():
+    results = decode_frames([make_frame(0, "an error here"), b"{broken", make_frame(1, "fine")],
+                            ["error", "^fi"])
+    assert results[0][0]['seq'] == 0
+    assert results[0][1] == ["error"]
+    assert results[1][0] is None
+    assert results[2][1] == ["^fi"]
+
+
+def test_pipeline_keeps_order():
+    pipeline = DecodePipeline(2, max_in_flight=4)
+    selector = selectors.DefaultSelector()
+    selector.register(pipeline.fileno(), selectors.EVENT_READ)
+    try:
+        for batch in range(0, 4):
+            pipeline.submit([make_frame(batch * 10 + ix, "x") for ix in range(0, 10)], ["x"])
+        assert pipeline.is_full()
+
+        seqs = []
+        while len(seqs) < 40:
+            selector.select(5)
+            for results, patterns in pipeline.collect():
+                assert patterns == {"x"}
+                seqs.extend(record['seq'] for record, matched in results)
+        assert seqs == list(range(0, 40))
+        assert not pipeline.is_full()
+    finally:
+        selector.close()
+        pipeline.shutdown()
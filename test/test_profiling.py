@@ -0,0 +1,39 @@
+import pstats
+import threading as thrd
+from time import monotonic
+from profiling import Profiler
+
+
+def _busy_loop(stop):
+    values = []
+    while not stop.is_set():
+        values.append(sum(range(100)))
+        if len(values) > 1000:
+            values = []
+
+
+def test_profiler_reports_other_threads(tmp_path):
+    profiler = Profiler("test", str(tmp_path))
+    assert profiler.snapshot() == "Profiling is not running"
+    assert profiler.start() == "Profiling started"
+
+    stop = thrd.Event()
+    worker = thrd.Thread(target=_busy_loop, args=(stop,))
+    worker.start()
+    start = monotonic()
+    while monotonic() - start < 0.3:
+        pass
+    stop.set()
+    worker.join()
+
+    report = profiler.stop()
+    assert "_busy_loop" in report
+    assert "Allocation sites" in report
+    assert report.endswith("Profiling stopped")
+    assert not profiler.is_running()
+
+    stats_files = list(tmp_path.glob("test-*.pstats"))
+    assert len(stats_files) == 1
+    stats = pstats.Stats(str(stats_files[0]))
+    assert any(name == "_busy_loop" for _, _, name in stats.stats)
+    assert len(list(tmp_path.glob("test-*.tracemalloc"))) == 1
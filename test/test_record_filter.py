@@ -0,0 +1,86 @@
+from datetime import datetime
+from server.record_filter import RecordFilter
+
+
+def _data(seq, endpoint="0", date="2024-05-01", time="12:00:00"):
+    return {"type": "data", "endpoint": endpoint, "fd": "stdout", "data": "x",
+            "seq": seq, "date": date, "time": time}
+
+
+def _marker(date="2024-05-01", time="12:00:00"):
+    return {"type": "marker", "name": "M", "date": date, "time": time}
+
+
+def test_record_filter_by_seq_and_endpoint():
+    record_filter = RecordFilter.from_request({"since-seq": 10, "endpoints": ["1"]})
+    assert not record_filter.matches(_data(9, "1"))
+    assert record_filter.matches(_data(10, "1"))
+    assert not record_filter.matches(_data(11, "0"))
+    assert record_filter.matches(_marker())
+    assert not record_filter.matches({"type": "keepalive", "seq": 100})
+
+
+def test_record_filter_by_time():
+    record_filter = RecordFilter.from_request({"since-time": "2024-05-01 12:00:00"})
+    assert not record_filter.matches(_data(0, time="11:59:59"))
+    assert record_filter.matches(_data(1, time="12:00:00"))
+    assert record_filter.matches(_data(2, date="2024-05-02", time="01:00:00"))
+    assert not record_filter.matches(_marker(date="2024-04-30", time="23:00:00"))
+
+    # A time without a date is its latest occurrence, after which the
+    # records of the following days match at any time
+    record_filter = RecordFilter.from_request({"since-time": "12:00:00"})
+    record_filter.resolve_dates(datetime(2024, 5, 1, 13, 0, 0))
+    assert record_filter.matches(_data(0, date="2024-05-01", time="12:30:00"))
+    assert record_filter.matches(_data(0, date="2024-05-02", time="11:30:00"))
+    assert not record_filter.matches(_data(0, date="2024-04-30", time="12:30:00"))
+    assert not record_filter.matches(_data(0, date="2024-05-01", time="11:30:00"))
+
+
+def test_since_timestamp():
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    assert RecordFilter().since_timestamp(now) is None
+    record_filter = RecordFilter.from_request({"since-time": "2024-04-30 03:00:00"})
+    assert record_filter.since_timestamp(now) == datetime(2024, 4, 30, 3, 0, 0).timestamp()
+
+    # A time without a date is the latest one that has passed
+    record_filter = RecordFilter.from_request({"since-time": "03:00:00"})
+    assert record_filter.since_timestamp(now) == datetime(2024, 5, 1, 3, 0, 0).timestamp()
+    record_filter = RecordFilter.from_request({"since-time": "13:00:00"})
+    assert record_filter.since_timestamp(now) == datetime(2024, 4, 30, 13, 0, 0).timestamp()
+
+
+def test_record_filter_until_and_fds():
+    record_filter = RecordFilter.from_request({"since-seq": 10, "until-seq": 20, "fds": ["stderr"]})
+    assert not record_filter.matches(_data(15))
+    record = dict(_data(15), fd="stderr")
+    assert record_filter.matches(record)
+    assert not record_filter.matches(dict(record, seq=20))
+    assert not record_filter.is_past(dict(record, seq=19))
+    assert record_filter.is_past(dict(record, seq=20))
+    assert not record_filter.is_past(_marker())
+
+    record_filter = RecordFilter.from_request({"until-time": "2024-05-01 12:00:00"})
+    assert record_filter.matches(_data(0, time="11:59:59"))
+    assert not record_filter.matches(_data(1, time="12:00:00"))
+    assert not record_filter.matches(_marker(date="2024-05-02", time="01:00:00"))
+    assert record_filter.is_past(_marker(date="2024-05-02", time="01:00:00"))
+
+
+def test_resolve_dates():
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    record_filter = RecordFilter.from_request({"since-time": "13:00:00", "until-time": "03:00:00"})
+    record_filter.resolve_dates(now)
+    assert record_filter.since_time == ("2024-04-30", "13:00:00")
+    assert record_filter.until_time == ("2024-05-01", "03:00:00")
+    assert record_filter.matches(_data(0, date="2024-04-30", time="23:00:00"))
+    assert not record_filter.matches(_data(0, date="2024-04-30", time="12:00:00"))
+    assert record_filter.is_past(_data(0, date="2024-05-01", time="03:00:00"))
+
+
+def test_record_filter_by_pattern():
+    record_filter = RecordFilter.from_request({"pattern": r" id=\d+ "})
+    assert record_filter.matches(dict(_data(0), data="request id=42 done"))
+    assert not record_filter.matches(dict(_data(0), data="request id=x done"))
+    assert not record_filter.matches(_marker())
+    assert record_filter.tokens == {"id"}
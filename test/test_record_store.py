@@ -0,0 +1,182 @@
+import json
+import os
+from server.record_store import RecordStore, record_timestamp
+
+
+def _data(seq, second=0, data="line"):
+    return {"type": "data", "endpoint": "a", "source": "&a", "fd": "stdout", "data": "%s %d" % (data, seq),
+            "seq": seq, "date": "2024-05-01", "time": "12:%02d:%02d" % (second // 60, second % 60)}
+
+
+def _marker(name, second=0):
+    return {"type": "marker", "name": name, "date": "2024-05-01", "time": "12:%02d:%02d" % (second // 60, second % 60)}
+
+
+def _create_store(directory, **kwargs):
+    store = RecordStore(str(directory), **kwargs)
+    store.INDEX_INTERVAL = 500
+    return store
+
+
+def _seqs(store, start=(0, 0)):
+    return [json.loads(line).get('seq') for line in store.read(start)]
+
+
+def test_append_and_read(tmp_path):
+    store = _create_store(tmp_path)
+    for seq in range(100):
+        store.append(_data(seq, seq))
+    store.append(_marker("end", 100))
+    traced = _data(100, 101)
+    traced['trace'] = [1, 2, 3]
+    store.append(traced)
+
+    assert _seqs(store) == list(range(100)) + [None, 100]
+    assert 'trace' not in json.loads(list(store.read())[-1])
+    assert store.get_next_seq() == 101
+    store.close()
+
+
+def test_find_by_seq_and_time(tmp_path):
+    store = _create_store(tmp_path, segment_size=3000)
+    for seq in range(200):
+        store.append(_data(seq, seq))
+    assert store.get_statistics()['segments'] > 2
+
+    start = store.find(since_seq=150)
+    seqs = _seqs(store, start)
+    assert seqs[-1] == 199 and 150 in seqs and seqs[0] <= 150
+    assert len(seqs) < 100
+
+    start = store.find(since_seq=0)
+    assert _seqs(store, start)[0] == 0
+
+    start = store.find(since_time=record_timestamp(_data(0, 120)))
+    seqs = _seqs(store, start)
+    assert seqs[0] <= 120 and 120 in seqs and len(seqs) < 150
+    store.close()
+
+
+def test_sync_outside_the_appends(tmp_path, monkeypatch):
+    synced = []
+    store = _create_store(tmp_path, segment_size=3000, fsync_interval=0)
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(store._lock.locked()))
+    for seq in range(100):
+        store.append(_data(seq, seq))
+    assert synced == []
+
+    store.sync()
+    segments = store.get_statistics()['segments']
+    assert len(synced) == segments and not any(synced)
+    store.sync()
+    assert len(synced) == segments
+    store.append(_data(100, 100))
+    store.close()
+    assert len(synced) == segments + 1 and not any(synced)
+
+
+def test_reopen_rebuilds_the_index(tmp_path):
+    store = _create_store(tmp_path, segment_size=3000)
+    for seq in range(200):
+        store.append(_data(seq, seq))
+    store.append(_marker("last", 200))
+    store.close()
+    segments = sorted(name for name in os.listdir(tmp_path))
+
+    # A record cut off by a crash is dropped
+    with open(os.path.join(tmp_path, segments[-1]), 'ab') as file:
+        file.write(b'{"type": "data", "seq": 2')
+
+    reopened = _create_store(tmp_path, segment_size=3000)
+    assert reopened.get_next_seq() == 200
+    assert _seqs(reopened) == list(range(200)) + [None]
+    assert _seqs(reopened, reopened.find(since_seq=150))[0] <= 150
+
+    reopened.append(_data(200, 201))
+    assert _seqs(reopened)[-2:] == [None, 200]
+    assert [json.loads(line).get('seq') for line in reopened.tail(3)] == [199, None, 200]
+    reopened.close()
+
+
+def test_retention_by_size(tmp_path):
+    store = _create_store(tmp_path, segment_size=2000, max_size=5000)
+    for seq in range(300):
+        store.append(_data(seq, seq))
+    assert store.get_size() <= 5000 + 2000
+    seqs = _seqs(store)
+    assert seqs[-1] == 299
+    assert seqs[0] > 0
+    assert seqs == list(range(seqs[0], 300))
+    assert len(os.listdir(tmp_path)) == store.get_statistics()['segments']
+    store.close()
+
+
+def test_compressed_segments(tmp_path):
+    store = _create_store(tmp_path, segment_size=20000, compression="zlib", block_size=2000)
+    for seq in range(1000):
+        store.append(_data(seq, seq % 3600, data="repeated line " * 5))
+    store.append(_marker("last", 3600))
+    store.wait_for_compression()
+
+    statistics = store.get_statistics()
+    assert statistics['compressed-segments'] == statistics['segments'] - 1
+    assert statistics['bytes'] * 5 < statistics['raw-bytes']
+    assert _seqs(store) == list(range(1000)) + [None]
+
+    # Only the blocks from the one found on are read
+    start = store.find(since_seq=500)
+    misses = store.get_statistics()['block-cache']['misses']
+    seqs = _seqs(store, start)
+    assert seqs[0] <= 500 and seqs[500 - seqs[0]] == 500 and len(seqs) < 520
+    assert store.get_statistics()['block-cache']['misses'] - misses < 100
+    hits = store.get_statistics()['block-cache']['hits']
+    _seqs(store, start)
+    assert store.get_statistics()['block-cache']['hits'] > hits
+    store.close()
+
+    reopened = _create_store(tmp_path, segment_size=20000, compression="lzma", block_size=2000)
+    assert reopened.get_next_seq() == 1000
+    assert _seqs(reopened) == list(range(1000)) + [None]
+    assert _seqs(reopened, reopened.find(since_seq=500))[0] <= 500
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+    reopened.close()
+
+
+def test_positions_survive_compression(tmp_path):
+    store = _create_store(tmp_path, segment_size=5000, compression="zlib", block_size=1000)
+    for seq in range(30):
+        store.append(_data(seq, seq))
+    positions = [position for _, position in store.scan()]
+    for seq in range(30, 200):
+        store.append(_data(seq, seq))
+    store.wait_for_compression()
+    assert store.get_statistics()['compressed-segments'] > 0
+    assert _seqs(store, positions[9])[0] == 10
+    store.close()
+
+
+def _ids(store, tokens, start=(0, 0)):
+    return [json.loads(line)['seq'] for line in store.read(start, tokens=tokens)]
+
+
+def test_filters_skip_blocks(tmp_path):
+    store = _create_store(tmp_path, segment_size=20000, compression="zlib", block_size=2000)
+    for seq in range(1000):
+        store.append(_data(seq, seq % 3600, data="request id%d" % (seq // 10)))
+    store.wait_for_compression()
+    assert store.get_statistics()['compressed-segments'] > 0
+
+    # Blocks without the token are neither decompressed nor read
+    misses = store.get_statistics()['block-cache']['misses']
+    seqs = _ids(store, {"id42"})
+    assert set(range(420, 430)) <= set(seqs)
+    assert len(seqs) < 100
+    assert store.get_statistics()['block-cache']['misses'] - misses <= 3
+
+    # The active segment is filtered too, in the parts between its index
+    # entries
+    seqs = _ids(store, {"id99"}, store.find(since_seq=990))
+    assert set(range(990, 1000)) <= set(seqs) and len(seqs) < 20
+    assert _ids(store, {"missing"}) == []
+    assert len(_ids(store, set())) == 1000
+    store.close()
@@ -0,0 +1,56 @@
+from view.line_store import LineStore
+from view.search import HistorySearch
+
+
+def fill(store, first, end):
+    for ix in range(first, end):
+        store.append({"data": "line %d%s" % (ix, " match" if ix % 10 == 0 else ""),
+                      "endpoint": "0", "fd": "stdout", "seq": ix})
+
+
+def test_search_incremental():
+    store = LineStore()
+    fill(store, 0, 100)
+    search = HistorySearch(store)
+    search.start("match")
+
+    assert not search.step(budget=30)
+    assert search.match_count() == 3
+    assert search.find(100) == 90
+
+    while not search.step(budget=30):
+        pass
+    assert search.match_count() == 10
+    assert search.find(50) == 40
+    assert search.find(50, older=False) == 60
+    assert search.position_of(40) == 5
+
+    fill(store, 100, 120)
+    assert not search.is_complete()
+    search.step()
+    assert search.match_count() == 12
+
+    store.discard_before(35)
+    search.step()
+    assert search.find(35) is None
+    assert search.match_count() == 8
+
+
+def test_search_cached_after_trimming():
+    store = LineStore()
+    fill(store, 0, 200)
+    search = HistorySearch(store)
+    search.start("match")
+    while not search.step():
+        pass
+    search.stop()
+
+    fill(store, 200, 5000)
+    store.discard_before(4000)
+    search.start("match")
+    complete = False
+    while not complete:
+        complete = search.step()
+        assert all(index >= store.first_index() for index in search.get_active().matches)
+    assert search.match_count() == 100
+    assert search.find(4000, older=False) == 4010
@@ -0,0 +1,27 @@
+from server.service_manager import ServiceManager
+
+
+def _data(seq, time):
+    return {"type": "data", "endpoint": "0", "fd": "stdout", "data": "x",
+            "seq": seq, "date": "2024-05-01", "time": time}
+
+
+def _marker(time):
+    return {"type": "marker", "name": "M", "date": "2024-05-01", "time": time}
+
+
+def test_find_late_join_records():
+    manager = ServiceManager()
+    manager.set_late_join_buf_size(100)
+    records = [_data(0, "12:00:00"), _data(1, "12:00:01"), _marker("12:00:01"), _marker("12:00:02"),
+               _data(2, "12:00:02"), _data(3, "12:00:03")]
+    for record in records:
+        manager.add_to_late_join_buf(record)
+
+    assert manager.find_late_join_records() == (records, 0)
+    assert manager.find_late_join_records(since_seq=1)[1] == 1
+    # Markers come with the data record following them
+    assert manager.find_late_join_records(since_seq=2)[1] == 2
+    assert manager.find_late_join_records(since_seq=4)[1] == 6
+    assert manager.find_late_join_records(since_time=("2024-05-01", "12:00:02"))[1] == 3
+    assert manager.find_late_join_records(since_seq=3, since_time=("2024-05-01", "12:00:02"))[1] == 5
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+import pytest
+from server.session import SessionRecorder, ReplayCommunication, read_session
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_record_and_read_session(tmp_path, suffix):
+    filename = str(tmp_path / ("session" + suffix))
+    recorder = SessionRecorder(filename, now=10.0)
+    recorder.record_data("a", "&a", "stdout", "first line", now=10.5)
+    recorder.record_marker("MARKER 1", now=11.0)
+    recorder.record_data("b", "&b", "stderr", "second \"line\"", now=12.25)
+    recorder.close()
+
+    assert list(read_session(filename)) == [
+        [500000, "d", "a", "&a", "stdout", "first line"],
+        [1000000, "m", "MARKER 1"],
+        [2250000, "d", "b", "&b", "stderr", "second \"line\""]
+    ]
+
+
+def test_read_session_rejects_other_files(tmp_path):
+    filename = tmp_path / "other.txt"
+    filename.write_text("just a log\n")
+    with pytest.raises(ValueError):
+        list(read_session(str(filename)))
+
+
+def test_replay_at_full_speed(tmp_path):
+    filename = str(tmp_path / "session.jsonl")
+    recorder = SessionRecorder(filename, now=0.0)
+    for ix in range(100):
+        recorder.record_data("a", "&a", "stdout", "line %d" % ix, now=ix * 3600.0)
+    recorder.record_marker("end", now=400000.0)
+    recorder.close()
+
+    records = []
+    markers = []
+    exitcodes = []
+    replay = ReplayCommunication(SimpleNamespace(filename=filename, speed=0), "&r",
+                                 lambda *record: records.append(record), markers.append)
+    replay.set_command_finished_callback(exitcodes.append)
+    replay.run()
+    replay.wait()
+
+    assert exitcodes == [0]
+    assert len(records) == 100
+    assert records[7] == ("a", "&a", "stdout", "line 7")
+    assert markers == ["end"]
+    assert replay.get_statistics()['replayed']['count'] == 100
+
+
+def test_replay_stops_while_waiting(tmp_path):
+    filename = str(tmp_path / "session.jsonl")
+    recorder = SessionRecorder(filename, now=0.0)
+    recorder.record_data("a", "&a", "stdout", "now", now=0.0)
+    recorder.record_data("a", "&a", "stdout", "in an hour", now=3600.0)
+    recorder.close()
+
+    records = []
+    replay = ReplayCommunication(SimpleNamespace(filename=filename, speed=1), "&r",
+                                 lambda *record: records.append(record), None)
+    replay.run()
+    replay.stop()
+    replay.wait()
+    assert len(records) <= 1
@@ -0,0 +1,22 @@
+from view.spill_log import SpillLog
+
+
+def test_spill_log_fifo_across_segments():
+    log = SpillLog()
+    log.SEGMENT_SIZE = 1000
+    log.WRITE_SIZE = 100
+    for ix in range(0, 500):
+        log.append({"data": "line %d" % ix, "seq": ix, "endpoint": "0"})
+    assert len(log) == 500
+    assert len(log._segments) > 1
+
+    records = log.read(120)
+    assert [r['seq'] for r in records] == list(range(0, 120))
+
+    log.append({"data": "last", "seq": 500})
+    records = log.read(1000)
+    assert records[0]['data'] == "line 120"
+    assert records[-1]['data'] == "last"
+    assert len(log) == 0
+    assert log.size_bytes() == 0
+    assert len(log._segments) == 0
@@ -0,0 +1,31 @@
+from server.statistics import RateCounter, LatencyStatistics
+
+
+def test_rate_counter_windows():
+    counter = RateCounter(now=100.0)
+    for second in range(100, 110):
+        for _ in range(5):
+            counter.add(10, now=second + 0.5)
+
+    rates = counter.rates(now=110.2)
+    assert rates['1s'] == {"count": 5, "bytes": 50}
+    assert rates['10s'] == {"count": 5, "bytes": 50}
+    assert rates['60s']['count'] == 50 / 60
+    assert counter.total_count == 50
+
+    # Nothing was counted since, the old buckets must not be reused
+    rates = counter.rates(now=170.0)
+    assert rates['1s']['count'] == 0
+    assert rates['60s']['count'] == 0
+
+    counter.add(1, now=200.1)
+    assert counter.rates(now=201.0)['1s'] == {"count": 1, "bytes": 1}
+    assert counter.rates(now=201.0)['10s']['count'] == 0.1
+
+
+def test_latency_statistics():
+    latency = LatencyStatistics()
+    assert latency.to_dict()['avg-us'] == 0
+    latency.add(1000)
+    latency.add(3000)
+    assert latency.to_dict() == {"count": 2, "avg-us": 2.0, "max-us": 3.0}
@@ -0,0 +1,40 @@
+import threading as thrd
+from server.subprocess import SubprocessCommunication
+
+
+def _run(command):
+    records = []
+    finished = thrd.Event()
+    process = SubprocessCommunication(command, "t", lambda action, fd, data: records.append((fd, data)))
+    process.set_command_finished_callback(lambda exitcode: finished.set())
+    process.run()
+    return process, records, finished
+
+
+def test_input_after_exit_is_acknowledged():
+    process, _, finished = _run("true")
+    assert finished.wait(5)
+    written = []
+    process.send_raw(b"data\n", on_written=lambda: written.append(1))
+    process.send_raw(None, on_written=lambda: written.append(2))
+    assert written == [1, 2]
+
+
+def test_input_queued_at_exit_is_acknowledged():
+    process, _, finished = _run("sleep 0.3")
+    written = thrd.Event()
+    for _ in range(3):
+        process.send_raw(b"x" * 100, on_written=None)
+    process.send_raw(None, on_written=written.set)
+    assert finished.wait(5)
+    assert written.wait(1)
+
+
+def test_echo_by_lines():
+    process, records, finished = _run("sed -n '/^end$/q'")
+    # A character split between the chunks
+    process.send_raw(b"one\ntw", echo=True)
+    process.send_raw(b"o\nthr\xc3", echo=True)
+    process.send_raw(b"\xa9e\nend\n", echo=True)
+    assert finished.wait(5)
+    assert [data for fd, data in records if fd == 'stdin'] == ["one\n", "two\n", "thr\u00e9e\n", "end\n"]
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+import utils
+from utils import TerminalRawMode, PastedText, special_key
+
+
+def make_terminal(monkeypatch):
+    # The input is parsed without reading from the terminal
+    monkeypatch.setattr(utils, "stdin", SimpleNamespace(fileno=lambda: 0))
+    return TerminalRawMode()
+
+
+def test_paste_split_across_reads(monkeypatch):
+    terminal = make_terminal(monkeypatch)
+    assert terminal._parse_input("a\x1b[200~first ") == ["a"]
+    assert terminal._parse_input("second\x1b[20") == []
+    keys = terminal._parse_input("1~b")
+    assert keys == ["first second", "b"]
+    assert isinstance(keys[0], PastedText)
+
+
+def test_paste_line_endings(monkeypatch):
+    terminal = make_terminal(monkeypatch)
+    keys = terminal._parse_input("\x1b[200~one\r\ntwo\rthree\nfour\x1b[201~")
+    assert keys == ["one\ntwo\nthree\nfour"]
+
+
+def test_escape_sequence_split_across_reads(monkeypatch):
+    terminal = make_terminal(monkeypatch)
+    assert terminal._parse_input("x\x1b[1;5") == ["x"]
+    assert terminal._parse_input("Ay") == [special_key("C-Up"), "y"]
+    assert terminal._parse_input("\x1bO") == []
+    assert terminal._parse_input("P") == [special_key("F1")]
+
+
+def test_lone_escape(monkeypatch):
+    terminal = make_terminal(monkeypatch)
+    assert terminal._parse_input("\x1b") == [TerminalRawMode.KEY_ESC]
+    assert terminal._parse_input("\x1b\x1b[A") == [TerminalRawMode.KEY_ESC, special_key("Up")]
+    assert terminal._parse_input("\x1bq") == [special_key("M-q")]
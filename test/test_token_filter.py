@@ -0,0 +1,40 @@
+from server.token_filter import BloomFilter, required_tokens, tokenize
+
+
+def test_bloom_filter():
+    tokens = set("token%d" % ix for ix in range(1000))
+    bloom = BloomFilter.build(tokens)
+    assert all(bloom.might_contain(token) for token in tokens)
+    false_positives = sum(1 for ix in range(1000) if bloom.might_contain("other%d" % ix))
+    assert false_positives < 30
+
+    copy = BloomFilter(bloom.to_bytes())
+    assert copy.might_contain_all(["token1", "token999"])
+    assert not copy.might_contain_all(["token1", "missing"])
+
+
+def test_tokenize():
+    assert tokenize("Request id=4F2a failed: timeout_ms 500") == ["request", "id", "4f2a", "failed", "timeout_ms", "500"]
+
+
+def test_required_tokens():
+    # Words at the ends of the pattern may be parts of longer ones
+    assert required_tokens("req-42") == set()
+    assert required_tokens(r"\breq-42\b") == {"req", "42"}
+    assert required_tokens("user id=42 failed") == {"id", "42"}
+    assert required_tokens(r"^error: timeout at (\d+)$") == {"error", "timeout", "at"}
+    assert required_tokens("(?i)Error code 500 x") == {"code", "500"}
+    # Optional characters, classes and alternatives
+    assert required_tokens("foo bar* baz") == set()
+    assert required_tokens(" x [a-z]+ id=42 y") == {"x", "id", "42"}
+    assert required_tokens("ab\\.cd ef") == {"cd"}
+    assert required_tokens(" (one|two) ") == set()
+    assert required_tokens("one|two") == set()
+    assert required_tokens(None) == set()
+    # Flags and escapes as the regular expression engine reads them
+    assert required_tokens(r"(?x)a request id b") == set()
+    assert required_tokens(r"\N{LATIN SMALL LETTER A} x") == set()
+    assert required_tokens(r"a\x62 x") == set()
+    assert required_tokens(r"x id\U00000020y") == {"id"}
+    assert required_tokens(r"x(?: id=\d+ )+") == {"id"}
+    assert required_tokens(r" (?:id )? x") == set()
@@ -0,0 +1,79 @@
+import threading as thrd
+
+# Records carry the monotonic timestamps (in nanoseconds) of the stages
+# they have passed, in this order. The stamps of the server and of the
+# viewer can be compared only if both run on the same host.
+STAGES = ["read", "emit", "enqueue", "decode", "render"]
+
+_thread_state = thrd.local()
+
+
+def set_read_stamp(stamp):
+    # The separators run in the thread which read the data, so the stamp
+    # of the last read is found by the code emitting the record
+    _thread_state.read_stamp = stamp
+
+
+def get_read_stamp():
+    return getattr(_thread_state, 'read_stamp', None)
+
+
+class LatencyHistogram:
+    # Logarithmic buckets, SUB_BUCKETS per power of two, which bounds the
+    # error of the percentiles to about 20%
+    SUB_BUCKETS = 4
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.max_ns = 0
+
+    @classmethod
+    def _bucket(cls, value_ns):
+        if value_ns <= 1:
+            return 0
+        exponent = value_ns.bit_length() - 1
+        fraction = (value_ns - (1 << exponent)) * cls.SUB_BUCKETS >> exponent
+        return exponent * cls.SUB_BUCKETS + fraction
+
+    @classmethod
+    def _bucket_upper_bound(cls, bucket):
+        exponent, fraction = divmod(bucket, cls.SUB_BUCKETS)
+        return (1 << exponent) + ((fraction + 1) << exponent) // cls.SUB_BUCKETS
+
+    def add(self, value_ns):
+        value_ns = max(value_ns, 0)
+        bucket = self._bucket(value_ns)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def percentile(self, share):
+        if self.count == 0:
+            return 0
+        threshold = share * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= threshold:
+                return min(self._bucket_upper_bound(bucket), self.max_ns)
+        return self.max_ns
+
+    def to_dict(self):
+        return {"counts": self.counts, "max": self.max_ns}
+
+    @staticmethod
+    def from_dict(data):
+        histogram = LatencyHistogram()
+        for bucket, count in data['counts'].items():
+            histogram.counts[int(bucket)] = count
+            histogram.count += count
+        histogram.max_ns = data['max']
+        return histogram
@@ -1,4 +1,8 @@
 from sys import stdin, stdout
+from collections import deque
+import codecs
+import os
+import re
 import tty
 import termios
 
@@ -76,10 +80,42 @@ def parse_yes_no_option(arg_name: str, arg_value: str):
         exit(1)
 
 
+def parse_size(value):
+    # Accepts plain numbers of bytes or numbers with K, M or G suffix
+    if value is None or isinstance(value, int):
+        return value
+
+    MULTIPLIERS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    value = value.strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    if len(value) > 0 and value[-1] in MULTIPLIERS:
+        return int(float(value[:-1]) * MULTIPLIERS[value[-1]])
+    return int(value)
+
+
+def parse_duration(value):
+    # Accepts plain numbers of seconds or numbers with s, m, h or d suffix
+    if value is None or isinstance(value, (int, float)):
+        return value
+
+    MULTIPLIERS = {"S": 1, "M": 60, "H": 3600, "D": 86400}
+    value = value.strip().upper()
+    if len(value) > 0 and value[-1] in MULTIPLIERS:
+        return float(value[:-1]) * MULTIPLIERS[value[-1]]
+    return float(value)
+
+
 def special_key(data):
     return "\x01%s\x02" % data
 
 
+class PastedText(str):
+    # Text received from the terminal in bracketed paste mode; delivered as
+    # a single event instead of a sequence of keys
+    pass
+
+
 def create_progress_bar(position, maximum, width):
     BLK_CHARS = ['\u258f', '\u258e', '\u258d', '\u258c', 
                  '\u258b', '\u258a', '\u2589', '\u2588']
@@ -111,6 +147,13 @@ def text_window(content, max_size):
         first_char = 0
     return "%-*s" % (max_size, content[first_char:first_char + max_size - 1])
 
+ANSI_SEQUENCE_REGEX = re.compile("\x1b\\[[0-9;?]*[ -/]*[@-~]")
+
+
+def visible_length(content):
+    return len(ANSI_SEQUENCE_REGEX.sub("", content))
+
+
 class TerminalRawMode:
     IFLAG = 0
     OFLAG = 1
@@ -127,9 +170,15 @@ class TerminalRawMode:
     KEY_DOWN_ARROW = special_key("Down")
     KEY_LEFT_ARROW = special_key("Left")
     KEY_RIGHT_ARROW = special_key("Right")
+    KEY_PAGE_UP = special_key("PgUp")
+    KEY_PAGE_DOWN = special_key("PgDn")
 
     CURSOR_BLINKING_BAR = '5'
 
+    PASTE_START = "[200~"
+    PASTE_END = "\x1b[201~"
+    READ_SIZE = 65536
+
     def __init__(self):
         self._fd = stdin.fileno()
         self._original_attrs = None
@@ -201,6 +250,9 @@ class TerminalRawMode:
             ("ESC [23;5~", "C-F11"),
             ("ESC [24;5~", "C-F12"),
 
+            ("ESC [5~", "PgUp"),
+            ("ESC [6~", "PgDn"),
+
             ("ESC [A", "Up"),
             ("ESC [B", "Down"),
             ("ESC [C", "Right"),
@@ -243,8 +295,14 @@ class TerminalRawMode:
         self._terminal_rows = 25
         self._terminal_cols = 80
         self._resize_cb = None
-
-    def enter_raw_mode(self):
+        self._output_buffer = []
+        self._scroll_region_set = False
+        self._input_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending_input = ""
+        self._pasted_content = None
+        self._pending_keys = deque()
+
+    def enter_raw_mode(self, read_timeout=1):
         self._original_attrs = termios.tcgetattr(self._fd)
         new_attrs = termios.tcgetattr(self._fd)
 
@@ -253,27 +311,24 @@ class TerminalRawMode:
         new_attrs[self.CFLAG] |= termios.CS8
         new_attrs[self.LFLAG] &= ~(termios.ECHO | termios.ICANON | termios.IEXTEN | termios.ISIG)
         new_attrs[self.CC][termios.VMIN] = 0
-        new_attrs[self.CC][termios.VTIME] = 1
+        # read_timeout is expressed in tenths of a second; 0 makes reading
+        # from stdin non-blocking
+        new_attrs[self.CC][termios.VTIME] = read_timeout
 
         termios.tcsetattr(self._fd, termios.TCSAFLUSH, new_attrs)
+        # Enable bracketed paste mode
+        self.write("\x1b[?2004h", flush=True)
 
     def exit_raw_mode(self):
+        if self._scroll_region_set:
+            self.reset_scroll_region()
+            self.set_cursor_position(1, self._terminal_rows)
+        self.write("\x1b[?2004l", flush=True)
         termios.tcsetattr(self._fd, termios.TCSAFLUSH, self._original_attrs)
 
     def set_resize_cb(self, callback: callable):
         self._resize_cb = callback
 
-    def _ansi_read_many(self):
-        result = ""
-        while True:
-            data = stdin.read(1)
-            if len(data) == 0:
-                return result
-            else:
-                result += data
-                if ord(data) >= 0x40 and ord(data) <= 0x7F:
-                    return result
-
     def _on_terminal_dimensions(self, data):
         rows_s, cols_s = data.split(';')
         self._terminal_rows = int(rows_s)
@@ -285,52 +340,145 @@ class TerminalRawMode:
     def get_dimensions(self):
         return (self._terminal_rows, self._terminal_cols)
 
-    def read_key(self, blocking=True):
-        result = ""
-        char0 = stdin.read(1)
-        if len(char0) == 0:
-            return ""
-        elif char0 == "\x1b":
-            char1 = stdin.read(1)
-            if len(char1) == 0:
-                result = self.KEY_ESC
-            else:
-                rest = self._ansi_read_many()
-                if char1 == "\x1b":
-                    result = self.KEY_ESC + special_key("ESC " + self.read_key(blocking))
-                elif self._expect_dimensions and char1 == '[' and rest.endswith('R'):
-                    # Perform special handling of \x1b[x;yR: this is the response
-                    # from terminal containing the number of rows and columns
-                    self._on_terminal_dimensions(rest[:-1])
-                    return ""
-                else:
-                    result = special_key("ESC %s%s" % (char1, rest))
-
-        elif char0 >= ' ':
-            result = char0
+    def _parse_escape_sequence(self, data, pos):
+        # Returns the key and the number of characters consumed, or (None, 0)
+        # if the sequence is not complete yet
+        if pos + 1 >= len(data):
+            return self.KEY_ESC, 1
+
+        char1 = data[pos + 1]
+        if char1 == "\x1b":
+            return self.KEY_ESC, 1
+        elif char1 == "[":
+            end = pos + 2
+            while end < len(data) and not (ord(data[end]) >= 0x40 and ord(data[end]) <= 0x7E):
+                end += 1
+            if end >= len(data):
+                return None, 0
+
+            sequence = data[pos + 1:end + 1]
+            if sequence == self.PASTE_START:
+                self._pasted_content = ""
+                return "", len(sequence) + 1
+            elif self._expect_dimensions and sequence.endswith('R'):
+                # Perform special handling of \x1b[x;yR: this is the response
+                # from terminal containing the number of rows and columns
+                self._on_terminal_dimensions(sequence[1:-1])
+                return "", len(sequence) + 1
+            return special_key("ESC %s" % sequence), len(sequence) + 1
+        elif char1 == "O":
+            if pos + 2 >= len(data):
+                return None, 0
+            return special_key("ESC O%s" % data[pos + 2]), 3
         else:
-            result = special_key("%02x" % ord(char0))
+            return special_key("ESC %s" % char1), 2
+
+    def _parse_input(self, data):
+        keys = []
+        data = self._pending_input + data
+        self._pending_input = ""
+        pos = 0
+
+        while pos < len(data):
+            if self._pasted_content is not None:
+                self._pasted_content += data[pos:]
+                end = self._pasted_content.find(self.PASTE_END)
+                if end == -1:
+                    break
+
+                data = self._pasted_content[end + len(self.PASTE_END):]
+                pasted = self._pasted_content[:end].replace("\r\n", "\n").replace("\r", "\n")
+                keys.append(PastedText(pasted))
+                self._pasted_content = None
+                pos = 0
+                continue
+
+            char0 = data[pos]
+            if char0 == "\x1b":
+                key, length = self._parse_escape_sequence(data, pos)
+                if length == 0:
+                    self._pending_input = data[pos:]
+                    break
+            elif char0 >= ' ':
+                key, length = char0, 1
+            else:
+                key, length = special_key("%02x" % ord(char0)), 1
+
+            pos += length
+            if key != "":
+                keys.append(self._translation.get(key, key))
 
-        return self._translation.get(result, result)
+        return keys
+
+    def read_keys(self):
+        # Drains everything that is available on stdin and returns all the
+        # keys (and pasted texts) found there
+        chunks = []
+        while True:
+            try:
+                data = os.read(self._fd, self.READ_SIZE)
+            except BlockingIOError:
+                break
+            if len(data) == 0:
+                break
+            chunks.append(data)
+            if len(data) < self.READ_SIZE:
+                break
+
+        if len(chunks) == 0:
+            return []
+        return self._parse_input(self._input_decoder.decode(b"".join(chunks)))
+
+    def read_key(self, blocking=True):
+        if len(self._pending_keys) == 0:
+            self._pending_keys.extend(self.read_keys())
+        if len(self._pending_keys) == 0:
+            return ""
+        return self._pending_keys.popleft()
 
     def request_terminal_size(self):
         self.write("\x1b[999;999f\x1b[6n", flush=True)
         self._expect_dimensions = True
 
     def write(self, line, flush=False):
-        stdout.write("%s" % line)
+        self._output_buffer.append(line)
         if flush:
             self.flush()
 
     def flush(self):
+        # Everything written since the last flush goes to the terminal with
+        # a single write() call
+        if len(self._output_buffer) == 0:
+            return
+        data = memoryview("".join(self._output_buffer).encode('utf-8'))
+        self._output_buffer.clear()
         stdout.flush()
+        fd = stdout.fileno()
+        while len(data) > 0:
+            written = os.write(fd, data)
+            data = data[written:]
 
     def write_line(self, line):
-        stdout.write("%s\r\n" % line)
-        self.flush()
+        self._output_buffer.append(line)
+        self._output_buffer.append("\r\n")
+
+    def write_scrolled_line(self, line):
+        # Intended to be used with the cursor at the bottom of the scroll
+        # region: the line feed scrolls the region up, then the line is
+        # written on the freed row
+        self._output_buffer.append("\r\n")
+        self._output_buffer.append(line)
+
+    def set_scroll_region(self, top, bottom):
+        self._output_buffer.append("\x1b[%d;%dr" % (top, bottom))
+        self._scroll_region_set = True
+
+    def reset_scroll_region(self):
+        self._output_buffer.append("\x1b[r")
+        self._scroll_region_set = False
 
     def set_format(self, format):
-        stdout.write("\x1b[%sm" % format)
+        self._output_buffer.append("\x1b[%sm" % format)
 
     def set_cursor_position(self, col, row=None):
         if row is None:
@@ -343,14 +491,14 @@ class TerminalRawMode:
 
     def reset_current_line(self, format="0"):
         # Move to first column, reset formatting, clear till the end of line
-        stdout.write("\x1b[G\x1b[%sm\x1b[K" % format)
+        self._output_buffer.append("\x1b[G\x1b[%sm\x1b[K" % format)
 
 if __name__ == "__main__":
     rawmode = TerminalRawMode()
     rawmode.enter_raw_mode()
     while True:
         data = rawmode.read_key()
-        rawmode.write(data)
+        rawmode.write(data, flush=True)
 
         if data == "Q": break
 
@@ -1,4 +1,4 @@
-from utils import fatal_error, warning, lw_assert
+from utils import fatal_error, warning, lw_assert, parse_size
 from view.formatter import Style, resolve_color, Format
 import re
 import yaml
@@ -25,6 +25,9 @@ class Watch:
     def is_regex_valid(self):
         return self._prepared_regex is not None
 
+    def search(self, line):
+        return self._prepared_regex is not None and self._prepared_regex.search(line) is not None
+
     def match(self, line):
         if self._prepared_regex is None:
             return False
@@ -98,6 +101,18 @@ class Configuration:
         self.watches = {}
         self.commands = {}
         self.max_held_lines = None
+        self.max_held_bytes = None
+        self.history_lines = None
+        self.history_bytes = None
+        self.spill_to_disk = False
+        self.max_spill_bytes = None
+        self.frame_rate = 60
+        self.decode_workers = 0
+        self.profile_directory = None
+        self.headless = False
+        self.plain_output = False
+        self.output_file = None
+        self.latency_report_file = None
         self.default_endpoint = '0'
         self.colors = ColorsConfiguration()
 
@@ -213,6 +228,23 @@ class Configuration:
 
             self.filtered_mode = view_data.get('filtered', False)
             self.max_held_lines = view_data.get('max-held-lines', None)
+            try:
+                self.max_held_bytes = parse_size(view_data.get('max-held-bytes', None))
+            except ValueError:
+                fatal_error("Invalid value of max-held-bytes: %s" % view_data['max-held-bytes'])
+            self.spill_to_disk = view_data.get('spill-to-disk', False)
+            try:
+                self.max_spill_bytes = parse_size(view_data.get('max-spill-bytes', None))
+            except ValueError:
+                fatal_error("Invalid value of max-spill-bytes: %s" % view_data['max-spill-bytes'])
+            self.frame_rate = view_data.get('frame-rate', self.frame_rate)
+            self.decode_workers = view_data.get('decode-workers', self.decode_workers)
+            self.profile_directory = view_data.get('profile-directory', self.profile_directory)
+            self.history_lines = view_data.get('history-lines', None)
+            try:
+                self.history_bytes = parse_size(view_data.get('history-bytes', None))
+            except ValueError:
+                fatal_error("Invalid value of history-bytes: %s" % view_data['history-bytes'])
             self.default_endpoint = view_data.get('default-endpoint', self.default_endpoint)
 
             for style in view_data.get('styles', []):
@@ -2,30 +2,147 @@ from view.configuration import Configuration
 from view.formatter import Formatter, ansi_format, ansi_format1
 from view.formatter import repr_watch_register, repr_endpoint_register
 from view.interactive_mode import InteractiveModeContext
-from collections import deque
+from view.line_filter import LineFilter
+from view.line_store import LineStore
+from view.search import HistorySearch
+from view.spill_log import SpillLog
+from view.latency import LatencyTracker
+from collections import OrderedDict, deque
+from time import monotonic, monotonic_ns
 from utils import info, warning
 from utils import TerminalRawMode
-from utils import create_progress_bar, text_window
+from utils import create_progress_bar, text_window, visible_length
 import common
 
 
 SYM_VERTICAL_THICK_BAR="\u2503"
+SYM_ARROW_UP="\u2191"
+
+
+def make_marker_record(data):
+    data['data'] = data['name']
+    data['seq'] = '-'
+    data['endpoint'] = common.SYSTEM_ENDPOINT
+    data['fd'] = 'marker'
+    return data
+
+
+def make_message_record(msg, fd="info"):
+    return {
+        "data": msg,
+        "endpoint": common.SELF_ENDPOINT,
+        "fd": fd
+    }
+
+
+def format_record(config: Configuration, formatter: Formatter, data, frame: list, matched_register=None):
+    # Appends the rows of a record to the frame; matched_register is the
+    # register of the watch the line matches, if any
+    data['endpoint-symbol'] = repr_endpoint_register(data['endpoint'])
+
+    if matched_register is not None:
+        watch = config.watches[matched_register]
+        watch.match(data['data'])
+        data['watch'] = matched_register
+        data['watch-symbol'] = repr_watch_register(matched_register)
+        data['matches'] = watch.matches
+
+        # TODO: other condition should not be required
+        if watch.replacement is not None and watch.replacement != "":
+            repl = watch.replacement
+            for ix, match in enumerate(data['matches']):
+                repl = repl.replace('\\%d' % (ix + 1), match)
+            data['data'] = repl
+    else:
+        data['watch'] = ""
+        data['watch-symbol'] = repr_watch_register(None)
+        data['matches'] = []
+
+    first_row = True
+    for content in data['data'].split('\n'):
+        data_row = data
+        data_row['data'] = content
+        use_format = config.line_format if first_row else config.continued_line_format
+        frame.append(formatter.format_line(use_format, data_row))
+        first_row = False
+
+
+class RenderedRowsCache:
+    # Small LRU of formatted rows of the lines displayed in the history view,
+    # valid for the width of the terminal they were rendered at
+    def __init__(self, capacity=1024):
+        self._capacity = capacity
+        self._rows = OrderedDict()
+        self._width = None
+
+    def set_width(self, width):
+        if width != self._width:
+            self._rows.clear()
+            self._width = width
+
+    def get(self, index):
+        rows = self._rows.get(index)
+        if rows is not None:
+            self._rows.move_to_end(index)
+        return rows
+
+    def put(self, index, rows):
+        self._rows[index] = rows
+        if len(self._rows) > self._capacity:
+            self._rows.popitem(last=False)
+
+    def clear(self):
+        self._rows.clear()
+
 
 class ConsoleOutput:
+    SCROLL_PAGE_UP = InteractiveModeContext.SCROLL_PAGE_UP
+    SCROLL_PAGE_DOWN = InteractiveModeContext.SCROLL_PAGE_DOWN
+    SCROLL_TOP = InteractiveModeContext.SCROLL_TOP
+    SCROLL_BOTTOM = InteractiveModeContext.SCROLL_BOTTOM
+
+    SPILL_DRAIN_PER_FRAME = 20000
+
     def __init__(self, config: Configuration, formatter: Formatter, term: TerminalRawMode, interactive: InteractiveModeContext):
         self._config = config
         self._formatter = formatter
         self._terminal = term
         self._interact = interactive
-        self._held_lines = deque()
+        # All the lines received, both already printed and held. Lines
+        # starting from the print cursor are the held ones.
+        self._lines = LineStore()
+        self._print_cursor = 0
+        self._held_bytes = 0
         self._max_held_lines = 5000
+        self._max_held_bytes = None
+        self._max_history_lines = 100000
+        self._max_history_bytes = None
+        self._spill = None
+        self._max_spill_bytes = None
         self._pause = False
         self._held_lines_overflow = False
         self._drop_newest_lines = False
         self._status_line_req_update = True
+        self._status_segments = []
+        self._status_cursor_column = 1
+        self._status_cursor_misplaced = True
+        self._scroll_region_rows = None
+        self._scroll_top = None
+        self._scroll_req_update = False
+        self._filter = LineFilter(self._lines, config)
+        self._rendered_rows = RenderedRowsCache()
+        self._search = HistorySearch(self._lines)
+        self._search_position = None
+        self._search_jump_pending = None
         self._server_state = ""
         self._endpoints = {}
         self._other_actions = {}
+        self._server_rates = ""
+        # Stamps of the traced lines which have not been rendered yet
+        self._traces = deque()
+        self._latency = LatencyTracker()
+        self._frame_interval = 1.0 / 60
+        self._last_frame_time = 0.0
 
     def set_max_held_lines(self, size):
         if size is not None:
@@ -34,108 +151,430 @@ class ConsoleOutput:
         else:
             info("No maximum number of held lines set, using default of %d" % self._max_held_lines)
 
+    def set_max_held_bytes(self, size):
+        if size is not None:
+            info("Set maximum size of held lines to %d bytes" % size)
+        self._max_held_bytes = size
+
+    def set_max_history(self, lines, size):
+        if lines is not None:
+            self._max_history_lines = lines
+        self._max_history_bytes = size
+
+    def set_spill_to_disk(self, enabled, max_size=None):
+        if enabled:
+            info("Held lines over the limit will be stored in a temporary file")
+            self._spill = SpillLog()
+            self._max_spill_bytes = max_size
+
+    def _spill_full(self):
+        return self._max_spill_bytes is not None and self._spill.size_bytes() >= self._max_spill_bytes
+
+    def _held_lines_count(self):
+        return self._lines.end_index() - self._print_cursor
+
+    def _held_lines_full(self):
+        if self._held_lines_count() >= self._max_held_lines:
+            return True
+        return self._max_held_bytes is not None and \
+            self._held_lines_count() > 0 and \
+            self._held_bytes >= self._max_held_bytes
+
+    def _held_lines_fill(self):
+        fill = self._held_lines_count() / self._max_held_lines
+        if self._max_held_bytes is not None:
+            fill = max(fill, self._held_bytes / self._max_held_bytes)
+        return min(fill, 1.0)
+
+    def _advance_print_cursor(self, index):
+        while self._print_cursor < index:
+            self._held_bytes -= self._lines.line_size(self._print_cursor)
+            self._print_cursor += 1
+
+    def _trim_history(self):
+        history_end = self._print_cursor
+        if self._scroll_top is not None:
+            history_end = min(history_end, self._scroll_top)
+
+        first = self._lines.first_index()
+        new_first = max(first, self._print_cursor - self._max_history_lines)
+        if self._max_history_bytes is not None:
+            history_bytes = self._lines.size_bytes() - self._held_bytes
+            while new_first < history_end and history_bytes > self._max_history_bytes:
+                history_bytes -= self._lines.line_size(new_first)
+                new_first += 1
+
+        # Lines displayed in the history view are not removed
+        new_first = min(new_first, history_end)
+        if new_first > first:
+            self._lines.discard_before(new_first)
+            self._filter.discard_before(new_first)
+
+    def set_frame_rate(self, fps):
+        if fps is not None and fps > 0:
+            self._frame_interval = 1.0 / fps
+
     def set_drop_newest_lines_policy(self, value):
         self._drop_newest_lines = value
 
-    def _print_line(self, data):
-        matched_register = None
-        for register, watch in self._config.watches.items():
-            if watch.enabled and watch.match(data['data']):
-                matched_register = register
-                break
-
-        data['endpoint-symbol'] = repr_endpoint_register(data['endpoint'])
-
-        if matched_register is not None:
-            data['watch'] = matched_register
-            data['watch-symbol'] = repr_watch_register(matched_register)
-            data['matches'] = watch.matches
+    def _format_line(self, data, frame: list, matched_register=None):
+        format_record(self._config, self._formatter, data, frame, matched_register)
+
+    def _format_stored_line(self, index, frame: list):
+        self._format_line(self._lines.get(index), frame, self._filter.matched_watch(index))
+
+    def _store_line(self, data, watch_matches=None):
+        index = self._lines.append(data)
+        if 'trace' in data:
+            self._traces.append((index, data['trace']))
+        self._held_bytes += self._lines.line_size(index)
+        self._filter.add_line(index, watch_matches)
+        self._trim_history()
+
+    def _refill_from_spill(self):
+        while len(self._spill) > 0 and not self._held_lines_full():
+            count = min(self._max_held_lines - self._held_lines_count(), SpillLog.READ_BATCH)
+            for data in self._spill.read(max(count, 1)):
+                self._store_line(data)
+
+    def _spill_line(self, data):
+        # Once the spill file is in use, all the new lines go there, so
+        # that they are read back in order
+        if self._spill_full():
+            self._held_lines_overflow = True
+            if self._drop_newest_lines:
+                return
+            self._advance_print_cursor(min(self._print_cursor + SpillLog.READ_BATCH, self._lines.end_index()))
+            self._refill_from_spill()
+        self._spill.append(data)
+
+    def _hold(self, data, watch_matches=None):
+        if self._spill is not None and (len(self._spill) > 0 or self._held_lines_full()):
+            self._spill_line(data)
+            return
 
-            # TODO: other condition should not be required
-            if watch.replacement is not None and watch.replacement != "":
-                repl = watch.replacement
-                for ix, match in enumerate(data['matches']):
-                    repl = repl.replace('\\%d' % (ix + 1), match)
-                data['data'] = repl
-        else:
-            data['watch'] = ""
-            data['watch-symbol'] = repr_watch_register(None)
-            data['matches'] = []
-
-        show_mode = self._config.get_endpoint_show_mode(data['endpoint'])
-        print_line = (show_mode == Configuration.SHOW_ALL) or \
-                     (show_mode == Configuration.SHOW_FILTERED and matched_register is not None)
-
-        if print_line:
-            first_row = True
-            for content in data['data'].split('\n'):
-                data_row = data
-                data_row['data'] = content
-                self._terminal.reset_current_line()
-                use_format = self._config.line_format if first_row else self._config.continued_line_format
-                self._terminal.write_line(self._formatter.format_line(use_format, data_row))
-                self._status_line_req_update = True
-                first_row = False
-
-    def _hold(self, data):
-        drop_line = False
-        while len(self._held_lines) >= self._max_held_lines:
+        while self._held_lines_full():
             if not self._held_lines_overflow:
                 self._held_lines_overflow = True
 
             if self._drop_newest_lines:
-                drop_line = True
+                return
             else:
-                self._held_lines.popleft()
+                # The oldest held line is not lost, it stays in the history
+                self._advance_print_cursor(self._print_cursor + 1)
 
-        if not drop_line:
-            self._held_lines.append(data)
+        self._store_line(data, watch_matches)
 
-    def print_line(self, data):
-        self._hold(data)
-        self._status_line_req_update = True
+    def print_line(self, data, watch_matches=None):
+        self._hold(data, watch_matches)
+        if self._pause or self._scroll_top is not None:
+            self._status_line_req_update = True
 
     def print_marker(self, data):
-        data['data'] = data['name']
-        data['seq'] = '-'
-        data['endpoint'] = common.SYSTEM_ENDPOINT
-        data['fd'] = 'marker'
-        self._hold(data)
+        self._hold(make_marker_record(data))
 
     def print_message(self, msg, fd="info"):
-        self._hold({
-            "data": msg,
-            "endpoint": common.SELF_ENDPOINT,
-            "fd": fd
-        })
+        self._hold(make_message_record(msg, fd))
 
     def notify_active_actions(self, endpoints, other_actions):
         self._endpoints = endpoints
         self._other_actions = other_actions
         self.notify_status_line_changed()
 
+    def notify_server_rates(self, rates):
+        server_rates = " %d rec/s " % rates['records-per-s']
+        if server_rates != self._server_rates:
+            self._server_rates = server_rates
+            self.notify_status_line_changed()
+
     def pause(self):
         self._pause = True
 
     def resume(self):
         self._pause = False
         self._held_lines_overflow = False
-        self.write_pending_lines()
+
+    def _skip_backlog(self, rows):
+        # When more lines are pending than fit on the screen, only the last
+        # screenful is formatted; the rest would scroll away immediately anyway
+        start = self._lines.end_index()
+        for _ in range(0, rows - 1):
+            index = self._filter.prev_visible(start, self._print_cursor)
+            if index is None:
+                break
+            start = index
+
+        skipped = start - self._print_cursor
+        if self._filter.prev_visible(start, self._print_cursor) is None:
+            skipped = 0
+        if skipped <= 0:
+            return 0
+
+        self._advance_print_cursor(start)
+        return skipped
+
+    def _drain_spill(self, rows):
+        # Lines which would scroll away immediately are moved from the spill
+        # file straight to the history
+        drained = 0
+        while len(self._spill) >= rows and drained < self.SPILL_DRAIN_PER_FRAME:
+            drained += self._held_lines_count()
+            self._advance_print_cursor(self._lines.end_index())
+            self._refill_from_spill()
+        return drained
+
+    def _write_frame(self, frame):
+        if len(frame) == 0:
+            return False
+
+        # Log lines scroll within the region above the status line, so the
+        # status line itself does not need to be redrawn
+        rows = self._terminal.get_dimensions()[0]
+        self._terminal.set_cursor_position(1, rows - 1)
+        for row in frame:
+            self._terminal.write_scrolled_line(row)
+        self._status_cursor_misplaced = True
+        return True
+
+    def _update_scroll_region(self):
+        rows = self._terminal.get_dimensions()[0]
+        if self._scroll_region_rows != rows:
+            self._terminal.set_scroll_region(1, rows - 1)
+            self._scroll_region_rows = rows
+            self._status_segments = []
+            self._status_cursor_misplaced = True
 
     def write_pending_lines(self):
-        if self._pause:
+        if self._pause or self._scroll_top is not None or self._held_lines_count() == 0:
+            return False
+
+        frame = []
+        rows = self._terminal.get_dimensions()[0] - 1
+        skipped = 0
+        if self._spill is not None:
+            skipped = self._drain_spill(rows)
+        skipped += self._skip_backlog(rows)
+        if skipped > 0:
+            self._format_line({
+                "data": "... skipped %d lines ..." % skipped,
+                "endpoint": common.SELF_ENDPOINT,
+                "fd": "info"
+            }, frame)
+
+        while self._print_cursor < self._lines.end_index():
+            if self._filter.is_visible(self._print_cursor):
+                self._format_stored_line(self._print_cursor, frame)
+            self._advance_print_cursor(self._print_cursor + 1)
+
+        self._trim_history()
+        written = self._write_frame(frame)
+        if len(self._traces) > 0:
+            self._record_render_times()
+        return written
+
+    def _record_render_times(self):
+        now_ns = monotonic_ns()
+        while len(self._traces) > 0 and self._traces[0][0] < self._print_cursor:
+            _, stamps = self._traces.popleft()
+            self._latency.add_trace(stamps + [now_ns])
+
+    def get_latency_tracker(self):
+        return self._latency
+
+    def show_latency(self):
+        if self._latency.get_count() == 0:
+            self.print_message("No traced records received; is the server running with --trace-latency?")
+            return
+        for line in self._latency.get_report():
+            self.print_message(line)
+
+    def _get_rendered_rows(self, index):
+        # Rows are formatted lazily, only for the lines which are displayed
+        if not self._filter.is_visible(index):
+            return []
+
+        self._rendered_rows.set_width(self._terminal.get_dimensions()[1])
+        rows = self._rendered_rows.get(index)
+        if rows is None:
+            rows = []
+            self._format_stored_line(index, rows)
+            self._rendered_rows.put(index, rows)
+        return rows
+
+    def _step_back(self, index, rows):
+        # Hidden lines are skipped using the bitmap of visible lines
+        first = self._lines.first_index()
+        while rows > 0:
+            index = self._filter.prev_visible(index, first)
+            if index is None:
+                return first
+            rows -= len(self._get_rendered_rows(index))
+        return index
+
+    def _step_forward(self, index, rows):
+        end = self._lines.end_index()
+        while rows > 0:
+            index = self._filter.next_visible(index, end)
+            if index is None:
+                return end
+            rows -= len(self._get_rendered_rows(index))
+            index += 1
+        return index
+
+    def _redraw_live_view(self):
+        screen_rows = self._terminal.get_dimensions()[0] - 1
+        self._scroll_top = self._step_back(self._print_cursor, screen_rows)
+        self._render_history_window(end=self._print_cursor, align_bottom=True)
+        self._scroll_top = None
+
+    def _update_filter(self):
+        # Changes of the show modes and watches apply to the history as well
+        changed = self._filter.update()
+        if self._filter.step():
+            changed = True
+        if not changed:
             return
 
-        while len(self._held_lines) > 0:
-            data = self._held_lines.popleft()
-            self._print_line(data)
+        self._rendered_rows.clear()
+        self._status_line_req_update = True
+        if self._scroll_top is not None:
+            self._scroll_req_update = True
+        elif self._print_cursor > self._lines.first_index():
+            self._redraw_live_view()
+
+    def scroll(self, direction):
+        screen_rows = self._terminal.get_dimensions()[0] - 1
+        top = self._scroll_top
+        if top is None:
+            top = self._step_back(self._print_cursor, screen_rows)
+
+        if direction == self.SCROLL_PAGE_UP:
+            top = self._step_back(top, screen_rows)
+        elif direction == self.SCROLL_PAGE_DOWN:
+            top = self._step_forward(top, screen_rows)
+            last_top = self._step_back(self._lines.end_index(), screen_rows)
+            if top >= last_top and self._spill is not None and len(self._spill) > 0:
+                # Lines above the window are considered printed, which makes
+                # room for the lines read back from the spill file
+                self._advance_print_cursor(min(top, self._lines.end_index()))
+                self._refill_from_spill()
+                last_top = self._step_back(self._lines.end_index(), screen_rows)
+            if top >= last_top:
+                # Held lines can be browsed as well; the live view is
+                # restored only when there is nothing more below
+                top = None if self._print_cursor == self._lines.end_index() else last_top
+        elif direction == self.SCROLL_TOP:
+            top = self._lines.first_index()
+        elif direction == self.SCROLL_BOTTOM:
+            top = None
+
+        if top is None:
+            if self._scroll_top is not None:
+                # Back to the live view: redraw the most recently printed lines
+                self._redraw_live_view()
+        else:
+            self._scroll_top = max(min(top, self._lines.end_index() - 1), self._lines.first_index())
+            self._scroll_req_update = True
+        self._status_line_req_update = True
 
-    def feed(self, amount):
-        for _ in range(0, amount):
-            if len(self._held_lines) == 0:
-                break
-            data = self._held_lines.popleft()
-            self._print_line(data)
+    def _jump_to_line(self, index):
+        screen_rows = self._terminal.get_dimensions()[0] - 1
+        self._scroll_top = self._step_back(index, screen_rows // 3)
+        self._scroll_req_update = True
+        self._status_line_req_update = True
+
+    def search(self, pattern):
+        self._search.start(pattern)
+        if self._scroll_top is not None:
+            self._search_position = self._scroll_top + 1
+        else:
+            self._search_position = self._lines.end_index()
+        self._search_jump_pending = True
+        self._update_search()
+
+    def search_next(self, older):
+        if self._search.get_active() is None:
+            return
+        if self._search_position is None:
+            self._search_position = self._lines.end_index()
+
+        match = self._search.find(self._search_position, older)
+        if match is not None:
+            self._search_position = match
+            self._search_jump_pending = None
+            self._jump_to_line(match)
+        elif not self._search.is_complete():
+            self._search_jump_pending = older
+
+    def _update_search(self):
+        if self._search.is_complete():
+            return
+
+        self._search.step()
+        self._status_line_req_update = True
+        if self._search_jump_pending is not None:
+            match = self._search.find(self._search_position, self._search_jump_pending)
+            if match is not None:
+                self._search_position = match
+                self._search_jump_pending = None
+                self._jump_to_line(match)
+
+    def _render_history_window(self, end=None, align_bottom=False):
+        screen_rows = self._terminal.get_dimensions()[0] - 1
+        self._scroll_top = max(self._scroll_top, self._lines.first_index())
+        if end is None:
+            end = self._lines.end_index()
+
+        window = []
+        index = self._filter.next_visible(self._scroll_top, end)
+        while len(window) < screen_rows and index is not None:
+            window.extend(self._get_rendered_rows(index))
+            index = self._filter.next_visible(index + 1, end)
+
+        if align_bottom:
+            window = [""] * (screen_rows - len(window)) + window[-screen_rows:]
+
+        # Rows longer than the terminal are cut instead of wrapped, so that
+        # the layout of the window is predictable
+        self._terminal.write("\x1b[?7l")
+        for row_ix in range(0, screen_rows):
+            self._terminal.set_cursor_position(1, row_ix + 1)
+            if row_ix < len(window) and window[row_ix] != "":
+                self._terminal.write(window[row_ix])
+            else:
+                self._terminal.write("\x1b[0m\x1b[K")
+        self._terminal.write("\x1b[?7h")
+        self._status_cursor_misplaced = True
+        self._scroll_req_update = False
+
+    def get_frame_timeout(self):
+        # Time to wait before the next frame is due, or None if there is
+        # nothing to render
+        has_pending_lines = not self._pause and self._scroll_top is None and self._held_lines_count() > 0
+        if not has_pending_lines and not self._status_line_req_update and \
+                not self._scroll_req_update and self._search.is_complete() and self._filter.is_complete():
+            return None
+        return max(self._last_frame_time + self._frame_interval - monotonic(), 0)
+
+    def render_frame(self, force=False):
+        now = monotonic()
+        if not force and now - self._last_frame_time < self._frame_interval:
+            return False
+        self._last_frame_time = now
+
+        self._update_scroll_region()
+        if self._spill is not None and len(self._spill) > 0:
+            self._refill_from_spill()
+        self._update_filter()
+        self._update_search()
+        if self._scroll_top is not None:
+            if self._scroll_req_update:
+                self._render_history_window()
+        else:
+            self.write_pending_lines()
+        self.render_status_line()
+        self._terminal.flush()
+        return True
 
     def _get_endpoint_style(self, state, is_default):
         colors = self._config.colors
@@ -149,23 +588,16 @@ class ConsoleOutput:
             result = (colors.default_endpoint_bg, colors.default_endpoint_fg)
         return ansi_format1(result)
 
-    def _write_register(self, width, prefix, reg, prefix_format=None, reg_format=None):
+    def _register_segment(self, width, prefix, reg, prefix_format, reg_format):
         if width >= 2:
-            if prefix_format is not None:
-                self._terminal.set_format(prefix_format)
-            self._terminal.write(prefix)
-
-            if reg_format is not None:
-                self._terminal.set_format(reg_format)
-            self._terminal.write(reg)
+            result = "\x1b[0;%sm%s\x1b[0;%sm%s" % (prefix_format, prefix, reg_format, reg)
             if width == 3:
-                self._terminal.write(" ")  # Extra space for readability
+                result += " "  # Extra space for readability
+            return result
         else:
-            if reg_format is not None:
-                self._terminal.set_format(reg_format)
-            self._terminal.write(reg)
+            return "\x1b[0;%sm%s" % (reg_format, reg)
 
-    def render_status_line(self):
+    def _build_status_line(self):
         colors = self._config.colors
 
         status_line_style = ansi_format(colors.status_line_bg, colors.status_line_fg)
@@ -176,70 +608,129 @@ class ConsoleOutput:
             Configuration.SHOW_ALL: ansi_format(colors.show_all_endpoint_bg, colors.show_all_endpoint_fg)
         }
 
-        if self._status_line_req_update:
-            self._terminal.reset_current_line(status_line_style)
-
-            if self._interact.is_predicate_mode():
-                tokens = self._interact.get_user_input_string()
-                self._terminal.write(text_window(tokens, 9))
-                cursor_column = min(9, len(tokens) + 1)
+        def styled(style, content):
+            return "\x1b[0;%sm%s" % (style, content)
 
-                reg_width = 3
+        # Every segment sets its own style, so that the status line can be
+        # redrawn starting from any segment
+        segments = []
 
-                self._terminal.write(" | ")
-                if self._pause:
-                    self._terminal.set_format(buffer_bar_style)
-                    self._terminal.write(create_progress_bar(len(self._held_lines), self._max_held_lines, 4))
-                else:
-                    self._terminal.write(">>> ")
-                self._terminal.set_format(status_line_style)
-                if self._config.filtered_mode:
-                    self._terminal.write("F ")
-
-                if reg_width == 1:
-                    self._terminal.write("&")
+        if self._interact.is_predicate_mode():
+            tokens = self._interact.get_user_input_string()
+            segments.append(styled(status_line_style, text_window(tokens, 9)))
+            cursor_column = min(9, len(tokens) + 1)
 
-                default_endpoint = self._interact.get_default_endpoint()
+            reg_width = 3
 
-                for register, (name, state) in self._endpoints.items():
-                    self._write_register(reg_width, "&", register,
-                                         prefix_format=FILTERING_FORMATS[self._config.get_endpoint_show_mode(register)],
-                                         reg_format=self._get_endpoint_style(state, default_endpoint == register))
+            segments.append(styled(status_line_style, " | "))
+            if self._pause:
+                segments.append(styled(buffer_bar_style,
+                                       create_progress_bar(self._held_lines_fill(), 1.0, 4)))
+            else:
+                segments.append(styled(status_line_style, ">>> "))
+            if self._spill is not None and len(self._spill) > 0:
+                spilled = len(self._spill)
+                disk_share = spilled / (spilled + self._held_lines_count())
+                segments.append(styled(buffer_bar_style, " disk %d%% " % int(disk_share * 100)))
+            if self._scroll_top is not None:
+                lines_below = self._lines.end_index() - self._scroll_top
+                segments.append(styled(buffer_bar_style, " %s%d " % (SYM_ARROW_UP, lines_below)))
+            if self._config.filtered_mode:
+                segments.append(styled(status_line_style, "F "))
+
+            if reg_width == 1:
+                segments.append(styled(status_line_style, "&"))
+
+            default_endpoint = self._interact.get_default_endpoint()
+
+            for register, (name, state) in self._endpoints.items():
+                segments.append(self._register_segment(
+                    reg_width, "&", register,
+                    prefix_format=FILTERING_FORMATS[self._config.get_endpoint_show_mode(register)],
+                    reg_format=self._get_endpoint_style(state, default_endpoint == register)))
+
+            n_other_actions = len(self._other_actions)
+            if n_other_actions > 0:
+                segment = self._register_segment(reg_width, "&", "-", status_line_style, status_line_style)
+                if n_other_actions > 1:
+                    segment += "(%d)" % n_other_actions
+                segments.append(segment)
+            segments.append(styled(status_line_style, " | "))
+
+            if reg_width == 1:
+                segments.append(styled(status_line_style, "'"))
+
+            for register, filter_data in self._formatter.get_filters().items():
+                if self._config.watches[register].enabled:
+                    watch_style = ansi_format1(filter_data.get())
+                else:
+                    watch_style = status_line_style
 
-                self._terminal.set_format(status_line_style)
-                
-                n_other_actions = len(self._other_actions)
-                if n_other_actions > 0:
-                    self._write_register(reg_width, "&", "-")
-                    if n_other_actions > 1:
-                        self._terminal.write("(%d)" % n_other_actions)
-                self._terminal.write(' | ')
+                segments.append(self._register_segment(reg_width, "'", register, watch_style, watch_style))
 
-                if reg_width == 1:
-                    self._terminal.write("'")
+            search = self._search.get_active()
+            if search is not None:
+                search_info = " /%s " % search.pattern
+                if not self._search.is_complete():
+                    search_info += "%d%% " % int(self._search.progress() * 100)
+                if self._search_position is not None and self._search_jump_pending is None and \
+                        self._scroll_top is not None:
+                    search_info += "%d/" % self._search.position_of(self._search_position)
+                search_info += "%d " % self._search.match_count()
+                segments.append(styled(buffer_bar_style, search_info))
 
-                for register, filter_data in self._formatter.get_filters().items():
-                    if self._config.watches[register].enabled:
-                        self._terminal.set_format(ansi_format1(filter_data.get()))
-                    else:
-                        self._terminal.set_format(status_line_style)
+            if self._server_rates != "":
+                segments.append(styled(status_line_style, self._server_rates))
 
-                    self._write_register(reg_width, "'", register)
+            segments.append(styled(status_line_style, ""))
 
-                self._terminal.set_format(status_line_style)
-                self._terminal.set_cursor_position(cursor_column)
+        else:
+            status_line_string = self._interact.get_user_input_string()
+            segments.append(styled(status_line_style,
+                                   text_window(status_line_string, self._terminal.get_dimensions()[1] - 1)))
+            cursor_column = len(status_line_string) + 1
 
-            else:
-                status_line_string = self._interact.get_user_input_string()
+        return segments, cursor_column
 
-                self._terminal.write(text_window(status_line_string, self._terminal.get_dimensions()[1] - 1))
-                self._terminal.set_cursor_position(len(status_line_string) + 1)
-            self._terminal.set_cursor_style(TerminalRawMode.CURSOR_BLINKING_BAR)
-            self._terminal.flush()
+    def render_status_line(self):
+        rows = self._terminal.get_dimensions()[0]
 
+        if self._status_line_req_update:
+            segments, cursor_column = self._build_status_line()
+
+            first_changed = 0
+            while first_changed < min(len(segments), len(self._status_segments)) and \
+                    segments[first_changed] == self._status_segments[first_changed]:
+                first_changed += 1
+
+            if first_changed < len(segments) or len(segments) != len(self._status_segments):
+                column = 1
+                for segment in segments[:first_changed]:
+                    column += visible_length(segment)
+
+                self._terminal.set_cursor_position(column, rows)
+                for segment in segments[first_changed:]:
+                    self._terminal.write(segment)
+                # Clear the rest of the line using the style of the last segment
+                self._terminal.write("\x1b[K")
+                if len(self._status_segments) == 0:
+                    self._terminal.set_cursor_style(TerminalRawMode.CURSOR_BLINKING_BAR)
+                self._status_cursor_misplaced = True
+
+            self._status_segments = segments
             self._status_line_req_update = False
+            if cursor_column != self._status_cursor_column:
+                self._status_cursor_column = cursor_column
+                self._status_cursor_misplaced = True
+
+        if self._status_cursor_misplaced:
+            self._terminal.set_cursor_position(self._status_cursor_column, rows)
+            self._status_cursor_misplaced = False
 
     def notify_status_line_changed(self):
         self._status_line_req_update = True
 
-
+    def notify_terminal_resized(self):
+        self._scroll_region_rows = None
+        self._status_line_req_update = True
+        self._scroll_req_update = self._scroll_top is not None
@@ -0,0 +1,97 @@
+from view.configuration import Configuration
+from view.console_output import format_record, make_marker_record, make_message_record
+from view.formatter import Formatter
+from view.latency import LatencyTracker
+from time import monotonic_ns
+from utils import ANSI_SEQUENCE_REGEX
+
+
+class HeadlessOutput:
+    # Writes the lines shown by the view to a file, without the status line
+    # and without interaction. Rows are collected and written in large blocks,
+    # or once the oldest of them has waited long enough.
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, config: Configuration, formatter: Formatter, output, plain=False):
+        self._config = config
+        self._formatter = formatter
+        self._output = output
+        self._plain = plain
+        self._rows = []
+        self._buffered_size = 0
+        self._first_row_ns = None
+        self._traces = []
+        self._latency = LatencyTracker()
+
+    def _matched_watch(self, text, watch_matches):
+        evaluated, matched = watch_matches if watch_matches is not None else ((), ())
+        for register, watch in self._config.watches.items():
+            if not watch.enabled:
+                continue
+            if watch.regex in evaluated:
+                if watch.regex in matched:
+                    return register
+            elif watch.search(text):
+                return register
+        return None
+
+    def _write_record(self, data, matched_register=None):
+        if 'trace' in data:
+            self._traces.append(data['trace'])
+        rows = []
+        format_record(self._config, self._formatter, data, rows, matched_register)
+        if self._first_row_ns is None and len(rows) > 0:
+            self._first_row_ns = monotonic_ns()
+        for row in rows:
+            if self._plain:
+                row = ANSI_SEQUENCE_REGEX.sub("", row)
+            else:
+                row += "\x1b[0m"
+            self._rows.append(row)
+            self._buffered_size += len(row) + 1
+
+        if self._buffered_size >= self.BUFFER_SIZE:
+            self.flush()
+
+    def print_line(self, data, watch_matches=None):
+        matched_register = self._matched_watch(data['data'], watch_matches)
+        show_mode = self._config.get_endpoint_show_mode(data['endpoint'])
+        if show_mode == Configuration.SHOW_ALL or \
+                (show_mode == Configuration.SHOW_FILTERED and matched_register is not None):
+            self._write_record(data, matched_register)
+
+    def print_marker(self, data):
+        self.print_line(make_marker_record(data))
+
+    def print_message(self, msg, fd="info"):
+        self.print_line(make_message_record(msg, fd))
+
+    def notify_active_actions(self, endpoints, other_actions):
+        pass
+
+    def notify_server_rates(self, rates):
+        pass
+
+    def get_latency_tracker(self):
+        return self._latency
+
+    def flush_if_older(self, max_age):
+        # Flushes the rows if the oldest of them was buffered at least
+        # max_age seconds ago
+        if self._first_row_ns is not None and monotonic_ns() - self._first_row_ns >= max_age * 1e9:
+            self.flush()
+
+    def flush(self):
+        if len(self._rows) == 0:
+            return
+        self._rows.append("")
+        self._output.write("\n".join(self._rows).encode('utf-8'))
+        self._output.flush()
+        self._rows = []
+        self._buffered_size = 0
+        self._first_row_ns = None
+
+        now_ns = monotonic_ns()
+        for stamps in self._traces:
+            self._latency.add_trace(stamps + [now_ns])
+        self._traces = []
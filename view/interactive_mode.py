@@ -1,11 +1,12 @@
 from view.configuration import Configuration
 from view.formatter import ansi_format, get_default_register_format
-from utils import TerminalRawMode
+from utils import TerminalRawMode, PastedText
 
 SYM_ARROW_UP="\u2191"
 SYM_ARROW_DOWN="\u2193"
 SYM_ARROW_UP_DOWN="\u2195"
 SYM_PREDICATE_MODE_PROMPT="\u21e8"
+SYM_NEWLINE="\u23ce"
 
 class MultiModeSubprompt:
     def __init__(self, subprompt, current_value, fmt=None, value_on_empty=""):
@@ -21,6 +22,15 @@ class InteractiveModeContext:
     MULTI_INPUT_MODE = 3
     MESSAGE_MODE = 4
 
+    SCROLL_PAGE_UP = 0
+    SCROLL_PAGE_DOWN = 1
+    SCROLL_TOP = 2
+    SCROLL_BOTTOM = 3
+
+    PROFILE_START = "start"
+    PROFILE_STOP = "stop"
+    PROFILE_SNAPSHOT = "snapshot"
+
     AVAILABLE_REGISTERS = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
 
     def __init__(self, config: Configuration):
@@ -32,6 +42,11 @@ class InteractiveModeContext:
         self._quit_cb = None
         self._set_watch_cb = None
         self._set_watch_enable_cb = None
+        self._scroll_cb = None
+        self._search_cb = None
+        self._search_next_cb = None
+        self._profile_cb = None
+        self._show_latency_cb = None
         self._input_mode = self.PREDICATE_MODE
         self._text_input_buffer = ""
         self._prompt = ""
@@ -44,10 +59,21 @@ class InteractiveModeContext:
         self._syntax_tree = {
             "a": {"p": "eval"},  # ap - analysis pause
             "F": "eval",         # F - toggle filtered mode
+            "g": {"g": "eval"},  # gg - go to the oldest line in history
+            "G": "eval",         # G - go back to the live view
+            "/": "eval",         # / - search the history
+            "n": "eval",         # n - go to the previous (older) search match
+            "N": "eval",         # N - go to the next (newer) search match
             "i": "eval",         # i - send data to stdin in to active endpoint
+            "L": "eval",         # L - show the latency of the traced records
             "I": "eval",
             "m": "eval",
             "p": "eval",         # p  - pause
+            "P": {
+                "s": "eval",     # Ps - start profiling lwview
+                "x": "eval",     # Px - stop profiling and report
+                "p": "eval"      # Pp - report the profile collected so far
+            },
             "q": "eval",         # q - quit
             "r": "eval",         # r - resume
             "w": "eval",         # w - set watch in first free register
@@ -55,7 +81,9 @@ class InteractiveModeContext:
             "\"": {
                 "?": "eval"
             },                   # "... - operation on command register
-            "&": {}              # &... - operation on endpoint register
+            "&": {},             # &... - operation on endpoint register
+            TerminalRawMode.KEY_PAGE_UP: "eval",
+            TerminalRawMode.KEY_PAGE_DOWN: "eval"
         }
 
         for k in "0123456789":
@@ -111,6 +139,8 @@ class InteractiveModeContext:
                 result += "<"
             elif ch == "\x02":
                 result += ">"
+            elif ch == "\n":
+                result += SYM_NEWLINE
             else:
                 result += ch
         return result
@@ -174,6 +204,21 @@ class InteractiveModeContext:
     def on_set_marker(self, callback: callable):
         self._set_marker_cb = callback
 
+    def on_scroll(self, callback: callable):
+        self._scroll_cb = callback
+
+    def on_search(self, callback: callable):
+        self._search_cb = callback
+
+    def on_search_next(self, callback: callable):
+        self._search_next_cb = callback
+
+    def on_profile(self, callback: callable):
+        self._profile_cb = callback
+
+    def on_show_latency(self, callback: callable):
+        self._show_latency_cb = callback
+
     def _reset_command_buffer(self):
         self._command_buffer = ""
         self._text_input_buffer = ""
@@ -269,6 +314,17 @@ class InteractiveModeContext:
             self._reset_command_buffer()
             self._enter_predicate_mode()
 
+    def _handle_search(self):
+        if len(self._text_input_buffer) == 0:
+            self._enter_text_input(self._command_buffer, "/")
+        else:
+            try:
+                self._search_cb(self._text_input_buffer)
+                self._reset_command_buffer()
+                self._enter_predicate_mode()
+            except Exception as ex:
+                self._enter_message_mode("Error: %s" % ex)
+
     def _print_command_registers(self):
         for reg, command in self._config.commands.items():
             self._print("info", "\"%c: %s" % (reg, command))
@@ -320,6 +376,28 @@ class InteractiveModeContext:
             self._quit_cb()
         elif self._command_matches(command, "m"):
             self._set_marker_cb()
+        elif command == TerminalRawMode.KEY_PAGE_UP:
+            self._scroll_cb(self.SCROLL_PAGE_UP)
+        elif command == TerminalRawMode.KEY_PAGE_DOWN:
+            self._scroll_cb(self.SCROLL_PAGE_DOWN)
+        elif command == "gg":
+            self._scroll_cb(self.SCROLL_TOP)
+        elif command == "G":
+            self._scroll_cb(self.SCROLL_BOTTOM)
+        elif command == "/":
+            self._handle_search()
+        elif command == "L":
+            self._show_latency_cb()
+        elif command == "Ps":
+            self._profile_cb(self.PROFILE_START)
+        elif command == "Px":
+            self._profile_cb(self.PROFILE_STOP)
+        elif command == "Pp":
+            self._profile_cb(self.PROFILE_SNAPSHOT)
+        elif command == "n":
+            self._search_next_cb(True)
+        elif command == "N":
+            self._search_next_cb(False)
         elif command == "w":
             register = self._find_first_available_watch()
             self._handle_set_watch(register)
@@ -474,17 +552,29 @@ class InteractiveModeContext:
         self._reset_command_buffer()
         self._read_key_predicate_input(key)
 
-    def read_key(self, term: TerminalRawMode):
-        key = term.read_key()
-        if key != "":
-            if self._input_mode == self.PREDICATE_MODE:
-                self._read_key_predicate_input(key)
-            elif self._input_mode == self.TEXT_INPUT_MODE:
-                self._read_key_text_input(key)
-            elif self._input_mode == self.MULTI_INPUT_MODE:
-                self._read_key_multi_input(key)
-            elif self._input_mode == self.MESSAGE_MODE:
-                self._read_key_message(key)
+    def _on_paste(self, content):
+        if self._input_mode in [self.TEXT_INPUT_MODE, self.MULTI_INPUT_MODE]:
+            self._on_input(content)
 
-            self._command_buffer_changed_cb(self._command_buffer)
+    def _handle_key(self, key):
+        if isinstance(key, PastedText):
+            self._on_paste(key)
+        elif self._input_mode == self.PREDICATE_MODE:
+            self._read_key_predicate_input(key)
+        elif self._input_mode == self.TEXT_INPUT_MODE:
+            self._read_key_text_input(key)
+        elif self._input_mode == self.MULTI_INPUT_MODE:
+            self._read_key_multi_input(key)
+        elif self._input_mode == self.MESSAGE_MODE:
+            self._read_key_message(key)
+
+    def read_keys(self, term: TerminalRawMode):
+        keys = term.read_keys()
+        if len(keys) == 0:
+            return False
 
+        for key in keys:
+            self._handle_key(key)
+
+        self._command_buffer_changed_cb(self._command_buffer)
+        return True
@@ -0,0 +1,54 @@
+from tracing import LatencyHistogram, STAGES
+
+
+def _format_ns(value_ns):
+    if value_ns < 1000000:
+        return "%.0f us" % (value_ns / 1000)
+    if value_ns < 1000000000:
+        return "%.1f ms" % (value_ns / 1000000)
+    return "%.2f s" % (value_ns / 1000000000)
+
+
+class LatencyTracker:
+    # Intervals between the stages of the traced records; the socket write
+    # is measured by the server and reported in the keepalive records
+    INTERVALS = [
+        ("separator", "read", "emit"),
+        ("broadcast", "emit", "enqueue"),
+        ("transfer", "enqueue", "decode"),
+        ("view", "decode", "render"),
+        ("total", "read", "render")
+    ]
+
+    def __init__(self):
+        self._intervals = [(name, STAGES.index(start), STAGES.index(end)) for name, start, end in self.INTERVALS]
+        self._histograms = {name: LatencyHistogram() for name, _, _ in self.INTERVALS}
+        self._write_latency = LatencyHistogram()
+
+    def add_trace(self, stamps):
+        for name, start, end in self._intervals:
+            if end < len(stamps):
+                self._histograms[name].add(stamps[end] - stamps[start])
+
+    def add_write_latency(self, data):
+        self._write_latency.merge(LatencyHistogram.from_dict(data))
+
+    def to_dict(self):
+        result = {name: histogram.to_dict() for name, histogram in self._histograms.items()}
+        result['socket write'] = self._write_latency.to_dict()
+        return result
+
+    def get_count(self):
+        return self._histograms['total'].count
+
+    def get_report(self):
+        lines = ["%-12s %9s %9s %9s %9s" % ("Latency", "count", "p50", "p99", "max")]
+        histograms = [(name, self._histograms[name]) for name, _, _ in self.INTERVALS]
+        histograms.insert(2, ("socket write", self._write_latency))
+        for name, histogram in histograms:
+            lines.append("%-12s %9d %9s %9s %9s" % (
+                name, histogram.count,
+                _format_ns(histogram.percentile(0.5)),
+                _format_ns(histogram.percentile(0.99)),
+                _format_ns(histogram.max_ns)))
+        return lines
@@ -0,0 +1,250 @@
+from view.configuration import Configuration, Watch
+from view.line_store import LineStore
+import re
+
+
+class Bitset:
+    # Set of absolute line indices kept as bits of a bytearray. Bit 0 of
+    # the first byte stands for the line at index base, which is always
+    # a multiple of 8.
+    SCAN_CHUNK = 4096
+
+    _NONZERO_BYTE = re.compile(b'[^\x00]')
+
+    def __init__(self, base=0):
+        self._base = base
+        self._bits = bytearray()
+
+    @classmethod
+    def from_int(cls, value, base):
+        result = cls(base)
+        result._bits = bytearray(value.to_bytes((value.bit_length() + 7) // 8, 'little'))
+        return result
+
+    def to_int(self, base):
+        return int.from_bytes(self._bits, 'little') << (self._base - base)
+
+    def add(self, index):
+        pos = index - self._base
+        byte = pos >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte - len(self._bits) + 1))
+        self._bits[byte] |= 1 << (pos & 7)
+
+    def __contains__(self, index):
+        pos = index - self._base
+        byte = pos >> 3
+        if pos < 0 or byte >= len(self._bits):
+            return False
+        return (self._bits[byte] >> (pos & 7)) & 1 == 1
+
+    def count(self):
+        return self.to_int(self._base).bit_count()
+
+    def next_set(self, index):
+        # Smallest index in the set which is not lower than index
+        pos = max(index - self._base, 0)
+        byte = pos >> 3
+        if byte >= len(self._bits):
+            return None
+
+        bits = self._bits[byte] >> (pos & 7) << (pos & 7)
+        if bits == 0:
+            found = self._NONZERO_BYTE.search(self._bits, byte + 1)
+            if found is None:
+                return None
+            byte = found.start()
+            bits = self._bits[byte]
+        return self._base + byte * 8 + (bits & -bits).bit_length() - 1
+
+    def prev_set(self, index):
+        # Largest index in the set which is lower than index
+        pos = min(index - self._base, len(self._bits) * 8)
+        if pos <= 0:
+            return None
+
+        byte = (pos - 1) >> 3
+        bits = self._bits[byte] & ((1 << ((pos - 1) & 7) + 1) - 1)
+        while bits == 0:
+            if byte == 0:
+                return None
+            # Searching backwards in chunks, so that a distant line does not
+            # cost more than a linear scan done in C
+            start = max(byte - self.SCAN_CHUNK, 0)
+            chunk = self._bits[start:byte].rstrip(b'\x00')
+            if len(chunk) > 0:
+                byte = start + len(chunk) - 1
+                bits = chunk[-1]
+            else:
+                byte = start
+                if start == 0:
+                    return None
+        return self._base + byte * 8 + bits.bit_length() - 1
+
+    def discard_before(self, base):
+        removed = (base - self._base) >> 3
+        if removed > 0:
+            del self._bits[:removed]
+            self._base += removed * 8
+
+
+class WatchIndex:
+    # Lines matching the regex of a watch. Lines received before the watch
+    # was defined are scanned in the background, starting from the newest.
+    def __init__(self, watch: Watch, base, start):
+        self.watch = watch
+        self.regex = watch.regex
+        self.lines = Bitset(base)
+        self.low = start
+
+
+class LineFilter:
+    # Bitmaps of the lines belonging to each endpoint and matching each
+    # watch. The set of visible lines is derived from them with bitwise
+    # operations, so changing the show modes or toggling the watches does
+    # not require evaluating the regexes again.
+    LINES_PER_STEP = 4000
+
+    def __init__(self, lines: LineStore, config: Configuration):
+        self._lines = lines
+        self._config = config
+        self._base = 0
+        self._endpoints = {}
+        self._watches = {}
+        self._visible = Bitset()
+        self._state = None
+        self.update()
+
+    def _get_state(self):
+        return (tuple(sorted(self._config.show_endpoints.items())),
+                self._config.default_endpoint_show,
+                tuple((r, id(w), w.regex, w.enabled) for r, w in self._config.watches.items()))
+
+    def matched_watch(self, index):
+        for register, watch in self._config.watches.items():
+            watch_index = self._watches.get(register)
+            if watch.enabled and watch_index is not None and index in watch_index.lines:
+                return register
+        return None
+
+    def _is_visible(self, index, endpoint):
+        show_mode = self._config.get_endpoint_show_mode(endpoint)
+        return show_mode == Configuration.SHOW_ALL or \
+            (show_mode == Configuration.SHOW_FILTERED and self.matched_watch(index) is not None)
+
+    def add_line(self, index, watch_matches=None):
+        # watch_matches are the patterns evaluated beforehand and the ones
+        # which matched; other watches are evaluated here
+        endpoint = self._lines.get_endpoint(index)
+        endpoint_lines = self._endpoints.get(endpoint)
+        if endpoint_lines is None:
+            endpoint_lines = Bitset(self._base)
+            self._endpoints[endpoint] = endpoint_lines
+        endpoint_lines.add(index)
+
+        text = self._lines.get_text(index)
+        evaluated, matched = watch_matches if watch_matches is not None else ((), ())
+        for watch_index in self._watches.values():
+            if watch_index.regex in evaluated:
+                if watch_index.regex in matched:
+                    watch_index.lines.add(index)
+            elif watch_index.watch.search(text):
+                watch_index.lines.add(index)
+
+        if self._is_visible(index, endpoint):
+            self._visible.add(index)
+
+    def _sync_watches(self):
+        end = self._lines.end_index()
+        for register, watch in self._config.watches.items():
+            watch_index = self._watches.get(register)
+            if watch_index is None or watch_index.watch is not watch or watch_index.regex != watch.regex:
+                self._watches[register] = WatchIndex(watch, self._base, end)
+
+        for register in list(self._watches.keys()):
+            if register not in self._config.watches:
+                del self._watches[register]
+
+    def _update_visible(self):
+        shown = 0
+        filtered = 0
+        for endpoint, endpoint_lines in self._endpoints.items():
+            show_mode = self._config.get_endpoint_show_mode(endpoint)
+            if show_mode == Configuration.SHOW_ALL:
+                shown |= endpoint_lines.to_int(self._base)
+            elif show_mode == Configuration.SHOW_FILTERED:
+                filtered |= endpoint_lines.to_int(self._base)
+
+        if filtered != 0:
+            matched = 0
+            for register, watch_index in self._watches.items():
+                if self._config.watches[register].enabled:
+                    matched |= watch_index.lines.to_int(self._base)
+            shown |= filtered & matched
+
+        self._visible = Bitset.from_int(shown, self._base)
+
+    def update(self):
+        # Returns True if the set of visible lines has changed
+        state = self._get_state()
+        if state == self._state:
+            return False
+
+        self._state = state
+        self._sync_watches()
+        self._update_visible()
+        return True
+
+    def is_complete(self):
+        first = self._lines.first_index()
+        return all(watch_index.low <= first for watch_index in self._watches.values())
+
+    def step(self, budget=None):
+        # Scans the older lines for the recently defined watches. Returns
+        # True if the set of visible lines has been updated as a result.
+        if budget is None:
+            budget = self.LINES_PER_STEP
+
+        first = self._lines.first_index()
+        scanned = False
+        for watch_index in self._watches.values():
+            if budget <= 0 or watch_index.low <= first:
+                continue
+
+            low = max(first, watch_index.low - budget)
+            search = watch_index.watch.search
+            get_text = self._lines.get_text
+            for index in range(low, watch_index.low):
+                if search(get_text(index)):
+                    watch_index.lines.add(index)
+            budget -= watch_index.low - low
+            watch_index.low = low
+            scanned = True
+
+        if scanned and self.is_complete():
+            self._update_visible()
+            return True
+        return False
+
+    def is_visible(self, index):
+        return index in self._visible
+
+    def next_visible(self, index, end):
+        index = self._visible.next_set(index)
+        return index if index is not None and index < end else None
+
+    def prev_visible(self, index, first):
+        index = self._visible.prev_set(index)
+        return index if index is not None and index >= first else None
+
+    def discard_before(self, index):
+        base = index & ~7
+        if base <= self._base:
+            return
+
+        self._base = base
+        for bitset in self._endpoints.values():
+            bitset.discard_before(base)
+        for watch_index in self._watches.values():
+            watch_index.lines.discard_before(base)
+        self._visible.discard_before(base)
@@ -0,0 +1,237 @@
+from array import array
+from datetime import date
+
+
+class InternTable:
+    # Maps small sets of repeating strings (endpoints, fds, watch registers)
+    # to one-byte codes. Code 0 is reserved for a missing value.
+    MAX_CODES = 255
+
+    def __init__(self):
+        self._values = [None]
+        self._codes = {None: 0}
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            if len(self._values) > self.MAX_CODES:
+                raise RuntimeError("Too many distinct values to intern: %s" % value)
+            code = len(self._values)
+            self._values.append(value)
+            self._codes[value] = code
+        return code
+
+    def decode(self, code):
+        return self._values[code]
+
+
+class TimestampCodec:
+    # Timestamps are kept as integers: proleptic Gregorian day number times
+    # 86400 plus the second of the day. Conversions are cached per date.
+    NO_TIME = -1
+
+    def __init__(self):
+        self._days_by_date = {}
+        self._dates_by_day = {}
+
+    def encode(self, date_s, time_s):
+        if date_s is None or time_s is None:
+            return self.NO_TIME
+
+        day = self._days_by_date.get(date_s)
+        if day is None:
+            try:
+                day = date.fromisoformat(date_s).toordinal()
+            except ValueError:
+                return self.NO_TIME
+            self._days_by_date[date_s] = day
+            self._dates_by_day[day] = date_s
+
+        try:
+            hours, minutes, seconds = time_s.split(':')
+            return day * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+        except ValueError:
+            return self.NO_TIME
+
+    def decode(self, timestamp):
+        day, second = divmod(timestamp, 86400)
+        date_s = self._dates_by_day.get(day)
+        if date_s is None:
+            date_s = date.fromordinal(day).isoformat()
+            self._dates_by_day[day] = date_s
+        minutes, seconds = divmod(second, 60)
+        hours, minutes = divmod(minutes, 60)
+        return date_s, "%02d:%02d:%02d" % (hours, minutes, seconds)
+
+
+class LineStore:
+    # Columnar storage of records received by the viewer. Lines are
+    # addressed with absolute indices which do not change when the oldest
+    # lines are removed.
+    SEQ_DASH = -1
+    SEQ_NONE = -2
+
+    CHUNK_SIZE = 65536
+
+    # Approximate cost of a single line apart from its text: seq and
+    # timestamp (8 bytes each), four interned codes, location in the arena
+    LINE_OVERHEAD = 8 + 8 + 4 + 4 + 4 + 4
+
+    def __init__(self):
+        self._seq = array('q')
+        self._timestamps = array('q')
+        self._endpoints = array('B')
+        self._fds = array('B')
+        self._sources = array('B')
+        self._watches = array('B')
+        self._chunk_ids = array('L')
+        self._offsets = array('L')
+        self._lengths = array('L')
+
+        self._endpoint_table = InternTable()
+        self._fd_table = InternTable()
+        self._source_table = InternTable()
+        self._watch_table = InternTable()
+        self._timestamp_codec = TimestampCodec()
+
+        # Sealed chunks hold the text of many lines concatenated; the text
+        # of the most recent lines is collected in the open chunk
+        self._chunks = []
+        self._chunk_base = 0
+        self._open_chunk = []
+        self._open_chunk_size = 0
+        self._open_chunk_first_line = 0
+
+        self._base = 0   # Absolute index of the first element of the arrays
+        self._head = 0   # Absolute index of the first line in the store
+        self._size_bytes = 0
+
+    def __len__(self):
+        return self._base + len(self._seq) - self._head
+
+    def first_index(self):
+        return self._head
+
+    def end_index(self):
+        return self._base + len(self._seq)
+
+    def size_bytes(self):
+        return self._size_bytes
+
+    def _seal_open_chunk(self):
+        self._chunks.append("".join(self._open_chunk))
+        self._open_chunk = []
+        self._open_chunk_size = 0
+        self._open_chunk_first_line = self.end_index()
+
+    def append(self, record):
+        text = record.get('data', "")
+        if self._open_chunk_size + len(text) > self.CHUNK_SIZE and len(self._open_chunk) > 0:
+            self._seal_open_chunk()
+
+        seq = record.get('seq')
+        if not isinstance(seq, int):
+            seq = self.SEQ_DASH if seq == '-' else self.SEQ_NONE
+
+        self._seq.append(seq)
+        self._timestamps.append(self._timestamp_codec.encode(record.get('date'), record.get('time')))
+        self._endpoints.append(self._endpoint_table.encode(record.get('endpoint')))
+        self._fds.append(self._fd_table.encode(record.get('fd')))
+        self._sources.append(self._source_table.encode(record.get('source')))
+        self._watches.append(self._watch_table.encode(record.get('watch') or None))
+        self._chunk_ids.append(self._chunk_base + len(self._chunks))
+        self._offsets.append(self._open_chunk_size)
+        self._lengths.append(len(text))
+
+        self._open_chunk.append(text)
+        self._open_chunk_size += len(text)
+        self._size_bytes += self.LINE_OVERHEAD + len(text)
+        return self.end_index() - 1
+
+    def line_size(self, index):
+        return self.LINE_OVERHEAD + self._lengths[index - self._base]
+
+    def get_text(self, index):
+        pos = index - self._base
+        if index >= self._open_chunk_first_line:
+            return self._open_chunk[index - self._open_chunk_first_line]
+        offset = self._offsets[pos]
+        chunk = self._chunks[self._chunk_ids[pos] - self._chunk_base]
+        return chunk[offset:offset + self._lengths[pos]]
+
+    def get_endpoint(self, index):
+        return self._endpoint_table.decode(self._endpoints[index - self._base])
+
+    def get_watch(self, index):
+        return self._watch_table.decode(self._watches[index - self._base])
+
+    def set_watch(self, index, register):
+        self._watches[index - self._base] = self._watch_table.encode(register)
+
+    def get(self, index):
+        if index < self._head or index >= self.end_index():
+            raise IndexError("Line %d is not in the store" % index)
+
+        pos = index - self._base
+        fd = self._fd_table.decode(self._fds[pos])
+        record = {
+            "data": self.get_text(index),
+            "endpoint": self._endpoint_table.decode(self._endpoints[pos]),
+            "fd": fd
+        }
+
+        seq = self._seq[pos]
+        if seq >= 0:
+            record['seq'] = seq
+        elif seq == self.SEQ_DASH:
+            record['seq'] = '-'
+
+        timestamp = self._timestamps[pos]
+        if timestamp != TimestampCodec.NO_TIME:
+            record['date'], record['time'] = self._timestamp_codec.decode(timestamp)
+
+        source = self._source_table.decode(self._sources[pos])
+        if source is not None:
+            record['source'] = source
+
+        watch = self._watch_table.decode(self._watches[pos])
+        if watch is not None:
+            record['watch'] = watch
+
+        if fd == 'marker':
+            record['name'] = record['data']
+        return record
+
+    def _compact(self):
+        removed = self._head - self._base
+        for column in [self._seq, self._timestamps, self._endpoints, self._fds,
+                       self._sources, self._watches, self._offsets, self._lengths]:
+            del column[:removed]
+
+        if len(self._chunk_ids) > removed:
+            first_chunk = self._chunk_ids[removed]
+        else:
+            first_chunk = self._chunk_base + len(self._chunks)
+        del self._chunk_ids[:removed]
+        del self._chunks[:first_chunk - self._chunk_base]
+        self._chunk_base = first_chunk
+        self._base = self._head
+
+    def discard_before(self, index):
+        index = min(index, self.end_index())
+        while self._head < index:
+            self._size_bytes -= self.LINE_OVERHEAD + self._lengths[self._head - self._base]
+            self._head += 1
+
+        # Compacting the arrays is postponed until a considerable part of
+        # them is unused, so that removing lines is amortized O(1)
+        if self._head - self._base > max(1024, len(self._seq) // 2):
+            self._compact()
+
+    def popleft(self):
+        record = self.get(self._head)
+        self.discard_before(self._head + 1)
+        return record
+
+    def clear(self):
+        self.discard_before(self.end_index())
@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import json
+import os
+import re
+from time import monotonic_ns
+
+
+_compiled_patterns = {}
+
+
+def decode_frames(frames, patterns):
+    # Runs in a worker process. Returns, for every frame, the decoded
+    # record and the watch patterns it matches, or None and an error.
+    regexes = []
+    for pattern in patterns:
+        regex = _compiled_patterns.get(pattern)
+        if regex is None:
+            regex = re.compile(pattern)
+            _compiled_patterns[pattern] = regex
+        regexes.append((pattern, regex))
+
+    results = []
+    for frame in frames:
+        try:
+            record = json.loads(frame)
+        except ValueError as err:
+            results.append((None, "Failed to parse JSON: %s: %s" % (err, frame)))
+            continue
+        if 'trace' in record:
+            record['trace'].append(monotonic_ns())
+
+        matched = []
+        if record.get('type') == 'data':
+            text = record.get('data', "")
+            for pattern, regex in regexes:
+                if regex.search(text) is not None:
+                    matched.append(pattern)
+        results.append((record, matched))
+    return results
+
+
+class DecodePipeline:
+    # Decodes the received frames and evaluates the watches in a pool of
+    # worker processes. Results are handed back in the order the batches
+    # were submitted; the number of batches in flight is limited, so that
+    # the server is not read faster than the workers keep up.
+    def __init__(self, workers, max_in_flight=None):
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._in_flight = deque()
+        self._max_in_flight = max_in_flight if max_in_flight is not None else 2 * workers
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def fileno(self):
+        return self._wake_r
+
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def is_full(self):
+        return len(self._in_flight) >= self._max_in_flight
+
+    def _on_batch_done(self, future):
+        # Called from a thread of the executor; wakes up the main loop
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass
+
+    def submit(self, frames, patterns):
+        future = self._executor.submit(decode_frames, frames, patterns)
+        self._in_flight.append((future, frozenset(patterns)))
+        future.add_done_callback(self._on_batch_done)
+
+    def collect(self):
+        # Returns the finished batches as (results, evaluated patterns),
+        # stopping at the first batch which is not finished yet
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        batches = []
+        while len(self._in_flight) > 0 and self._in_flight[0][0].done():
+            future, patterns = self._in_flight.popleft()
+            batches.append((future.result(), patterns))
+        return batches
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
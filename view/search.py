@@ -0,0 +1,119 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import re
+from view.line_store import LineStore
+
+
+class SearchResults:
+    # Matches of one pattern within the range [low, high) of scanned lines.
+    # The range grows upwards as new lines arrive and downwards until it
+    # reaches the oldest line in the history.
+    def __init__(self, pattern, regex, start):
+        self.pattern = pattern
+        self.regex = regex
+        self.low = start
+        self.high = start
+        self.matches = array('q')
+
+    def discard_before(self, index):
+        # Lines trimmed past everything scanned leave nothing to scan again
+        self.high = max(self.high, index)
+        self.low = max(self.low, index)
+        count = bisect_left(self.matches, index)
+        if count > 0:
+            del self.matches[:count]
+
+
+class HistorySearch:
+    LINES_PER_STEP = 4000
+    CACHED_PATTERNS = 8
+
+    def __init__(self, lines: LineStore):
+        self._lines = lines
+        self._results = OrderedDict()
+        self._active = None
+
+    def start(self, pattern):
+        results = self._results.get(pattern)
+        if results is None:
+            results = SearchResults(pattern, re.compile(pattern), self._lines.end_index())
+            self._results[pattern] = results
+            if len(self._results) > self.CACHED_PATTERNS:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(pattern)
+        self._active = results
+
+    def stop(self):
+        self._active = None
+
+    def get_active(self):
+        return self._active
+
+    def _scan(self, results, first, end):
+        found = array('q')
+        search = results.regex.search
+        get_text = self._lines.get_text
+        for index in range(first, end):
+            if search(get_text(index)) is not None:
+                found.append(index)
+        return found
+
+    def step(self, budget=None):
+        # Scans at most budget lines; returns True if the search is complete
+        results = self._active
+        if results is None:
+            return True
+        if budget is None:
+            budget = self.LINES_PER_STEP
+
+        results.discard_before(self._lines.first_index())
+
+        # New lines first, then older lines, so that matches close to the
+        # bottom of the history are found before the distant ones
+        end = min(self._lines.end_index(), results.high + budget)
+        if end > results.high:
+            results.matches.extend(self._scan(results, results.high, end))
+            budget -= end - results.high
+            results.high = end
+
+        first = max(self._lines.first_index(), results.low - budget)
+        if first < results.low:
+            results.matches[0:0] = self._scan(results, first, results.low)
+            results.low = first
+
+        return self.is_complete()
+
+    def is_complete(self):
+        if self._active is None:
+            return True
+        return self._active.low <= self._lines.first_index() and \
+            self._active.high >= self._lines.end_index()
+
+    def progress(self):
+        total = self._lines.end_index() - self._lines.first_index()
+        if self._active is None or total == 0:
+            return 1.0
+        return (self._active.high - self._active.low) / total
+
+    def match_count(self):
+        return 0 if self._active is None else len(self._active.matches)
+
+    def find(self, index, older=True):
+        # Returns the nearest match before (older=True) or after the line
+        # at index, or None if there is no such match (yet)
+        if self._active is None:
+            return None
+        matches = self._active.matches
+        if older:
+            pos = bisect_left(matches, index)
+            return matches[pos - 1] if pos > 0 else None
+        else:
+            pos = bisect_right(matches, index)
+            return matches[pos] if pos < len(matches) else None
+
+    def position_of(self, index):
+        if self._active is None:
+            return 0
+        return bisect_left(self._active.matches, index) + 1
@@ -0,0 +1,127 @@
+from array import array
+from collections import deque
+import json
+import os
+import tempfile
+
+
+class SpillSegment:
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.offsets = array('q')
+        self.head = 0
+        self.written = 0
+        self.pending = []
+        self.pending_size = 0
+
+    def __len__(self):
+        return len(self.offsets) - self.head
+
+    def size(self):
+        return self.written + self.pending_size
+
+    def append(self, data):
+        self.offsets.append(self.size())
+        self.pending.append(data)
+        self.pending_size += len(data)
+
+    def flush(self):
+        if self.pending_size == 0:
+            return
+        data = b"".join(self.pending)
+        while len(data) > 0:
+            count = os.pwrite(self.file.fileno(), data, self.written)
+            self.written += count
+            data = data[count:]
+        self.pending = []
+        self.pending_size = 0
+
+    def read(self, count):
+        self.flush()
+        first = self.offsets[self.head]
+        end_ix = self.head + count
+        end = self.offsets[end_ix] if end_ix < len(self.offsets) else self.written
+
+        chunks = []
+        position = first
+        while position < end:
+            chunk = os.pread(self.file.fileno(), end - position, position)
+            if len(chunk) == 0:
+                raise IOError("Unexpected end of the spill file")
+            chunks.append(chunk)
+            position += len(chunk)
+        data = b"".join(chunks)
+
+        records = []
+        for ix in range(self.head, end_ix):
+            start = self.offsets[ix] - first
+            stop = (self.offsets[ix + 1] if ix + 1 < len(self.offsets) else self.written) - first
+            records.append(json.loads(data[start:stop]))
+        self.head = end_ix
+        return records
+
+    def close(self):
+        self.file.close()
+
+
+class SpillLog:
+    # FIFO of records stored in temporary files. Only the offsets of the
+    # records are kept in memory; the files are removed as soon as all the
+    # records stored in them are read back.
+    SEGMENT_SIZE = 64 * 1024 * 1024
+    WRITE_SIZE = 256 * 1024
+    READ_BATCH = 1000
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._segments = deque()
+        self._count = 0
+        self._size_bytes = 0
+
+    def __len__(self):
+        return self._count
+
+    def size_bytes(self):
+        return self._size_bytes
+
+    def append(self, record):
+        data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        if len(self._segments) == 0 or self._segments[-1].size() >= self.SEGMENT_SIZE:
+            if len(self._segments) > 0:
+                self._segments[-1].flush()
+            self._segments.append(SpillSegment(self._directory))
+
+        segment = self._segments[-1]
+        segment.append(data)
+        if segment.pending_size >= self.WRITE_SIZE:
+            segment.flush()
+        self._count += 1
+        self._size_bytes += len(data)
+
+    def read(self, count=None):
+        # Returns up to count oldest records and removes them from the log
+        if count is None:
+            count = self.READ_BATCH
+
+        records = []
+        while len(records) < count and self._count > 0:
+            segment = self._segments[0]
+            size_before = segment.size() - segment.offsets[segment.head]
+            batch = segment.read(min(count - len(records), len(segment)))
+            records.extend(batch)
+            self._count -= len(batch)
+            if len(segment) == 0:
+                self._segments.popleft()
+                segment.close()
+                size_after = 0
+            else:
+                size_after = segment.size() - segment.offsets[segment.head]
+            self._size_bytes -= size_before - size_after
+        return records
+
+    def clear(self):
+        for segment in self._segments:
+            segment.close()
+        self._segments.clear()
+        self._count = 0
+        self._size_bytes = 0